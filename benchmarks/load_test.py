@@ -0,0 +1,340 @@
+"""
+Нагрузочный тест бота без сети.
+
+N виртуальных пользователей проходят сценарий /topics → период → категория
+через настоящий Dispatcher с router из bot.handlers. Bot API заменён локальной
+сессией (FakeBotSession), Telegram-каналы — FakeTelegramClient с синтетическими
+постами или записанный архив загрузки (--replay). Замеряется время от нажатия
+категории до получения отчёта (p50/p95/p99), пропускная способность и пиковая память.
+
+Запуск из корня проекта:
+    python -m benchmarks.load_test --users 50 --iterations 2
+    python -m benchmarks.load_test --users 50 --fake-models --max-p95 30 --json load.json
+
+С --max-p95 код возврата 1, если p95 выше порога или часть сценариев не завершилась, —
+так прогон можно использовать как проверку изменений пайплайна.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import re
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+from collections import Counter, deque
+from datetime import datetime, timezone
+
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import EditMessageText, SendDocument, SendMessage
+from aiogram.types import Chat, Document, Message, Update, User
+
+from shared.constants import CATEGORIES, CATEGORY_KEYWORDS, PERIODS
+
+BOT_USER = {"id": 42, "is_bot": True, "first_name": "load_test_bot", "username": "load_test_bot"}
+PART_PATTERN = re.compile(r"Часть (\d+) из (\d+)")
+FINAL_TEXT_MARKERS = ("Нет постов", "ошибка", "Ошибка")
+
+
+class FakeBotSession(BaseSession):
+    """
+    Сессия aiogram, отвечающая на методы Bot API локально.
+    Сообщает виртуальным пользователям о завершении сценария (отправлен отчёт или финальный текст).
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.message_ids = itertools.count(1000)
+        self.calls = Counter()
+        self.waiters = {}
+
+    def wait_for_report(self, chat_id: int) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self.waiters[chat_id] = future
+        return future
+
+    def _finish(self, chat_id: int, outcome: str):
+        future = self.waiters.pop(chat_id, None)
+        if future is not None and not future.done():
+            future.set_result(outcome)
+
+    def _message(self, bot: Bot, chat_id: int, text: str = None, caption: str = None,
+                 document: Document = None, message_id: int = None) -> Message:
+        return Message(
+            message_id=message_id or next(self.message_ids),
+            date=datetime.now(timezone.utc),
+            chat=Chat(id=chat_id, type="private"),
+            from_user=User(**BOT_USER),
+            text=text,
+            caption=caption,
+            document=document,
+        ).as_(bot)
+
+    async def make_request(self, bot: Bot, method, timeout=None):
+        self.calls[type(method).__name__] += 1
+        if isinstance(method, SendDocument):
+            n = next(self.message_ids)
+            document = Document(file_id=f"file_{n}", file_unique_id=f"unique_{n}")
+            part = PART_PATTERN.search(method.caption or "")
+            if part is None or part.group(1) == part.group(2):
+                self._finish(method.chat_id, "report")
+            return self._message(bot, method.chat_id, caption=method.caption, document=document, message_id=n)
+        if isinstance(method, (SendMessage, EditMessageText)):
+            if any(marker in (method.text or "") for marker in FINAL_TEXT_MARKERS):
+                self._finish(method.chat_id, "empty" if "Нет постов" in method.text else "error")
+            return self._message(bot, method.chat_id, text=method.text,
+                                 message_id=getattr(method, "message_id", None))
+        return True
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        if False:
+            yield b""
+
+    async def close(self):
+        pass
+
+
+def install_fake_models():
+    """
+    Подменяет модели дешёвыми заглушками (по ключевым словам), чтобы измерять
+    накладные расходы бота, очереди и рендеринга отдельно от инференса.
+    Должна вызываться до импорта bot.handlers.
+    """
+    def classify_and_analyze(news_list, threshold=0.6, max_categories=2, cancel=None):
+        results = []
+        for news in news_list:
+            text = (news.get("text") or "").lower()
+            categories = [c for c in CATEGORIES if any(k.lower() in text for k in CATEGORY_KEYWORDS.get(c, []))]
+            results.append(dict(news, categories=categories[:max_categories] or ["other"]))
+        return results
+
+    categorizer = types.ModuleType("core.categorizer")
+    categorizer.classify_and_analyze = classify_and_analyze
+    sentimenter = types.ModuleType("core.sentimenter")
+    sentimenter.analyze_sentiment = lambda text, post=None: ("NEUTRAL", 0.5)
+    sentimenter.analyze_sentiment_batch = lambda items: [("NEUTRAL", 0.5)] * len(items)
+    sys.modules["core.categorizer"] = categorizer
+    sys.modules["core.sentimenter"] = sentimenter
+
+
+def synthetic_posts(count: int, channels: int, days: int, seed: int) -> list:
+    from dataset import generate_data_set as generator
+
+    rng = random.Random(seed)
+    names = [f"load_channel_{i:03d}" for i in range(channels)]
+    weights = generator.channel_weights(channels)
+    start = datetime.fromtimestamp(time.time() - days * 86400, timezone.utc)
+    recent = deque(maxlen=generator.RECENT_TEXTS)
+    posts = []
+    for i in range(count):
+        post = generator.realistic_post(rng, names, weights, start, days, recent, i + 1)
+        post["created_at"] = datetime.fromisoformat(post["created_at"])
+        posts.append(post)
+    # В Telegram id сообщений канала растут вместе с датой: fake-клиент листает
+    # по id и останавливается на min_id, поэтому id назначаются в порядке дат
+    posts.sort(key=lambda post: post["created_at"])
+    next_ids = Counter()
+    for post in posts:
+        next_ids[post["channel"]] += 1
+        post["message_id"] = next_ids[post["channel"]]
+        post["url"] = f"https://t.me/{post['channel']}/{post['message_id']}"
+    return posts
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered) + 0.5)) - 1))]
+
+
+class LoadTest:
+    def __init__(self, args):
+        self.args = args
+        self.update_ids = itertools.count(1)
+        self.latencies = []
+        self.step_latencies = []
+        self.outcomes = Counter()
+
+    def update(self, bot: Bot, user_id: int, text: str = None, data: str = None) -> Update:
+        user = {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"}
+        now = int(time.time())
+        if data is None:
+            payload = {"message": {"message_id": next(self.update_ids), "date": now, "from": user,
+                                   "chat": {"id": user_id, "type": "private"}, "text": text}}
+        else:
+            payload = {"callback_query": {
+                "id": str(next(self.update_ids)), "from": user, "chat_instance": str(user_id), "data": data,
+                "message": {"message_id": next(self.update_ids), "date": now, "from": BOT_USER,
+                            "chat": {"id": user_id, "type": "private"}, "text": "Выберите:"},
+            }}
+        return Update.model_validate({"update_id": next(self.update_ids), **payload}, context={"bot": bot})
+
+    async def feed(self, dp: Dispatcher, bot: Bot, update: Update):
+        started = time.perf_counter()
+        await dp.feed_update(bot, update)
+        self.step_latencies.append(time.perf_counter() - started)
+
+    async def virtual_user(self, dp: Dispatcher, bot: Bot, session: FakeBotSession, user_id: int):
+        rng = random.Random(self.args.seed + user_id)
+        await asyncio.sleep(rng.uniform(0, self.args.ramp))
+        for _ in range(self.args.iterations):
+            await self.feed(dp, bot, self.update(bot, user_id, text="/topics"))
+            await asyncio.sleep(rng.uniform(0, self.args.think))
+            period = self.args.period or rng.choice(PERIODS)
+            await self.feed(dp, bot, self.update(bot, user_id, data=period))
+            await asyncio.sleep(rng.uniform(0, self.args.think))
+
+            category = self.args.category or rng.choice(CATEGORIES)
+            waiter = session.wait_for_report(user_id)
+            started = time.perf_counter()
+            await self.feed(dp, bot, self.update(bot, user_id, data=f"category_{category}"))
+            try:
+                outcome = await asyncio.wait_for(waiter, self.args.timeout)
+                self.latencies.append(time.perf_counter() - started)
+            except asyncio.TimeoutError:
+                session.waiters.pop(user_id, None)
+                outcome = "timeout"
+            self.outcomes[outcome] += 1
+            await asyncio.sleep(rng.uniform(0, self.args.think))
+
+    async def run(self) -> dict:
+        # Импорт после возможной подмены моделей
+        from bot import handlers
+        from services import telegram_api
+        from services.entity_cache import EntityCache
+        from services.fake_telegram import FakeTelegramClient
+        from services.storage import ReportCache
+
+        if self.args.replay:
+            # Записанная реальная история каналов вместо синтетики
+            from services.fetch_replay import ReplayTelegramClient
+            client = ReplayTelegramClient(self.args.replay, speed=self.args.replay_speed)
+        else:
+            posts = synthetic_posts(self.args.posts, self.args.channels, 30, self.args.seed)
+            client = FakeTelegramClient(posts, page_latency=self.args.page_latency)
+        tmp_dir = tempfile.mkdtemp(prefix="load_test_")
+        telegram_api.TelegramClient = client
+        telegram_api.entity_cache = EntityCache(path=os.path.join(tmp_dir, "entity_cache.json"))
+        telegram_api.CHANNELS[:] = sorted(client.messages)
+        # Всегда полный пайплайн по запросу; кэш отчётов — во временной папке (или отключён)
+        handlers.INGEST_MODE = "history"
+        handlers.report_cache = ReportCache(folder=tmp_dir, max_files=0 if self.args.no_report_cache else 1000)
+
+        session = FakeBotSession()
+        bot = Bot(token="42:LOAD_TEST", session=session)
+        dp = Dispatcher()
+        dp.include_router(handlers.router)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            self.virtual_user(dp, bot, session, user_id)
+            for user_id in range(1, self.args.users + 1)
+        ))
+        elapsed = time.perf_counter() - started
+
+        return {
+            "users": self.args.users,
+            "scenarios": sum(self.outcomes.values()),
+            "outcomes": dict(self.outcomes),
+            "elapsed_s": elapsed,
+            "throughput_per_min": len(self.latencies) / elapsed * 60 if elapsed else 0.0,
+            "latency_s": {
+                "p50": percentile(self.latencies, 50),
+                "p95": percentile(self.latencies, 95),
+                "p99": percentile(self.latencies, 99),
+                "max": max(self.latencies, default=0.0),
+            },
+            "handler_latency_s": {
+                "p50": percentile(self.step_latencies, 50),
+                "p99": percentile(self.step_latencies, 99),
+            },
+            "bot_api_calls": dict(session.calls),
+        }
+
+
+def peak_memory() -> dict:
+    # ru_maxrss в Linux — килобайты, в macOS — байты
+    scale = 1 if sys.platform == "darwin" else 1024
+    memory = {
+        "rss_peak_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2 ** 20,
+        "children_rss_peak_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale / 2 ** 20,
+    }
+    if tracemalloc.is_tracing():
+        memory["python_heap_peak_mb"] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+    return memory
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест бота без сети")
+    parser.add_argument("--users", type=int, default=50, help="Число виртуальных пользователей")
+    parser.add_argument("--iterations", type=int, default=1, help="Сценариев на пользователя")
+    parser.add_argument("--posts", type=int, default=5000, help="Синтетических постов за 30 дней")
+    parser.add_argument("--channels", type=int, default=20)
+    parser.add_argument("--period", choices=PERIODS, default=None, help="Фиксированный период (иначе случайный)")
+    parser.add_argument("--category", choices=CATEGORIES, default=None, help="Фиксированная категория")
+    parser.add_argument("--ramp", type=float, default=5.0, help="Разброс старта пользователей, с")
+    parser.add_argument("--think", type=float, default=0.5, help="Максимальная пауза между шагами, с")
+    parser.add_argument("--page-latency", type=float, default=0.0, help="Задержка fake Telegram на 100 сообщений, с")
+    parser.add_argument("--replay", default=None, help="Архив загрузки каналов (services.fetch_archive) вместо синтетики")
+    parser.add_argument("--replay-speed", type=float, default=0.0, help="Ускорение записанного темпа; 0 — без пауз")
+    parser.add_argument("--timeout", type=float, default=600, help="Таймаут одного сценария, с")
+    parser.add_argument("--fake-models", action="store_true", help="Заглушки вместо моделей")
+    parser.add_argument("--no-report-cache", action="store_true", help="Не переиспользовать готовые отчёты")
+    parser.add_argument("--tracemalloc", action="store_true", help="Пик памяти Python-объектов (медленнее)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", default=None, help="Сохранить результат в JSON")
+    parser.add_argument("--max-p95", type=float, default=None, help="Порог p95, с: выше — код возврата 1")
+    parser.add_argument("--allow-empty", action="store_true",
+                        help="Не считать провалом ответ «Нет постов» (например, короткий архив --replay)")
+    parser.add_argument("--verbose", action="store_true", help="Не приглушать логи бота")
+    args = parser.parse_args()
+
+    if args.fake_models:
+        install_fake_models()
+    if args.tracemalloc:
+        tracemalloc.start()
+
+    from config.logger import logger
+    if not args.verbose:
+        logger.setLevel(logging.WARNING)
+
+    result = asyncio.run(LoadTest(args).run())
+    result["memory"] = peak_memory()
+
+    latency = result["latency_s"]
+    print(f"Пользователей: {result['users']}, сценариев: {result['scenarios']} {result['outcomes']}")
+    print(f"Время прогона: {result['elapsed_s']:.1f} с, пропускная способность: "
+          f"{result['throughput_per_min']:.1f} отчётов/мин")
+    print(f"Задержка отчёта: p50 {latency['p50']:.2f} с, p95 {latency['p95']:.2f} с, "
+          f"p99 {latency['p99']:.2f} с, max {latency['max']:.2f} с")
+    print(f"Обработчики: p50 {result['handler_latency_s']['p50'] * 1000:.1f} мс, "
+          f"p99 {result['handler_latency_s']['p99'] * 1000:.1f} мс")
+    print("Память: " + ", ".join(f"{k} {v:.0f}" for k, v in result["memory"].items()))
+    print(f"Вызовы Bot API: {result['bot_api_calls']}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+    if args.max_p95 is not None:
+        # Пустой отчёт при наличии постов — тоже провал: значит, посты не дошли до анализа
+        succeeded = result["outcomes"].get("report", 0)
+        if args.allow_empty:
+            succeeded += result["outcomes"].get("empty", 0)
+        failed = result["scenarios"] - succeeded
+        if latency["p95"] > args.max_p95 or failed:
+            print(f"Проверка не пройдена: p95 {latency['p95']:.2f} с (порог {args.max_p95}), неуспешных {failed}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Память процессов бота, воркеров и сервера инференса: уникальная и общая.
+
+RSS процесса учитывает общие страницы (веса моделей из core.shared_weights,
+библиотеки) в каждом процессе, поэтому сумма RSS завышает реальный расход.
+Отчёт берёт из /proc/<pid>/smaps:
+    USS     — частная память процесса (освободится при его завершении);
+    shared  — страницы, общие с другими процессами;
+    PSS     — RSS, где общие страницы поделены между процессами (сумма PSS — реальный расход);
+    weights — отображённые снимки весов моделей (SHARED_WEIGHTS_DIR).
+Если добавление воркера увеличивает сумму PSS примерно на его USS без весов,
+веса моделей действительно общие.
+
+Запуск (Linux):
+    python -m benchmarks.memory_report
+    python -m benchmarks.memory_report --match classify_worker --match inference_server --children
+    python -m benchmarks.memory_report --pid 1234 --pid 1240 --json memory.json
+"""
+
+import argparse
+import json
+import os
+import sys
+
+from config.config import SHARED_WEIGHTS_DIR
+
+# Процессы проекта, которые ищутся по командной строке по умолчанию
+DEFAULT_MATCH = ("main.py", "services.inference_server", "services.classify_worker", "services.stream_ingest")
+KB = 1024
+MB = 2 ** 20
+
+
+def read_cmdline(pid: int) -> str:
+    try:
+        with open(f"/proc/{pid}/cmdline", "rb") as f:
+            return f.read().replace(b"\0", b" ").decode("utf-8", "replace").strip()
+    except OSError:
+        return ""
+
+
+def read_ppid(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/stat", "r") as f:
+            # Имя процесса в скобках может содержать пробелы
+            return int(f.read().rsplit(")", 1)[1].split()[1])
+    except (OSError, IndexError, ValueError):
+        return 0
+
+
+def all_pids() -> list:
+    return [int(name) for name in os.listdir("/proc") if name.isdigit()]
+
+
+def find_pids(patterns: list, children: bool) -> list:
+    own = os.getpid()
+    pids = [pid for pid in all_pids() if pid != own and any(p in read_cmdline(pid) for p in patterns)]
+    if children:
+        # Реплики сервера инференса запускаются через spawn и по командной строке не узнаются
+        parents = set(pids)
+        found = True
+        while found:
+            found = False
+            for pid in all_pids():
+                if pid not in parents and pid != own and read_ppid(pid) in parents:
+                    parents.add(pid)
+                    found = True
+        pids = list(parents)
+    return sorted(pids)
+
+
+def process_memory(pid: int, weights_dir: str) -> dict:
+    """
+    Память процесса по /proc/<pid>/smaps, байт.
+    """
+    weights_dir = os.path.abspath(weights_dir)
+    totals = {"rss": 0, "pss": 0, "uss": 0, "shared": 0, "weights": 0}
+    in_weights = False
+    with open(f"/proc/{pid}/smaps", "r") as f:
+        for line in f:
+            parts = line.split()
+            if not parts:
+                continue
+            if not parts[0].endswith(":") or "-" in parts[0]:
+                # Заголовок отображения: адреса, права, ..., путь к файлу
+                in_weights = len(parts) >= 6 and parts[5].startswith(weights_dir)
+                continue
+            if len(parts) < 2 or not parts[1].isdigit():
+                continue
+            key, value = parts[0][:-1], int(parts[1]) * KB
+            if key == "Rss":
+                totals["rss"] += value
+                if in_weights:
+                    totals["weights"] += value
+            elif key == "Pss":
+                totals["pss"] += value
+            elif key in ("Private_Clean", "Private_Dirty"):
+                totals["uss"] += value
+            elif key in ("Shared_Clean", "Shared_Dirty"):
+                totals["shared"] += value
+    return totals
+
+
+def collect(pids: list, weights_dir: str = SHARED_WEIGHTS_DIR) -> list:
+    rows = []
+    for pid in pids:
+        try:
+            memory = process_memory(pid, weights_dir)
+        except (OSError, PermissionError):
+            continue
+        rows.append({"pid": pid, "ppid": read_ppid(pid), "cmdline": read_cmdline(pid), **memory})
+    return rows
+
+
+def summary(rows: list) -> dict:
+    return {
+        "processes": len(rows),
+        "rss_sum": sum(row["rss"] for row in rows),
+        "pss_sum": sum(row["pss"] for row in rows),
+        "uss_sum": sum(row["uss"] for row in rows),
+        "weights_rss_max": max((row["weights"] for row in rows), default=0),
+    }
+
+
+def print_report(rows: list):
+    header = f"{'pid':>7} {'ppid':>7} {'RSS':>8} {'PSS':>8} {'USS':>8} {'shared':>8} {'weights':>8}  команда"
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        print(f"{row['pid']:>7} {row['ppid']:>7} {row['rss'] / MB:>8.0f} {row['pss'] / MB:>8.0f} "
+              f"{row['uss'] / MB:>8.0f} {row['shared'] / MB:>8.0f} {row['weights'] / MB:>8.0f}  {row['cmdline'][:60]}")
+    total = summary(rows)
+    print(f"\nПроцессов: {total['processes']}, МБ")
+    print(f"  сумма RSS (веса посчитаны в каждом процессе): {total['rss_sum'] / MB:.0f}")
+    print(f"  сумма PSS (реальный расход):                  {total['pss_sum'] / MB:.0f}")
+    print(f"  сумма USS (частная память):                   {total['uss_sum'] / MB:.0f}")
+    print(f"  общие веса моделей:                           {total['weights_rss_max'] / MB:.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Уникальная и общая память процессов бота и воркеров")
+    parser.add_argument("--pid", type=int, action="append", default=[], help="pid процесса (можно несколько)")
+    parser.add_argument("--match", action="append", default=[],
+                        help="Подстрока командной строки (по умолчанию процессы проекта)")
+    parser.add_argument("--children", action="store_true", help="Добавить дочерние процессы (реплики)")
+    parser.add_argument("--weights-dir", default=SHARED_WEIGHTS_DIR, help="Папка снимков весов")
+    parser.add_argument("--json", default=None, help="Сохранить отчёт в JSON")
+    args = parser.parse_args()
+
+    if not os.path.exists("/proc/self/smaps"):
+        print("Нужен Linux с /proc/<pid>/smaps", file=sys.stderr)
+        return 2
+    pids = args.pid or find_pids(args.match or list(DEFAULT_MATCH), args.children)
+    rows = collect(pids, args.weights_dir)
+    if not rows:
+        print("Процессы не найдены", file=sys.stderr)
+        return 1
+    print_report(rows)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"processes": rows, "summary": summary(rows)}, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
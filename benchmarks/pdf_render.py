@@ -0,0 +1,73 @@
+"""
+Бенчмарк параллельного рендеринга PDF-отчётов.
+Генерирует синтетические посты и замеряет время build_pdf_report_parts
+при разном количестве процессов.
+
+Запуск из корня проекта:
+    python -m benchmarks.pdf_render --posts 3000 --chunk 150
+"""
+
+import argparse
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+from core.report_builder import build_pdf_report_parts
+from dataset.generate_data_set import generate_post
+from shared.constants import CATEGORIES
+
+
+def make_news(total: int, seed: int = 42) -> list:
+    random.seed(seed)
+    now = datetime.now().astimezone()
+    news = []
+    for i in range(total):
+        post = generate_post(random.choice(CATEGORIES))
+        news.append({
+            "text": post["text"],
+            "created_at": now - timedelta(minutes=total - i),
+            "url": f"https://t.me/bench_channel/{i}",
+            "sentiment": post["sentiment"],
+        })
+    return news
+
+
+def worker_counts(max_workers: int) -> list:
+    counts = []
+    n = 1
+    while n < max_workers:
+        counts.append(n)
+        n *= 2
+    counts.append(max_workers)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк рендеринга PDF")
+    parser.add_argument("--posts", type=int, default=3000, help="Количество постов в отчёте")
+    parser.add_argument("--chunk", type=int, default=150, help="Постов в одном фрагменте")
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    news = make_news(args.posts)
+    print(f"Постов: {args.posts}, фрагмент: {args.chunk}, ядер: {os.cpu_count()}")
+
+    start = time.perf_counter()
+    build_pdf_report_parts(news, "month", "politics", report_id="bench_single", chunk_posts=args.posts)
+    baseline = time.perf_counter() - start
+    print(f"{'один вызов WeasyPrint':>24}: {baseline:8.2f} с")
+
+    for workers in worker_counts(args.max_workers):
+        start = time.perf_counter()
+        paths = build_pdf_report_parts(
+            news, "month", "politics", report_id=f"bench_w{workers}",
+            chunk_posts=args.chunk, workers=workers
+        )
+        elapsed = time.perf_counter() - start
+        print(f"{f'процессов: {workers}':>24}: {elapsed:8.2f} с  "
+              f"ускорение x{baseline / elapsed:.2f}  частей: {len(paths)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,7 +4,12 @@ from config.logger import logger
 async def set_bot_commands(bot):
     commands = [
         BotCommand(command="start", description="Запустить бота"),
-        BotCommand(command="topics", description="Показать топ-постов  по категориям")
+        BotCommand(command="topics", description="Показать топ-постов  по категориям"),
+        BotCommand(command="stats", description="Сводка по категориям и тональности"),
+        BotCommand(command="export", description="Выгрузка постов в CSV, JSONL или Parquet"),
+        BotCommand(command="subscribe", description="Подписаться на ежедневный дайджест"),
+        BotCommand(command="subscriptions", description="Мои подписки"),
+        BotCommand(command="unsubscribe", description="Отменить подписки")
     ]
     try:
         await bot.set_my_commands(commands)
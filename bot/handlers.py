@@ -1,13 +1,29 @@
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta, timezone
 from aiogram import Router, types, F
 from aiogram.fsm.context import FSMContext
 from aiogram.filters import Command
 from bot.keyboards import get_period_keyboard, get_categories_keyboard
 from core.filters import filter_news_by_period
-from core.categorizer import classify_and_analyze
-from core.sentimenter import analyze_sentiment
-from core.report_builder import build_pdf_report
+from core.preprocessing import strip_model_inputs
+from core.categorizer import classify_and_analyze, SCORE_BATCH
+from core.sentimenter import analyze_sentiment_batch
+from core.report_builder import build_pdf_report_parts
 from services.telegram_api import fetch_news_from_channels
-from shared.constants import PERIODS, CATEGORY_LABELS
+from services.post_store import post_store
+from services.stream_ingest import rescore_stale_posts
+from services.exporter import EXPORT_FORMATS, export_path, export_posts
+from services.subscriptions import subscription_store, parse_send_at
+from services.storage import report_cache, content_hash, report_cache_key
+from services.report_queue import (
+    report_queue, run_in_thread, cancel_event, PRIORITY_CACHED, PRIORITY_WARM, PRIORITY_COLD
+)
+from services import profiler, model_registry
+from services.profiler import span
+from shared.constants import PERIODS, CATEGORY_LABELS, PERIOD_LABELS, PERIOD_DAYS, STATS_PERIOD_DAYS
+from config.config import INGEST_MODE, EXPORT_MAX_MB, ADMIN_IDS, INFERENCE_BACKEND, MODEL_RESCORE_STALE
 from config.logger import logger
 
 router = Router()
@@ -49,6 +65,36 @@ async def cmd_topics(message: types.Message, state: FSMContext):
     )
     await state.set_state("waiting_for_period")
 
+@router.message(Command("profile"))
+async def cmd_profile(message: types.Message):
+    try:
+        enabled = profiler.toggle_user(message.from_user.id)
+    except PermissionError:
+        return
+    logger.info(f"Профилирование запросов пользователя {message.from_user.id}: {'вкл' if enabled else 'выкл'}")
+    await message.answer(
+        "Профилирование ваших запросов включено." if enabled else "Профилирование ваших запросов выключено."
+    )
+
+@router.message(Command("reload_models"))
+async def cmd_reload_models(message: types.Message):
+    if message.from_user.id not in ADMIN_IDS:
+        return
+    if INFERENCE_BACKEND != "local":
+        await message.answer("Модели загружены в сервере инференса: он подхватывает новые версии сам.")
+        return
+    logger.info(f"Перезагрузка моделей по команде пользователя {message.from_user.id}")
+    await message.answer("Загружаю и прогреваю модели, текущие запросы обслуживаются прежними версиями...")
+    reloaded = []
+    for name in model_registry.MODEL_DIRS:
+        if await asyncio.to_thread(model_registry.reload_model, name, True):
+            reloaded.append(name)
+    versions = model_registry.current_versions()
+    lines = [f"{name}: {versions.get(name) or 'не загружена'}" for name in model_registry.MODEL_DIRS]
+    await message.answer(
+        f"Перезагружено моделей: {len(reloaded)} из {len(model_registry.MODEL_DIRS)}.\n" + "\n".join(lines)
+    )
+
 @router.callback_query(F.data.in_(PERIODS))
 async def period_selected(callback: types.CallbackQuery, state: FSMContext):
     period = callback.data
@@ -62,12 +108,168 @@ async def period_selected(callback: types.CallbackQuery, state: FSMContext):
     await state.set_state("waiting_for_category")
     await callback.answer()
 
+SENTIMENT_MARKS = {"POSITIVE": "🙂", "NEUTRAL": "😐", "NEGATIVE": "🙁"}
+
+def format_rollup_summary(period: str, by_category: list, by_channel: list, top_channels: int = 5) -> str:
+    """
+    Текст сводки по агрегатам: число постов и доли тональностей по категориям, самые активные каналы.
+    """
+    period_label = PERIOD_LABELS.get(period, "Квартал").lower()
+    if not by_category:
+        return f"Нет классифицированных постов за период: {period_label}."
+
+    totals = {}
+    sentiments = {}
+    for row in by_category:
+        totals[row["category"]] = totals.get(row["category"], 0) + row["posts"]
+        sentiments.setdefault(row["category"], {})[row["sentiment"]] = row["posts"]
+
+    lines = [f"Сводка за период: {period_label}."]
+    for category, total in sorted(totals.items(), key=lambda item: item[1], reverse=True):
+        shares = " · ".join(
+            f"{SENTIMENT_MARKS.get(label, label)} {count * 100 // total}%"
+            for label, count in sorted(sentiments[category].items(), key=lambda item: item[1], reverse=True)
+        )
+        lines.append(f"{CATEGORY_LABELS.get(category, category)}: {total} ({shares})")
+
+    channels = sorted(by_channel, key=lambda row: row["posts"], reverse=True)[:top_channels]
+    if channels:
+        lines.append("")
+        lines.append("Самые активные каналы: " + ", ".join(f"{row['channel']} ({row['posts']})" for row in channels))
+    lines.append("Пост с несколькими категориями учитывается в каждой из них.")
+    return "\n".join(lines)
+
+@router.message(Command("stats"))
+async def cmd_stats(message: types.Message):
+    payload = message.text.split(" ", 1)
+    period = payload[1].strip().lower() if len(payload) > 1 else "week"
+    if period not in STATS_PERIOD_DAYS:
+        await message.answer("Укажите период: /stats day, week, month или quarter.")
+        return
+    logger.info(f"Команда /stats {period} от пользователя {message.from_user.id}")
+
+    since = datetime.now(timezone.utc) - timedelta(days=STATS_PERIOD_DAYS[period])
+    by_category = await asyncio.to_thread(post_store.rollup, since, group_by=("category", "sentiment"))
+    by_channel = await asyncio.to_thread(post_store.rollup, since, group_by=("channel",))
+    await message.answer(format_rollup_summary(period, by_category, by_channel))
+
+@router.message(Command("export"))
+async def cmd_export(message: types.Message):
+    args = message.text.split()[1:]
+    fmt = args[0].lower() if args else "csv"
+    period = args[1].lower() if len(args) > 1 else "week"
+    category_key = args[2].lower() if len(args) > 2 else None
+    if (fmt not in EXPORT_FORMATS or period not in STATS_PERIOD_DAYS
+            or (category_key and category_key not in CATEGORY_LABELS)):
+        await message.answer(
+            "Формат: /export [csv|jsonl|parquet] [day|week|month|quarter] [категория]\n"
+            "Например: /export csv month economics"
+        )
+        return
+    logger.info(f"Команда /export {fmt} {period} {category_key or ''} от пользователя {message.from_user.id}")
+
+    status = await message.answer("Готовлю выгрузку...")
+
+    async def on_position(position: int):
+        await status.edit_text(f"Выгрузка в очереди, позиция: {position}.")
+
+    # Выгрузка читает хранилище и пишет файл: идёт через общую очередь, как отчёты,
+    # чтобы одновременные /export не занимали все потоки и диск
+    await report_queue.submit(
+        message.from_user.id,
+        lambda: send_export(message, status, fmt, period, category_key),
+        priority=PRIORITY_WARM,
+        on_position=on_position,
+    )
+
+async def send_export(message: types.Message, status: types.Message, fmt: str, period: str, category_key: str):
+    """
+    Выгрузка постов и отправка файла. Выполняется обработчиком очереди report_queue.
+    """
+    since = datetime.now(timezone.utc) - timedelta(days=STATS_PERIOD_DAYS[period])
+    path = export_path(fmt, period, category_key)
+    try:
+        rows = await run_in_thread(export_posts, fmt, path, since, category=category_key)
+        size_mb = os.path.getsize(path) / 2 ** 20
+        if rows == 0:
+            await status.edit_text("Нет постов за выбранный период.")
+        elif size_mb > EXPORT_MAX_MB:
+            await status.edit_text(
+                f"Выгрузка слишком большая для Telegram ({size_mb:.0f} МБ). "
+                "Выберите период короче или категорию."
+            )
+        else:
+            await message.answer_document(
+                types.FSInputFile(path),
+                caption=f"Выгрузка: {rows} постов, период {period}"
+                        + (f", категория \"{CATEGORY_LABELS[category_key]}\"" if category_key else "") + "."
+            )
+            await status.delete()
+    except Exception as e:
+        logger.error(f"Ошибка при выгрузке постов: {e}")
+        await status.edit_text(f"Ошибка при выгрузке: {e}")
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+# Подписка возможна на любую категорию, кроме «Другое»
+SUBSCRIBE_CATEGORIES = [key for key in CATEGORY_LABELS if key != 'other']
+SUBSCRIBE_HELP = (
+    "Формат: /subscribe категория период ЧЧ:ММ\n"
+    "Например: /subscribe politics day 09:00 — каждый день в 9:00 отчёт по политике за сутки.\n"
+    f"Категории: {', '.join(SUBSCRIBE_CATEGORIES)}. Периоды: {', '.join(PERIODS)}."
+)
+
+@router.message(Command("subscribe"))
+async def cmd_subscribe(message: types.Message):
+    args = message.text.split()[1:]
+    if len(args) != 3 or args[0] not in SUBSCRIBE_CATEGORIES or args[1] not in PERIODS:
+        await message.answer(SUBSCRIBE_HELP)
+        return
+    category_key, period, send_at = args
+    try:
+        send_at = parse_send_at(send_at)
+    except ValueError:
+        await message.answer(SUBSCRIBE_HELP)
+        return
+    await asyncio.to_thread(subscription_store.subscribe, message.from_user.id, category_key, period, send_at)
+    logger.info(f"Пользователь {message.from_user.id} подписался: {category_key}/{period} в {send_at}")
+    await message.answer(
+        f"Подписка оформлена: \"{CATEGORY_LABELS[category_key]}\" за {PERIOD_LABELS[period].lower()}, "
+        f"ежедневно в {send_at}."
+    )
+
+@router.message(Command("unsubscribe"))
+async def cmd_unsubscribe(message: types.Message):
+    args = message.text.split()[1:]
+    category_key = args[0] if args else None
+    period = args[1] if len(args) > 1 else None
+    removed = await asyncio.to_thread(subscription_store.unsubscribe, message.from_user.id, category_key, period)
+    await message.answer(f"Удалено подписок: {removed}." if removed else "Подходящих подписок нет.")
+
+@router.message(Command("subscriptions"))
+async def cmd_subscriptions(message: types.Message):
+    subscriptions = await asyncio.to_thread(subscription_store.user_subscriptions, message.from_user.id)
+    if not subscriptions:
+        await message.answer("У вас нет подписок.\n" + SUBSCRIBE_HELP)
+        return
+    lines = [
+        f"{sub['send_at']} — \"{CATEGORY_LABELS.get(sub['category'], sub['category'])}\" "
+        f"за {PERIOD_LABELS.get(sub['period'], sub['period']).lower()}"
+        for sub in subscriptions
+    ]
+    await message.answer("Ваши подписки:\n" + "\n".join(lines))
+
+def select_category(analyzed_news: list, category_key: str) -> list:
+    return [post for post in analyzed_news if category_key in post.get('categories', [])]
+
 @router.callback_query(lambda c: c.data.startswith("category_"))
 async def category_selected(callback: types.CallbackQuery, state: FSMContext):
     await callback.answer("Начинаю обработку...")
 
+    user_id = callback.from_user.id
     category_key = callback.data.removeprefix("category_")
-    logger.info(f"Пользователь {callback.from_user.id} выбрал категорию: {category_key}")
+    logger.info(f"Пользователь {user_id} выбрал категорию: {category_key}")
 
     data = await state.get_data()
     period = data.get("period")
@@ -75,73 +277,167 @@ async def category_selected(callback: types.CallbackQuery, state: FSMContext):
         await callback.message.answer("Пожалуйста, сначала выберите период анализа через команду /topics.")
         return
 
-    category_name = CATEGORY_LABELS.get(category_key, "Другое")
+    # Новый выбор пользователя отменяет его предыдущие незавершённые запросы
+    if await report_queue.cancel_user(user_id):
+        await callback.message.answer("Предыдущий запрос отменён.")
+
+    # Оцениваем стоимость задачи: готовый отчёт в кэше дешевле всего, затем рендеринг без классификации
+    priority = PRIORITY_WARM if INGEST_MODE != "history" else PRIORITY_COLD
+    cached_news = data.get("classified_news")
+    if (cached_news is not None and data.get("classified_period") == period
+            and data.get("classified_models") == model_registry.combined_version()):
+        priority = PRIORITY_WARM
+        filtered_news = select_category(cached_news, category_key)
+        if filtered_news and report_cache.get(report_cache_key(category_key, period, content_hash(filtered_news))):
+            priority = PRIORITY_CACHED
+
+    status = {"message": None}
 
-    period_to_days = {
-        'day': 1,
-        'week': 7,
-        'month': 30
-    }
-    days = period_to_days.get(period, 30)
+    async def on_position(position: int):
+        text = f"Ваш запрос в очереди, позиция: {position}."
+        if status["message"] is None:
+            status["message"] = await callback.message.answer(text)
+        else:
+            await status["message"].edit_text(text)
+
+    run = lambda: build_and_send_report(callback.message, state, period, category_key, status)
+    if profiler.should_profile(user_id):
+        request_id = f"{user_id}_{category_key}_{period}_{int(time.time() * 1000)}"
+        logger.info(f"Запрос {request_id} будет профилирован")
+        run = profiler.profiled(request_id, run)
+
+    await report_queue.submit(
+        user_id,
+        run,
+        priority=priority,
+        on_position=on_position,
+    )
 
+async def build_and_send_report(message: types.Message, state: FSMContext, period: str, category_key: str,
+                                status: dict):
+    """
+    Полный пайплайн отчёта: загрузка, классификация, рендеринг и отправка.
+    Выполняется обработчиком очереди report_queue.
+    """
+    category_name = CATEGORY_LABELS.get(category_key, "Другое")
+    days = PERIOD_DAYS.get(period, 30)
+
+    data = await state.get_data()
     cached_news = data.get("classified_news")
     cached_period = data.get("classified_period")
+    # Результаты, посчитанные до замены моделей, считаются заново
+    if data.get("classified_models") != model_registry.combined_version():
+        cached_news = None
+    loading_msg = status.get("message")
 
-    if cached_news is None or cached_period != period:
-        loading_msg = None
+    if INGEST_MODE != "history":
+        # Посты уже классифицированы фоновой загрузкой — достаточно запроса к хранилищу
+        since = datetime.now(timezone.utc) - timedelta(days=days)
+        with span("store_query"):
+            analyzed_news = await run_in_thread(post_store.query, since)
+        logger.info(f"Постов в хранилище за период '{period}': {len(analyzed_news)}")
+        if MODEL_RESCORE_STALE:
+            # После замены моделей посты прежней версии пересчитываются при первом обращении к ним
+            with span("rescore"):
+                analyzed_news = await run_in_thread(rescore_stale_posts, analyzed_news)
+    elif cached_news is None or cached_period != period:
         try:
-            loading_msg = await callback.message.answer("Идёт загрузка и классификация постов...")
-            all_news = await fetch_news_from_channels(period_days=days)
+            if loading_msg:
+                await loading_msg.edit_text("Идёт загрузка и классификация постов...")
+            else:
+                loading_msg = await message.answer("Идёт загрузка и классификация постов...")
+            with span("fetch", period_days=days):
+                all_news = await fetch_news_from_channels(period_days=days)
             logger.info(f"Получено постов из каналов: {len(all_news)}")
         except Exception as e:
             logger.error(f"Ошибка при получении постов: {e}")
             if loading_msg:
                 await loading_msg.edit_text("Ошибка при получении постов. Попробуйте позже.")
             else:
-                await callback.message.answer("Ошибка при получении постов. Попробуйте позже.")
+                await message.answer("Ошибка при получении постов. Попробуйте позже.")
             return
 
         news_in_period = filter_news_by_period(all_news, period)
         logger.info(f"Постов после фильтра по периоду '{period}': {len(news_in_period)}")
 
-        analyzed_news = classify_and_analyze(news_in_period)
+        # Классификация выполняется в отдельном потоке, чтобы event loop обслуживал очередь и других пользователей
+        with span("classify", posts=len(news_in_period)):
+            analyzed_news = await run_in_thread(classify_and_analyze, news_in_period, cancel=cancel_event())
 
-        for post in analyzed_news:
-            text = post.get("text", "")
-            sentiment_label, sentiment_score = analyze_sentiment(text)
-            post["sentiment"] = sentiment_label
-            post["sentiment_score"] = sentiment_score
+        with span("sentiment", posts=len(analyzed_news)):
+            # Пачками: между ними отмена задачи не ждёт весь период
+            for start in range(0, len(analyzed_news), SCORE_BATCH):
+                batch = analyzed_news[start:start + SCORE_BATCH]
+                sentiments = await run_in_thread(
+                    analyze_sentiment_batch, [(post.get("text", ""), post) for post in batch]
+                )
+                for post, (sentiment_label, sentiment_score) in zip(batch, sentiments):
+                    post["sentiment"] = sentiment_label
+                    post["sentiment_score"] = sentiment_score
 
-        await state.update_data(classified_news=analyzed_news, classified_period=period)
+        # input_ids нужны только моделям, а в состоянии FSM они в разы увеличивают объём данных пользователя
+        await state.update_data(classified_news=[strip_model_inputs(post) for post in analyzed_news],
+                                classified_period=period,
+                                classified_models=model_registry.combined_version())
+        await run_in_thread(post_store.upsert_posts, analyzed_news)
     else:
         analyzed_news = cached_news
-        loading_msg = None
 
-    filtered_news = [post for post in analyzed_news if category_key in post.get('categories', [])]
+    filtered_news = select_category(analyzed_news, category_key)
     logger.info(f"Постов после фильтра по категории '{category_key}': {len(filtered_news)}")
 
     if not filtered_news:
         if loading_msg:
             await loading_msg.edit_text(f"Нет постов в категории \"{category_name}\" за выбранный период.")
         else:
-            await callback.message.answer(f"Нет постов в категории \"{category_name}\" за выбранный период.")
+            await message.answer(f"Нет постов в категории \"{category_name}\" за выбранный период.")
         return
 
     if loading_msg:
         await loading_msg.edit_text(f"Найдено {len(filtered_news)} постов в категории \"{category_name}\" за период {period}.")
     else:
-        await callback.message.answer(f"Найдено {len(filtered_news)} постов в категории \"{category_name}\" за период {period}.")
+        await message.answer(f"Найдено {len(filtered_news)} постов в категории \"{category_name}\" за период {period}.")
+
+    caption = f"Отчёт по категории \"{category_name}\" за {period.capitalize()}."
+    version = content_hash(filtered_news)
+    cache_key = report_cache_key(category_key, period, version)
+
+    cached = report_cache.get(cache_key)
+    if cached:
+        try:
+            file_ids = []
+            for part in cached["files"]:
+                document = part.get("file_id") or types.FSInputFile(part["path"])
+                sent = await message.answer_document(document, caption=caption)
+                file_ids.append(sent.document.file_id)
+            if not all(part.get("file_id") for part in cached["files"]):
+                report_cache.put(cache_key, [part["path"] for part in cached["files"]], file_ids)
+            logger.info(f"Отчёт {cache_key} отправлен из кэша")
+            return
+        except Exception as e:
+            logger.warning(f"Не удалось отправить отчёт из кэша, формируем заново: {e}")
+            report_cache.invalidate(cache_key)
 
     try:
-        pdf_path = build_pdf_report(filtered_news, period, category_key)
-        logger.info(f"PDF отчет сформирован: {pdf_path}")
-        await callback.message.answer_document(
-            types.FSInputFile(pdf_path),
-            caption=f"Отчёт по категории \"{category_name}\" за {period.capitalize()}."
-        )
+        # Рендеринг PDF выполняется вне event loop, чтобы не блокировать других пользователей
+        with span("build_report", posts=len(filtered_news)):
+            pdf_paths = await run_in_thread(
+                build_pdf_report_parts, filtered_news, period, category_key, version
+            )
+        logger.info(f"PDF отчет сформирован: {', '.join(pdf_paths)}")
+        file_ids = []
+        for n, pdf_path in enumerate(pdf_paths, 1):
+            part_caption = caption if len(pdf_paths) == 1 else f"{caption} Часть {n} из {len(pdf_paths)}."
+            with span("send_document", part=n):
+                sent = await message.answer_document(
+                    types.FSInputFile(pdf_path),
+                    caption=part_caption
+                )
+            file_ids.append(sent.document.file_id)
+        report_cache.put(cache_key, pdf_paths, file_ids)
     except Exception as e:
         logger.error(f"Ошибка при формировании отчёта: {e}")
         if loading_msg:
             await loading_msg.edit_text(f"Произошла ошибка при формировании отчёта.\n{e}")
         else:
-            await callback.message.answer(f"Произошла ошибка при формировании отчёта.\n{e}")
+            await message.answer(f"Произошла ошибка при формировании отчёта.\n{e}")
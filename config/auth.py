@@ -1,6 +1,9 @@
 """
 Авторизационные данные Telegram API для Telethon/pyrogram.
 API_ID и API_HASH берутся из https://my.telegram.org, SESSION_NAME — любое имя сессии.
+INGEST_SESSION_NAME — отдельная сессия фоновой загрузки (stream/poll): файл сессии
+Telethon — SQLite, и два клиента на одном файле в одном процессе ловят
+«database is locked». При первом запуске фоновой загрузки Telethon попросит войти в неё.
 Все данные должны храниться в .env и подгружаться через dotenv.
 """
 
@@ -12,6 +15,7 @@ load_dotenv()
 API_ID = os.getenv("API_ID")
 API_HASH = os.getenv("API_HASH")
 SESSION_NAME = os.getenv("SESSION_NAME", "anon")
+INGEST_SESSION_NAME = os.getenv("INGEST_SESSION_NAME", f"{SESSION_NAME}_ingest")
 
 # Преобразование API_ID к int и проверка
 try:
@@ -16,4 +16,128 @@ if not BOT_TOKEN:
 
 # Дополнительные общие параметры (при необходимости)
 DEFAULT_REPORTS_FOLDER = "reports"
-DEFAULT_SESSIONS_FOLDER = "sessions"
\ No newline at end of file
+DEFAULT_SESSIONS_FOLDER = "sessions"
+
+# Кэш отчётов: ограничения по количеству файлов, суммарному размеру и возрасту
+REPORT_CACHE_MAX_FILES = int(os.getenv("REPORT_CACHE_MAX_FILES", "50"))
+REPORT_CACHE_MAX_MB = int(os.getenv("REPORT_CACHE_MAX_MB", "200"))
+REPORT_CACHE_TTL_HOURS = int(os.getenv("REPORT_CACHE_TTL_HOURS", "24"))
+
+# Рендеринг PDF: размер фрагмента (постов), число процессов и лимит размера одной части
+PDF_CHUNK_POSTS = int(os.getenv("PDF_CHUNK_POSTS", "150"))
+PDF_RENDER_WORKERS = int(os.getenv("PDF_RENDER_WORKERS", str(os.cpu_count() or 1)))
+PDF_PART_MAX_MB = int(os.getenv("PDF_PART_MAX_MB", "45"))
+
+# Очередь отчётов: число одновременных пайплайнов, лимит на пользователя и защита от голодания
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", "2"))
+REPORT_PER_USER_LIMIT = int(os.getenv("REPORT_PER_USER_LIMIT", "1"))
+REPORT_QUEUE_AGING_SECONDS = float(os.getenv("REPORT_QUEUE_AGING_SECONDS", "60"))
+
+# Локальное хранилище постов и режим загрузки: history — по запросу, stream — подписка на новые сообщения,
+# poll — адаптивный опрос каналов планировщиком
+POST_STORE_PATH = os.getenv("POST_STORE_PATH", "data/posts.db")
+INGEST_MODE = os.getenv("INGEST_MODE", "history")
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "16"))
+STREAM_FLUSH_SECONDS = float(os.getenv("STREAM_FLUSH_SECONDS", "5"))
+
+# Адаптивный опрос каналов: границы интервала (с), желаемое число новых постов за опрос,
+# ограничение частоты опросов и период вывода статуса (с)
+POLL_MIN_INTERVAL = float(os.getenv("POLL_MIN_INTERVAL", "60"))
+POLL_MAX_INTERVAL = float(os.getenv("POLL_MAX_INTERVAL", "3600"))
+POLL_TARGET_POSTS = int(os.getenv("POLL_TARGET_POSTS", "5"))
+POLL_MAX_PER_SECOND = float(os.getenv("POLL_MAX_PER_SECOND", "1"))
+POLL_STATUS_INTERVAL = float(os.getenv("POLL_STATUS_INTERVAL", "600"))
+
+# Режим инференса: base — только базовые модели, cascade — сначала маленькие модели,
+# базовые только при низкой уверенности. Пороги по умолчанию (перекрываются калибровкой)
+# и доля теневых прогонов базовой модели для оценки совпадений
+INFERENCE_MODE = os.getenv("INFERENCE_MODE", "base")
+CASCADE_CATEGORY_THRESHOLD = float(os.getenv("CASCADE_CATEGORY_THRESHOLD", "0.8"))
+CASCADE_SENTIMENT_THRESHOLD = float(os.getenv("CASCADE_SENTIMENT_THRESHOLD", "0.85"))
+CASCADE_SHADOW_RATE = float(os.getenv("CASCADE_SHADOW_RATE", "0.05"))
+
+# Где выполняется инференс: local — модели загружаются в каждом процессе, remote — запросы
+# к общему серверу инференса (python -m services.inference_server) через Unix-сокет.
+# Параметры сервера: число реплик моделей, потоков torch на реплику, размер и ожидание батча
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "local")
+INFERENCE_SOCKET = os.getenv("INFERENCE_SOCKET", "data/inference.sock")
+INFERENCE_REPLICAS = int(os.getenv("INFERENCE_REPLICAS", "1"))
+INFERENCE_TORCH_THREADS = int(os.getenv("INFERENCE_TORCH_THREADS", str(max((os.cpu_count() or 1) // INFERENCE_REPLICAS, 1))))
+INFERENCE_MAX_BATCH = int(os.getenv("INFERENCE_MAX_BATCH", "16"))
+INFERENCE_BATCH_WAIT_MS = float(os.getenv("INFERENCE_BATCH_WAIT_MS", "10"))
+INFERENCE_TIMEOUT = float(os.getenv("INFERENCE_TIMEOUT", "60"))
+
+# Где классифицируются загруженные посты: inline — в процессе загрузки, queue — через очередь
+# задач (python -m services.classify_worker, в том числе на других машинах с общей файловой
+# системой). Аренда пачки (с), лимит попыток, размер пачки и пауза воркера при пустой очереди
+# (с; с той же паузой загрузчик переносит результаты воркеров в хранилище постов)
+CLASSIFY_MODE = os.getenv("CLASSIFY_MODE", "inline")
+WORK_QUEUE_PATH = os.getenv("WORK_QUEUE_PATH", "data/work_queue.db")
+WORK_QUEUE_LEASE_SECONDS = float(os.getenv("WORK_QUEUE_LEASE_SECONDS", "300"))
+WORK_QUEUE_MAX_ATTEMPTS = int(os.getenv("WORK_QUEUE_MAX_ATTEMPTS", "5"))
+WORK_QUEUE_BATCH = int(os.getenv("WORK_QUEUE_BATCH", "32"))
+WORK_QUEUE_IDLE_SECONDS = float(os.getenv("WORK_QUEUE_IDLE_SECONDS", "2"))
+
+# Кэш разрешённых каналов (id, access_hash, название): путь, срок жизни записи (ч),
+# срок жизни текста закреплённого поста (ч) и число одновременных запросов при проверке источников
+ENTITY_CACHE_PATH = os.getenv("ENTITY_CACHE_PATH", "data/entity_cache.json")
+ENTITY_CACHE_TTL_HOURS = float(os.getenv("ENTITY_CACHE_TTL_HOURS", "168"))
+PINNED_CACHE_TTL_HOURS = float(os.getenv("PINNED_CACHE_TTL_HOURS", "6"))
+VALIDATE_CONCURRENCY = int(os.getenv("VALIDATE_CONCURRENCY", "8"))
+
+# Запись загрузок каналов в архив (папка; пусто — не записывать) и воспроизведение архива
+# вместо Telegram: путь к файлу и ускорение относительно записанного темпа (0 — без пауз)
+FETCH_RECORD_DIR = os.getenv("FETCH_RECORD_DIR", "")
+FETCH_REPLAY_PATH = os.getenv("FETCH_REPLAY_PATH", "")
+FETCH_REPLAY_SPEED = float(os.getenv("FETCH_REPLAY_SPEED", "0"))
+
+# Профилирование запросов отчётов: доля случайно профилируемых запросов, интервал снятия
+# стеков (мс) и папка для профилей. ADMIN_IDS — id пользователей (через запятую), которым
+# доступна команда /profile: профилирование своих следующих запросов
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "data/profiles")
+ADMIN_IDS = {int(user_id) for user_id in os.getenv("ADMIN_IDS", "").split(",") if user_id.strip()}
+
+# HTTP API для мини-приложения (python -m services.web_api или WEB_API_ENABLED=1 вместе с ботом):
+# адрес и порт, разрешённый Origin для CORS, размер страницы постов по умолчанию и максимальный
+WEB_API_ENABLED = os.getenv("WEB_API_ENABLED", "0") == "1"
+WEB_API_HOST = os.getenv("WEB_API_HOST", "127.0.0.1")
+WEB_API_PORT = int(os.getenv("WEB_API_PORT", "8080"))
+WEB_API_CORS_ORIGIN = os.getenv("WEB_API_CORS_ORIGIN", "*")
+WEB_API_PAGE_SIZE = int(os.getenv("WEB_API_PAGE_SIZE", "20"))
+WEB_API_MAX_PAGE_SIZE = int(os.getenv("WEB_API_MAX_PAGE_SIZE", "100"))
+
+# Выгрузки постов (CSV/JSONL/Parquet): папка, размер пачки чтения из хранилища
+# и максимальный размер файла для отправки ботом (МБ, лимит Bot API — 50)
+EXPORT_DIR = os.getenv("EXPORT_DIR", "data/exports")
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "5000"))
+EXPORT_MAX_MB = float(os.getenv("EXPORT_MAX_MB", "49"))
+
+# Подписки на дайджесты: файл базы, время предрасчёта (ЧЧ:ММ, время сервера, вне пиковых часов),
+# скорость рассылки (сообщений/с на бота, лимит Bot API — около 30), число одновременных
+# отправок, период проверки расписания (с) и число попыток доставки при сетевых ошибках
+DIGESTS_ENABLED = os.getenv("DIGESTS_ENABLED", "1") == "1"
+SUBSCRIPTIONS_PATH = os.getenv("SUBSCRIPTIONS_PATH", "data/subscriptions.db")
+DIGEST_PRECOMPUTE_AT = os.getenv("DIGEST_PRECOMPUTE_AT", "05:00")
+DIGEST_SEND_RATE = float(os.getenv("DIGEST_SEND_RATE", "25"))
+DIGEST_SEND_CONCURRENCY = int(os.getenv("DIGEST_SEND_CONCURRENCY", "20"))
+DIGEST_CHECK_SECONDS = float(os.getenv("DIGEST_CHECK_SECONDS", "60"))
+DIGEST_MAX_ATTEMPTS = int(os.getenv("DIGEST_MAX_ATTEMPTS", "5"))
+
+# Горячая перезагрузка моделей: период проверки папок local_models (с, 0 — не следить),
+# пересчёт постов хранилища, классифицированных прежней версией моделей, при запросе отчёта
+# и максимум пересчитываемых постов на запрос (остальные — на следующих запросах)
+MODEL_WATCH_SECONDS = float(os.getenv("MODEL_WATCH_SECONDS", "30"))
+MODEL_RESCORE_STALE = os.getenv("MODEL_RESCORE_STALE", "1") == "1"
+MODEL_RESCORE_MAX_POSTS = int(os.getenv("MODEL_RESCORE_MAX_POSTS", "1000"))
+
+# Общие для процессов веса моделей: параметры отображаются из снимка файла весов (mmap),
+# поэтому бот, воркеры и реплики сервера инференса не держат каждый свою копию
+SHARED_WEIGHTS = os.getenv("SHARED_WEIGHTS", "1") == "1"
+SHARED_WEIGHTS_DIR = os.getenv("SHARED_WEIGHTS_DIR", "data/shared_weights")
+
+# Предфильтр постов перед инференсом (services.prefilter): включение и файл правил
+# (YAML: значения по умолчанию и правила отдельных каналов; без файла — встроенные правила)
+PREFILTER_ENABLED = os.getenv("PREFILTER_ENABLED", "1") == "1"
+PREFILTER_RULES_PATH = os.getenv("PREFILTER_RULES_PATH", "data/prefilter.yaml")
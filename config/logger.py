@@ -1,40 +1,188 @@
+"""
+Логгер проекта.
+
+Обработчики не пишут на диск и в терминал в вызывающем потоке: записи кладутся
+в очередь (QueueHandler), а файл с ротацией по размеру и stdout обслуживает
+фоновый поток QueueListener. Поэтому скорость диска и терминала не влияет на
+event loop и обработку постов. Если очередь переполнена, записи отбрасываются
+(с подсчётом), а не блокируют вызывающий код.
+
+Каждый файл логов пишет и ротирует один процесс: у отдельных точек входа свои
+файлы (process_log_file), а дочерние процессы пулов передают записи родителю
+через child_log_queue.
+
+Настройки читаются из окружения здесь, а не в config.config: логгер нужен и
+скриптам, которые запускаются без BOT_TOKEN (download_models.py и др.).
+"""
+
+import atexit
 import logging
+import multiprocessing
+import os
+import queue
 import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# Файл и уровень логов, ротация (МБ на файл, число старых файлов) и размер очереди записей
+LOG_FILE = os.getenv("LOG_FILE", "bot.log")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "DEBUG")
+LOG_MAX_MB = float(os.getenv("LOG_MAX_MB", "20"))
+LOG_BACKUPS = int(os.getenv("LOG_BACKUPS", "5"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+# Прогресс-бар в терминале: по умолчанию только если stdout — терминал; не чаще раза в PROGRESS_INTERVAL с
+PROGRESS_ENABLED = os.getenv("PROGRESS_ENABLED", "1" if sys.stdout.isatty() else "0") == "1"
+PROGRESS_INTERVAL = float(os.getenv("PROGRESS_INTERVAL", "0.25"))
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    QueueHandler, который при переполненной очереди отбрасывает запись и считает потери.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            if self.dropped:
+                dropped, self.dropped = self.dropped, 0
+                self.queue.put_nowait(logging.makeLogRecord({
+                    "name": record.name, "levelno": logging.WARNING, "levelname": "WARNING",
+                    "msg": f"Очередь логов переполнена, пропущено записей: {dropped}",
+                }))
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def process_log_file(log_file: str = LOG_FILE) -> str:
+    """
+    Файл логов процесса. У каждого файла один писатель, который его и ротирует:
+    бот (python main.py) пишет в LOG_FILE, остальные точки входа — в файл с именем
+    своего модуля рядом с ним (python -m services.classify_worker → bot.classify_worker.log).
+    """
+    main = sys.modules.get("__main__")
+    spec = getattr(main, "__spec__", None)
+    if spec is not None:
+        entry = spec.name.rsplit(".", 1)[-1]
+    else:
+        entry = os.path.splitext(os.path.basename(getattr(main, "__file__", None) or ""))[0]
+    if entry in ("", "main"):
+        return log_file
+    root, ext = os.path.splitext(log_file)
+    return f"{root}.{entry}{ext}"
+
+
+_handlers = []
+_child_queue = None
+_child_lock = threading.Lock()
+
 
-def setup_logger(name: str = "AI_POST_BOT", log_file: str = "bot.log") -> logging.Logger:
+def setup_logger(name: str = "AI_POST_BOT", log_file: str = None) -> logging.Logger:
     logger = logging.getLogger(name)
-    logger.setLevel(logging.DEBUG)
+    logger.setLevel(LOG_LEVEL)
+
+    # Чтобы не добавлять обработчики повторно при повторном вызове
+    if logger.handlers:
+        return logger
+    logger.propagate = False
 
     formatter = logging.Formatter(
         fmt="%(asctime)s | %(levelname)s | %(name)s | %(message)s",
         datefmt="%Y-%m-%d %H:%M:%S"
     )
 
-    file_handler = logging.FileHandler(log_file, encoding="utf-8")
-    file_handler.setFormatter(formatter)
-
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setFormatter(formatter)
 
-    if not logger.hasHandlers():
-        logger.addHandler(file_handler)
+    # parent_process() в spawn-процессе ещё не задан, пока импортируется __main__ родителя,
+    # а имя процесса уже задано
+    if multiprocessing.parent_process() is not None or multiprocessing.current_process().name != "MainProcess":
+        # Дочерний процесс (рендеринг, реплика инференса) не открывает файл логов:
+        # init_child_logging перенаправит записи родителю, до этого они идут в stdout
         logger.addHandler(console_handler)
-    else:
-        # Чтобы не добавлять обработчики повторно при повторном вызове
-        for handler in logger.handlers:
-            if not isinstance(handler, (logging.FileHandler, logging.StreamHandler)):
-                logger.addHandler(handler)
+        return logger
+
+    file_handler = RotatingFileHandler(
+        log_file or process_log_file(), maxBytes=int(LOG_MAX_MB * 1024 * 1024),
+        backupCount=LOG_BACKUPS, encoding="utf-8"
+    )
+    file_handler.setFormatter(formatter)
+    _handlers[:] = [file_handler, console_handler]
+
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    listener = QueueListener(log_queue, *_handlers, respect_handler_level=True)
+    listener.start()
+    # При выходе дописываем оставшиеся в очереди записи
+    atexit.register(listener.stop)
 
+    logger.addHandler(DroppingQueueHandler(log_queue))
     return logger
 
+
+def child_log_queue():
+    """
+    Очередь записей дочерних процессов (spawn). Её разбирает поток этого процесса
+    теми же обработчиками, поэтому файл логов пишет только он.
+    Передаётся в пул процессов: initializer=init_child_logging, initargs=(child_log_queue(),).
+    """
+    global _child_queue
+    with _child_lock:
+        if _child_queue is None:
+            _child_queue = multiprocessing.get_context("spawn").Queue(LOG_QUEUE_SIZE)
+            listener = QueueListener(_child_queue, *_handlers, respect_handler_level=True)
+            listener.start()
+            atexit.register(listener.stop)
+        return _child_queue
+
+
+def init_child_logging(log_queue, name: str = "AI_POST_BOT"):
+    """
+    Инициализатор дочернего процесса: записи логгера уходят в очередь родителя.
+    """
+    child_logger = logging.getLogger(name)
+    for handler in list(child_logger.handlers):
+        child_logger.removeHandler(handler)
+    child_logger.addHandler(DroppingQueueHandler(log_queue))
+
 logger = setup_logger()
 
 
-def print_progress_bar(current: int, total: int):
+def print_progress_bar(current: int, total: int, label: str = "Классификация постов"):
     bar_length = 30  # длина прогресс-бара
     done = int(bar_length * current / total)
     bar = '🟩' * done + '⬜' * (bar_length - done)
     # Печатаем прогресс-бар без добавления новой строки, с возвратом каретки
-    print(f"\rКлассификация постов: [{bar}] {current}/{total}", end='', flush=True)
+    print(f"\r{label}: [{bar}] {current}/{total}", end='', flush=True)
     if current == total:
-        print()  # перевод строки после окончания
\ No newline at end of file
+        print()  # перевод строки после окончания
+
+
+class ProgressReporter:
+    """
+    Прогресс-бар, который перерисовывается не чаще раза в interval секунд
+    (и обязательно на последнем шаге). При enabled=False ничего не выводит.
+    """
+
+    def __init__(self, total: int, label: str = "Классификация постов",
+                 interval: float = PROGRESS_INTERVAL, enabled: bool = PROGRESS_ENABLED):
+        self.total = total
+        self.label = label
+        self.interval = interval
+        self.enabled = enabled and total > 0
+        self.last = 0.0
+        self.lock = threading.Lock()
+
+    def update(self, current: int):
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        if current < self.total and now - self.last < self.interval:
+            return
+        with self.lock:
+            self.last = now
+            print_progress_bar(current, self.total, self.label)
@@ -0,0 +1,22 @@
+"""
+Анализ пачки постов: категории и тональность.
+
+Вынесен из services.stream_ingest, чтобы воркер классификации
+(services.classify_worker) не импортировал хранилище постов.
+"""
+
+from core.categorizer import classify_and_analyze
+from core.sentimenter import analyze_sentiment_batch
+
+
+def analyze_batch(posts: list) -> list:
+    """
+    Классифицирует пачку постов и определяет их тональность.
+    """
+    analyzed = classify_and_analyze(posts)
+    sentiments = analyze_sentiment_batch([(post.get("text", ""), post) for post in analyzed])
+    for source, post, (label, score) in zip(posts, analyzed, sentiments):
+        post["sentiment"], post["sentiment_score"] = label, score
+        if source.get("edited_at"):
+            post["edited_at"] = source["edited_at"]
+    return analyzed
@@ -0,0 +1,285 @@
+"""
+Каскадный режим классификации.
+
+Пост сначала проходит поиск по ключевым словам (в core.categorizer), затем
+маленькую модель уровня rubert-tiny2, и только если её уверенность ниже
+откалиброванного порога — базовую модель rubert-base. Статистика эскалаций
+и совпадений с базовой моделью (по выборочным теневым прогонам) позволяет
+подбирать пороги под нужный баланс скорости и качества.
+
+Калибровка порогов по постам из хранилища:
+    python -m core.cascade --limit 500 --target 0.95
+"""
+
+import argparse
+import json
+import random
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+
+from transformers import pipeline
+
+from config.config import (
+    INFERENCE_MODE,
+    INFERENCE_BACKEND,
+    CASCADE_CATEGORY_THRESHOLD,
+    CASCADE_SENTIMENT_THRESHOLD,
+    CASCADE_SHADOW_RATE,
+    SHARED_WEIGHTS,
+)
+from config.logger import logger
+from core import preprocessing, shared_weights
+from services.model_registry import directory_version
+from shared.constants import CATEGORIES
+
+MODELS_DIR = Path(__file__).parent.parent / "local_models"
+CATEGORY_TINY_DIR = MODELS_DIR / "category_classifier_tiny"
+SENTIMENT_TINY_DIR = MODELS_DIR / "sentiment_classifier_tiny"
+THRESHOLDS_FILE = MODELS_DIR / "cascade_thresholds.json"
+
+category_tiny = None
+sentiment_tiny = None
+thresholds = {
+    "category": CASCADE_CATEGORY_THRESHOLD,
+    "sentiment": CASCADE_SENTIMENT_THRESHOLD,
+}
+
+
+class CascadeStats:
+    """
+    Счётчики каскада по одной задаче (категории или тональность).
+    """
+
+    def __init__(self, task: str):
+        self.task = task
+        self.lock = threading.Lock()
+        self.total = 0
+        self.accepted = 0      # решено маленькой моделью
+        self.escalated = 0     # передано базовой модели
+        self.shadow = 0        # теневых прогонов базовой модели
+        self.agreed = 0        # из них совпало с маленькой моделью
+
+    def record(self, escalated: bool):
+        with self.lock:
+            self.total += 1
+            if escalated:
+                self.escalated += 1
+            else:
+                self.accepted += 1
+
+    def record_shadow(self, agreed: bool):
+        with self.lock:
+            self.shadow += 1
+            self.agreed += int(agreed)
+
+    def summary(self) -> dict:
+        with self.lock:
+            return {
+                "total": self.total,
+                "escalation_rate": self.escalated / self.total if self.total else 0.0,
+                "agreement": self.agreed / self.shadow if self.shadow else None,
+                "shadow_runs": self.shadow,
+            }
+
+
+stats = {
+    "category": CascadeStats("category"),
+    "sentiment": CascadeStats("sentiment"),
+}
+
+
+def load_models():
+    global category_tiny, sentiment_tiny
+    if THRESHOLDS_FILE.exists():
+        try:
+            with open(THRESHOLDS_FILE, "r", encoding="utf-8") as f:
+                thresholds.update(json.load(f))
+            logger.info(f"Пороги каскада загружены из {THRESHOLDS_FILE}: {thresholds}")
+        except Exception as e:
+            logger.error(f"Ошибка чтения порогов каскада: {e}")
+
+    try:
+        category_tiny = pipeline("text-classification", model=str(CATEGORY_TINY_DIR), top_k=None, device=-1)
+        if category_tiny.model.config.problem_type != "multi_label_classification":
+            # Оценки softmax-модели делят единицу между категориями и несравнимы с порогом
+            # независимых оценок базовой модели
+            category_tiny = None
+            raise ValueError("модель обучена с одной категорией на пост (softmax), "
+                             "переобучите её: python learning/distill_student.py --task category")
+        if SHARED_WEIGHTS:
+            shared_weights.share_weights(category_tiny.model, CATEGORY_TINY_DIR, "category_classifier_tiny",
+                                         directory_version(CATEGORY_TINY_DIR))
+        logger.info("Маленький категорийный классификатор загружен")
+    except Exception as e:
+        logger.warning(f"Маленький категорийный классификатор недоступен, все посты идут в базовую модель: {e}")
+
+    try:
+        sentiment_tiny = pipeline("text-classification", model=str(SENTIMENT_TINY_DIR), top_k=None, device=-1)
+        if SHARED_WEIGHTS:
+            shared_weights.share_weights(sentiment_tiny.model, SENTIMENT_TINY_DIR, "sentiment_classifier_tiny",
+                                         directory_version(SENTIMENT_TINY_DIR))
+        logger.info("Маленький классификатор тональности загружен (seara/rubert-tiny2-russian-sentiment)")
+    except Exception as e:
+        logger.warning(f"Маленький классификатор тональности недоступен, все посты идут в базовую модель: {e}")
+
+
+def tiny_input(text: str, post: dict = None) -> str:
+    # У rubert-tiny2 свой словарь, поэтому используем нормализованный текст, а не общие input_ids
+    return preprocessing.model_text(text, post, limit=2048)
+
+
+def tiny_scores(model, text: str) -> list:
+    """
+    Для категорийной модели вероятности независимы по категориям (сигмоида, multi-label),
+    как у zero-shot базовой модели с multi_label=True.
+    :return: Список (метка, вероятность), отсортированный по убыванию
+    """
+    res = model(text, truncation=True)
+    # В зависимости от версии transformers результат может быть вложен в список
+    if res and isinstance(res[0], list):
+        res = res[0]
+    return sorted(((r["label"], r["score"]) for r in res), key=lambda x: x[1], reverse=True)
+
+
+def category_scores(text: str, post: dict, base) -> list:
+    """
+    Оценки категорий через каскад.
+    :param base: Функция (text, post) -> [(категория, оценка)] базовой модели
+    :return: Список (категория, оценка)
+    """
+    task_stats = stats["category"]
+    if category_tiny is None:
+        task_stats.record(escalated=True)
+        return base(text, post)
+
+    scores = [(label, score) for label, score in tiny_scores(category_tiny, tiny_input(text, post))
+              if label in CATEGORIES]
+    confidence = scores[0][1] if scores else 0.0
+    if confidence < thresholds["category"]:
+        task_stats.record(escalated=True)
+        return base(text, post)
+
+    task_stats.record(escalated=False)
+    if random.random() < CASCADE_SHADOW_RATE:
+        base_scores = base(text, post)
+        base_top = max(base_scores, key=lambda x: x[1])[0] if base_scores else None
+        task_stats.record_shadow(base_top == scores[0][0])
+    return scores
+
+
+def sentiment(text: str, post: dict, base) -> tuple:
+    """
+    Тональность через каскад.
+    :param base: Функция (text, post) -> (метка, оценка) базовой модели
+    """
+    task_stats = stats["sentiment"]
+    if sentiment_tiny is None:
+        task_stats.record(escalated=True)
+        return base(text, post)
+
+    label, confidence = tiny_scores(sentiment_tiny, tiny_input(text, post))[0]
+    if confidence < thresholds["sentiment"]:
+        task_stats.record(escalated=True)
+        return base(text, post)
+
+    task_stats.record(escalated=False)
+    if random.random() < CASCADE_SHADOW_RATE:
+        base_label, _ = base(text, post)
+        task_stats.record_shadow(normalize_sentiment(base_label) == normalize_sentiment(label))
+    return label.upper(), confidence
+
+
+def normalize_sentiment(label: str) -> str:
+    """
+    Приводит метки разных моделей тональности к POSITIVE/NEUTRAL/NEGATIVE.
+    """
+    label = (label or "").upper()
+    return {"LABEL_0": "POSITIVE", "LABEL_1": "NEUTRAL", "LABEL_2": "NEGATIVE"}.get(label, label)
+
+
+def log_stats():
+    lines = []
+    for task, task_stats in stats.items():
+        s = task_stats.summary()
+        if not s["total"]:
+            continue
+        agreement = f"{s['agreement']:.1%}" if s["agreement"] is not None else "нет данных"
+        lines.append(
+            f"{task}: постов {s['total']}, эскалаций {s['escalation_rate']:.1%}, "
+            f"совпадение с базовой моделью {agreement} ({s['shadow_runs']} проверок), "
+            f"порог {thresholds[task]:.2f}"
+        )
+    if lines:
+        logger.info("Статистика каскада:\n" + "\n".join(lines))
+
+
+def calibrate_threshold(samples: list, target_agreement: float) -> float:
+    """
+    Подбирает минимальный порог уверенности, при котором доля совпадений
+    маленькой модели с базовой среди принятых ею постов не ниже target_agreement.
+    :param samples: Список (уверенность маленькой модели, совпало ли с базовой)
+    """
+    if not samples:
+        return 1.0
+    ordered = sorted(samples, key=lambda x: x[0], reverse=True)
+    best = 1.0
+    agreed = 0
+    for n, (confidence, ok) in enumerate(ordered, 1):
+        agreed += int(ok)
+        if agreed / n >= target_agreement:
+            best = confidence
+    return best
+
+
+def calibrate(limit: int, target_agreement: float):
+    """
+    Прогоняет посты из хранилища через обе модели и сохраняет пороги в THRESHOLDS_FILE.
+    """
+    # Импорт здесь: categorizer и sentimenter сами импортируют этот модуль
+    from core import categorizer, sentimenter
+    from services.post_store import post_store
+
+    posts = post_store.query(since=datetime.fromtimestamp(0, timezone.utc))[:limit]
+    if not posts:
+        logger.error("В хранилище нет постов для калибровки")
+        return
+
+    samples = {"category": [], "sentiment": []}
+    for post in posts:
+        text = post.get("text", "")
+        if category_tiny is not None:
+            tiny = [s for s in tiny_scores(category_tiny, tiny_input(text, post)) if s[0] in CATEGORIES]
+            base = categorizer.base_category_scores(text, post)
+            if tiny and base:
+                samples["category"].append((tiny[0][1], tiny[0][0] == max(base, key=lambda x: x[1])[0]))
+        if sentiment_tiny is not None:
+            label, confidence = tiny_scores(sentiment_tiny, tiny_input(text, post))[0]
+            base_label, _ = sentimenter.base_sentiment(text, post)
+            samples["sentiment"].append(
+                (confidence, normalize_sentiment(label) == normalize_sentiment(base_label))
+            )
+
+    for task, task_samples in samples.items():
+        if task_samples:
+            thresholds[task] = calibrate_threshold(task_samples, target_agreement)
+            accepted = sum(1 for c, _ in task_samples if c >= thresholds[task]) / len(task_samples)
+            logger.info(f"{task}: порог {thresholds[task]:.3f}, маленькая модель решит {accepted:.1%} постов")
+
+    with open(THRESHOLDS_FILE, "w", encoding="utf-8") as f:
+        json.dump(thresholds, f, indent=2)
+    logger.info(f"Пороги каскада сохранены в {THRESHOLDS_FILE}")
+
+
+# Маленькие модели нужны только в каскадном режиме и только там, где выполняется инференс
+if INFERENCE_MODE == "cascade" and INFERENCE_BACKEND == "local":
+    load_models()
+
+if __name__ == "__main__":
+    if INFERENCE_MODE != "cascade":
+        load_models()
+    parser = argparse.ArgumentParser(description="Калибровка порогов каскада")
+    parser.add_argument("--limit", type=int, default=500, help="Сколько постов из хранилища использовать")
+    parser.add_argument("--target", type=float, default=0.95, help="Требуемая доля совпадений с базовой моделью")
+    args = parser.parse_args()
+    calibrate(args.limit, args.target)
@@ -1,6 +1,11 @@
 import warnings
+import torch
 from transformers import pipeline, logging as transformers_logging
-from config.logger import logger, print_progress_bar
+from config.logger import logger, ProgressReporter
+from core import preprocessing, cascade, shared_weights
+from services import inference_client, model_registry
+from config.config import INFERENCE_MODE, INFERENCE_BACKEND, SHARED_WEIGHTS
+from services.profiler import span
 from collections import Counter
 from pathlib import Path
 import json
@@ -12,24 +17,134 @@ from shared.constants import CATEGORY_KEYWORDS, CATEGORIES  # импортиру
 warnings.filterwarnings("ignore")
 transformers_logging.set_verbosity_error()
 
+# Рабочая модель. Подменяется целиком при горячей перезагрузке (services.model_registry),
+# поэтому функции берут её в локальную переменную один раз на вызов.
 category_classifier = None
+# Шаблон гипотезы zero-shot pipeline по умолчанию
+HYPOTHESIS_TEMPLATE = "This example is {}."
+MODEL_PATH = model_registry.MODEL_DIRS["category"]
+WARMUP_TEXT = "Центробанк сохранил ключевую ставку, рынки отреагировали ростом."
+# Сколько постов classify_and_analyze отправляет в модель одним батчем
+SCORE_BATCH = 32
 MEMORY_DIR = Path(__file__).parent.parent / "category_memory"
 MEMORY_DIR.mkdir(parents=True, exist_ok=True)
 LOCK = threading.Lock()
 
+def build_classifier(model_path: Path = MODEL_PATH):
+    """
+    Загружает pipeline и всё, что нужно для классификации по общим input_ids.
+    Состояние модели хранится в атрибутах pipeline (version, shared_input_ids,
+    hypothesis_ids, entailment_id), чтобы запрос не смешал две версии модели.
+    """
+    version = model_registry.directory_version(model_path)
+    classifier = pipeline(
+        "zero-shot-classification",
+        model=str(model_path),
+        device=-1
+    )
+    classifier.version = version
+    if SHARED_WEIGHTS:
+        shared_weights.share_weights(classifier.model, model_path, "category_classifier", version)
+    prepare_shared_inputs(classifier)
+    return classifier
+
 def load_models():
     global category_classifier
     try:
-        model_path = Path(__file__).parent.parent / "local_models" / "category_classifier"
-        category_classifier = pipeline(
-            "zero-shot-classification",
-            model=str(model_path),
-            device=-1
-        )
-        logger.info("Категорийный классификатор загружен (DeepPavlov/rubert-base-cased)")
+        category_classifier = build_classifier()
+        model_registry.set_version("category", category_classifier.version)
+        logger.info(f"Категорийный классификатор загружен (DeepPavlov/rubert-base-cased), "
+                    f"версия {category_classifier.version}")
     except Exception as e:
         logger.error(f"Ошибка загрузки классификатора: {e}")
 
+def reload_models() -> bool:
+    """
+    Загружает и прогревает новую версию модели, затем подменяет рабочую.
+    При ошибке рабочая модель остаётся прежней.
+    :return: True, если модель заменена
+    """
+    global category_classifier
+    try:
+        classifier = build_classifier()
+        classifier(WARMUP_TEXT, candidate_labels=CATEGORIES, multi_label=True)
+    except Exception as e:
+        logger.error(f"Новая версия категорийного классификатора не загружена, работает прежняя: {e}")
+        return False
+    category_classifier = classifier
+    model_registry.set_version("category", classifier.version)
+    logger.info(f"Категорийный классификатор заменён на версию {classifier.version}")
+    return True
+
+def prepare_shared_inputs(classifier):
+    """
+    Если словарь модели совпадает с общим токенизатором, заранее кодирует гипотезы
+    для всех категорий, чтобы классифицировать посты по готовым input_ids.
+    """
+    tokenizer = classifier.tokenizer
+    classifier.shared_input_ids = preprocessing.shares_vocabulary(tokenizer)
+    classifier.hypothesis_ids = {}
+    classifier.entailment_id = -1
+    if not classifier.shared_input_ids:
+        logger.info("Словарь категорийного классификатора отличается от общего, используется токенизация pipeline")
+        return
+    classifier.hypothesis_ids = {
+        category: tokenizer(HYPOTHESIS_TEMPLATE.format(category), add_special_tokens=False)["input_ids"]
+        for category in CATEGORIES
+    }
+    label2id = classifier.model.config.label2id
+    classifier.entailment_id = next(
+        (idx for label, idx in label2id.items() if label.lower().startswith("entail")), -1
+    )
+
+def uses_shared_inputs(classifier, post: dict) -> bool:
+    return bool(classifier is not None and classifier.shared_input_ids and post
+                and post.get("tokenizer_id") == preprocessing.tokenizer_id and post.get("input_ids"))
+
+def zero_shot_from_ids(input_ids: list, classifier=None) -> list:
+    """
+    Zero-shot классификация по готовым input_ids поста (без служебных токенов).
+    Повторяет логику pipeline с multi_label=True: для каждой категории пара
+    (пост, гипотеза), оценка — softmax по логитам [противоречие, следование].
+    :return: Список (категория, уверенность)
+    """
+    return zero_shot_from_ids_batch([input_ids], classifier)[0]
+
+def zero_shot_from_ids_batch(input_ids_list: list, classifier=None) -> list:
+    """
+    То же, что zero_shot_from_ids, для нескольких постов одним проходом модели.
+    :param classifier: Модель, взятая вызывающим (по умолчанию рабочая)
+    :return: Для каждого поста список (категория, уверенность)
+    """
+    if classifier is None:
+        classifier = category_classifier
+    tokenizer = classifier.tokenizer
+    hypothesis_ids = classifier.hypothesis_ids
+    entailment_id = classifier.entailment_id
+    longest = max(len(ids) for ids in hypothesis_ids.values())
+
+    sequences, token_types = [], []
+    for input_ids in input_ids_list:
+        premise = input_ids[:preprocessing.MAX_MODEL_TOKENS - 3 - longest]
+        for c in CATEGORIES:
+            sequences.append(tokenizer.build_inputs_with_special_tokens(premise, hypothesis_ids[c]))
+            token_types.append(tokenizer.create_token_type_ids_from_sequences(premise, hypothesis_ids[c]))
+    length = max(len(seq) for seq in sequences)
+    pad = tokenizer.pad_token_id or 0
+
+    ids_tensor = torch.tensor([seq + [pad] * (length - len(seq)) for seq in sequences])
+    types_tensor = torch.tensor([types + [0] * (length - len(types)) for types in token_types])
+    mask_tensor = torch.tensor([[1] * len(seq) + [0] * (length - len(seq)) for seq in sequences])
+
+    with torch.no_grad():
+        logits = classifier.model(
+            input_ids=ids_tensor, attention_mask=mask_tensor, token_type_ids=types_tensor
+        ).logits
+    contradiction_id = -1 if entailment_id == 0 else 0
+    scores = logits[:, [contradiction_id, entailment_id]].softmax(dim=-1)[:, 1].tolist()
+    n = len(CATEGORIES)
+    return [list(zip(CATEGORIES, scores[i * n:(i + 1) * n])) for i in range(len(input_ids_list))]
+
 def contains_keywords(text: str, keywords: list) -> bool:
     text_lower = text.lower()
     return any(keyword.lower() in text_lower for keyword in keywords)
@@ -37,7 +152,7 @@ def contains_keywords(text: str, keywords: list) -> bool:
 def save_to_memory(post: dict, assigned_categories: list):
     try:
         with LOCK:
-            post_copy = post.copy()
+            post_copy = {k: v for k, v in post.items() if k not in ("input_ids", "clean_text", "tokenizer_id")}
             for key, value in post_copy.items():
                 if isinstance(value, datetime):
                     post_copy[key] = value.isoformat()
@@ -52,28 +167,101 @@ def save_to_memory(post: dict, assigned_categories: list):
     except Exception as e:
         logger.error(f"Ошибка при сохранении поста в память: {e}")
 
-def classify_post(text: str, post: dict = None, threshold: float = 0.6, max_categories: int = 2):
-    if category_classifier is None:
-        logger.warning("Категорийный классификатор не инициализирован")
-        return ["other"]
+def base_category_scores(text: str, post: dict = None) -> list:
+    """
+    Оценки категорий базовой моделью (zero-shot).
+    :return: Список (категория, оценка)
+    """
+    classifier = category_classifier
+    if uses_shared_inputs(classifier, post):
+        return zero_shot_from_ids(post["input_ids"], classifier)
+    truncated_text = preprocessing.model_text(text, post)
+    res = classifier(truncated_text, candidate_labels=CATEGORIES, multi_label=True)
+    return list(zip(res['labels'], res['scores']))
 
-    text_lower = text.lower()
+def model_category_scores(text: str, post: dict = None) -> list:
+    """
+    Оценки категорий локальными моделями с учётом режима инференса (base или cascade).
+    """
+    if INFERENCE_MODE == "cascade":
+        return cascade.category_scores(text, post, base=base_category_scores)
+    return base_category_scores(text, post)
+
+def category_scores_batch(items: list, classifier=None) -> list:
+    """
+    Оценки категорий для нескольких постов. В базовом режиме посты с общими
+    input_ids классифицируются одним проходом модели.
+    :param items: Список (text, post)
+    :param classifier: Модель, взятая вызывающим (по умолчанию рабочая)
+    :return: Для каждого поста список (категория, оценка)
+    """
+    if classifier is None:
+        classifier = category_classifier
+    results = [None] * len(items)
+    batched = []
+    for i, (text, post) in enumerate(items):
+        if INFERENCE_MODE != "cascade" and uses_shared_inputs(classifier, post):
+            batched.append(i)
+        else:
+            results[i] = model_category_scores(text, post)
+    if batched:
+        with span("category_batch", size=len(batched)):
+            scores = zero_shot_from_ids_batch([items[i][1]["input_ids"] for i in batched], classifier)
+        for i, item_scores in zip(batched, scores):
+            results[i] = item_scores
+    return results
 
+def keyword_categories(text: str, max_categories: int = 2) -> list:
+    """
+    Категории, найденные по ключевым словам (не больше max_categories).
+    """
+    text_lower = text.lower()
     matched_categories = []
-    # Поиск категорий по ключевым словам
     for category in CATEGORIES:
         keywords = CATEGORY_KEYWORDS.get(category, [])
         if contains_keywords(text_lower, keywords):
             matched_categories.append(category)
         if len(matched_categories) == max_categories:
             break
+    return matched_categories
+
+def category_inference_batch(items: list) -> list:
+    """
+    Оценки категорий моделью для пачки постов: одним запросом к серверу
+    инференса или батчем локальной модели.
+    :param items: Список (text, post)
+    :return: Для каждого поста список (категория, оценка)
+    """
+    return category_inference_versioned(items)[0]
+
+def category_inference_versioned(items: list) -> tuple:
+    """
+    То же, что category_inference_batch, вместе с версиями модели, посчитавшей оценки.
+    :return: (для каждого поста список (категория, оценка), версия модели для каждого поста)
+    """
+    with span("category_inference", backend=INFERENCE_BACKEND, posts=len(items)):
+        if INFERENCE_BACKEND == "remote":
+            return inference_client.category_scores_versioned(items)
+        classifier = category_classifier
+        return category_scores_batch(items, classifier), [classifier.version] * len(items)
+
+def classify_post(text: str, post: dict = None, threshold: float = 0.6, max_categories: int = 2,
+                  labels_scores: list = None):
+    """
+    :param labels_scores: Оценки модели, уже посчитанные батчем (иначе модель вызывается для поста)
+    """
+    if category_classifier is None and INFERENCE_BACKEND == "local":
+        logger.warning("Категорийный классификатор не инициализирован")
+        return ["other"]
+
+    # Поиск категорий по ключевым словам
+    matched_categories = keyword_categories(text, max_categories)
 
     if len(matched_categories) < max_categories:
         # Если категорий меньше max_categories, дополняем классификатором
         try:
-            truncated_text = text[:512]
-            res = category_classifier(truncated_text, candidate_labels=CATEGORIES, multi_label=True)
-            labels_scores = list(zip(res['labels'], res['scores']))
+            if labels_scores is None:
+                labels_scores = category_inference_batch([(text, post)])[0]
             # Отфильтровать категории, уже найденные по ключевым словам
             labels_scores = [ls for ls in labels_scores if ls[0] not in matched_categories]
             # Отсортировать по уверенности
@@ -96,25 +284,72 @@ def classify_post(text: str, post: dict = None, threshold: float = 0.6, max_cate
 
     return matched_categories
 
-def classify_and_analyze(news_list, threshold=0.6, max_categories=2):
+def score_batch(news_list: list, start: int, max_categories: int) -> tuple:
+    """
+    Считает батчем оценки модели для постов news_list[start - 1:start - 1 + SCORE_BATCH],
+    которым не хватило категорий по ключевым словам.
+    :return: ({номер поста с 1: список (категория, оценка)}, {номер поста: версия модели});
+        при ошибке модели оценки — None, и classify_post повторит инференс для поста отдельно
+    """
+    numbered = list(enumerate(news_list[start - 1:start - 1 + SCORE_BATCH], start))
+    if category_classifier is None and INFERENCE_BACKEND == "local":
+        return {i: None for i, _ in numbered}, {}
+    pending = [(i, news) for i, news in numbered
+               if len(keyword_categories(news.get('text', ''), max_categories)) < max_categories]
+    scores = {i: [] for i, _ in numbered}
+    if not pending:
+        return scores, {}
+    try:
+        results, versions = category_inference_versioned([(news.get('text', ''), news) for _, news in pending])
+    except Exception as e:
+        logger.error(f"Ошибка при классификации пачки постов: {e}")
+        return {i: None for i, _ in numbered}, {}
+    scores.update((i, result) for (i, _), result in zip(pending, results))
+    return scores, {i: version for (i, _), version in zip(pending, versions) if version}
+
+def classify_and_analyze(news_list, threshold=0.6, max_categories=2, cancel=None):
+    """
+    Классифицирует посты по категориям.
+    :param cancel: threading.Event; если установлен, классификация прекращается
+        между постами и возвращаются уже готовые результаты
+    """
     total = len(news_list)
     results = []
+    # Нормализация и токенизация один раз на пост, общие для всех моделей
+    with span("preprocess", posts=total):
+        preprocessing.preprocess_posts(news_list)
     category_counts = Counter()
+    progress = ProgressReporter(total)
+    # Версия моделей, которой посчитаны результаты: по ней устаревшие результаты пересчитываются.
+    # Для постов, оценённых моделью, берётся версия модели, посчитавшей оценки
+    model_version = model_registry.combined_version()
+    batch_scores, batch_versions = {}, {}
 
     for i, news in enumerate(news_list, 1):
+        if cancel is not None and cancel.is_set():
+            logger.info(f"Классификация прервана после {i - 1} из {total} постов")
+            break
+        if i not in batch_scores:
+            batch_scores, batch_versions = score_batch(news_list, i, max_categories)
         text = news.get('text', '')
-        categories = classify_post(text, post=news, threshold=threshold, max_categories=max_categories)
+        categories = classify_post(text, post=news, threshold=threshold, max_categories=max_categories,
+                                   labels_scores=batch_scores.get(i))
         results.append({
             "text": text,
             "categories": categories,
             "created_at": news.get('created_at'),
             "url": news.get('url'),
             "channel": news.get('channel'),
+            "message_id": news.get('message_id'),
+            "input_ids": news.get('input_ids'),
+            "tokenizer_id": news.get('tokenizer_id'),
+            "model_version": (model_registry.combined_version({"category": batch_versions[i]})
+                              if i in batch_versions else model_version),
         })
         for cat in categories:
             category_counts[cat] += 1
 
-        print_progress_bar(i, total)
+        progress.update(i)
 
     GREEN = "\033[92m"
     RESET = "\033[0m"
@@ -124,7 +359,11 @@ def classify_and_analyze(news_list, threshold=0.6, max_categories=2):
     else:
         logger.info(f"{GREEN}Постов не найдено ни в одной категории.{RESET}")
 
+    if INFERENCE_MODE == "cascade" and INFERENCE_BACKEND == "local":
+        cascade.log_stats()
+
     return results
 
-# Загружаем модель при импорте
-load_models()
\ No newline at end of file
+# Загружаем модель при импорте (с сервером инференса модели держит только он)
+if INFERENCE_BACKEND == "local":
+    load_models()
\ No newline at end of file
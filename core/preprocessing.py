@@ -0,0 +1,132 @@
+"""
+Общая предобработка постов перед классификацией.
+
+Текст нормализуется один раз (убираются ссылки, эмодзи и разметка),
+токенизируется один раз с обрезкой по числу токенов, а не символов,
+и полученные input_ids используются всеми моделями с тем же словарём
+(категорийный и тональный классификаторы — производные rubert-base-cased).
+"""
+
+import hashlib
+import re
+from pathlib import Path
+
+from transformers import AutoTokenizer
+
+from config.logger import logger
+
+# Лимит модели с учётом служебных токенов [CLS] и [SEP]
+MAX_MODEL_TOKENS = 512
+MAX_TEXT_TOKENS = MAX_MODEL_TOKENS - 2
+# Поля, которые preprocess_posts добавляет к посту
+MODEL_INPUT_FIELDS = ("clean_text", "input_ids", "tokenizer_id")
+
+TOKENIZER_DIR = Path(__file__).parent.parent / "local_models" / "category_classifier"
+
+URL_PATTERN = re.compile(r"https?://\S+|www\.\S+|t\.me/\S+", flags=re.IGNORECASE)
+EMOJI_PATTERN = re.compile(
+    "["
+    "\U0001F000-\U0001FAFF"  # emoticons, pictographs, transport, flags и др.
+    "\u2600-\u26FF\u2700-\u27BF"  # misc symbols, dingbats
+    "\uFE0F\u200D"  # вариационный селектор и ZWJ из составных эмодзи
+    "]", flags=re.UNICODE)
+MARKUP_PATTERN = re.compile(r"\*\*|__|~~|`+|\|\||<[^>]+>")
+SPACES_PATTERN = re.compile(r"[ \t\u00A0]+")
+NEWLINES_PATTERN = re.compile(r"\n{2,}")
+
+tokenizer = None
+tokenizer_id = None
+
+
+def tokenizer_fingerprint(tok) -> str:
+    """
+    Отпечаток словаря токенизатора: модели с одинаковым отпечатком могут
+    получать одни и те же input_ids.
+    """
+    vocab = sorted(tok.get_vocab().items(), key=lambda item: item[1])
+    digest = hashlib.sha1()
+    for token, idx in vocab:
+        digest.update(f"{idx}\t{token}\n".encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def load_tokenizer():
+    global tokenizer, tokenizer_id
+    try:
+        tokenizer = AutoTokenizer.from_pretrained(str(TOKENIZER_DIR))
+        tokenizer_id = tokenizer_fingerprint(tokenizer)
+        logger.info(f"Общий токенизатор загружен (словарь {tokenizer_id})")
+    except Exception as e:
+        logger.error(f"Ошибка загрузки общего токенизатора: {e}")
+
+
+def normalize_text(text: str) -> str:
+    """
+    Убирает ссылки, эмодзи и разметку, схлопывает пробелы.
+    """
+    text = URL_PATTERN.sub(" ", text)
+    text = EMOJI_PATTERN.sub("", text)
+    text = MARKUP_PATTERN.sub("", text)
+    text = SPACES_PATTERN.sub(" ", text)
+    text = "\n".join(line.strip() for line in text.split("\n"))
+    text = NEWLINES_PATTERN.sub("\n", text)
+    return text.strip()
+
+
+def strip_model_inputs(post: dict) -> dict:
+    """
+    Копия поста без полей предобработки (например, для хранения в состоянии FSM).
+    """
+    return {k: v for k, v in post.items() if k not in MODEL_INPUT_FIELDS}
+
+
+def model_text(text: str, post: dict = None, limit: int = 512) -> str:
+    """
+    Нормализованный текст для моделей, которые токенизируют текст сами
+    (пост без общих input_ids, модель с другим словарём).
+    Если после нормализации текста не осталось, возвращается исходный.
+    """
+    clean_text = (post or {}).get("clean_text") or normalize_text(text or "") or text or ""
+    return clean_text[:limit]
+
+
+def preprocess_posts(posts: list) -> list:
+    """
+    Добавляет к постам 'clean_text', 'input_ids' и 'tokenizer_id'.
+    Посты, уже закодированные тем же токенизатором (например, из хранилища), не перекодируются.
+    Токенизация выполняется одним батчем.
+    """
+    if tokenizer is None:
+        return posts
+
+    pending = [p for p in posts if p.get("tokenizer_id") != tokenizer_id or not p.get("input_ids")]
+    if not pending:
+        return posts
+
+    clean_texts = [normalize_text(p.get("text", "")) for p in pending]
+    encodings = tokenizer(
+        clean_texts,
+        add_special_tokens=False,
+        truncation=True,
+        max_length=MAX_TEXT_TOKENS,
+    )["input_ids"]
+    for post, clean_text, input_ids in zip(pending, clean_texts, encodings):
+        post["clean_text"] = clean_text
+        post["input_ids"] = input_ids
+        post["tokenizer_id"] = tokenizer_id
+    return posts
+
+
+def shares_vocabulary(tok) -> bool:
+    """
+    Проверяет, может ли модель с токенизатором tok использовать общие input_ids.
+    """
+    if tokenizer is None or tok is None:
+        return False
+    try:
+        return tokenizer_fingerprint(tok) == tokenizer_id
+    except Exception:
+        return False
+
+
+load_tokenizer()
@@ -1,9 +1,17 @@
+import multiprocessing
 import os
 import re
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
+from pypdf import PdfWriter
 from weasyprint import HTML
 from shared.constants import CATEGORY_LABELS
-from config.logger import logger  # импортируем логгер
+from config.config import PDF_CHUNK_POSTS, PDF_RENDER_WORKERS, PDF_PART_MAX_MB
+from config.logger import child_log_queue, init_child_logging, logger  # импортируем логгер
+from services.profiler import span
 
 
 def clean_text(text: str) -> str:
@@ -58,40 +66,53 @@ def extract_first_paragraph(text: str) -> str:
     return clean_text(remove_links(text.strip()))
 
 
-def build_html_report(news: list, period: str, category: str) -> str:
-    """
-    Генерирует HTML-отчёт по новостям.
-    :param news: Список новостей (dict с 'text', 'created_at', 'url', 'sentiment').
-    :param period: 'day', 'week', 'month'
-    :param category: ключ категории
-    :return: Путь к HTML-файлу.
+SENTIMENT_LABELS = {
+    "POSITIVE": "Позитивная",
+    "NEGATIVE": "Негативная",
+    "NEUTRAL": "Нейтральная",
+    "LABEL_0": "Позитивная",
+    "LABEL_1": "Нейтральная",
+    "LABEL_2": "Негативная",
+}
+
+HTML_TEMPLATE = """
+    <html>
+    <head>
+      <meta charset="utf-8">
+      <style>
+        body {{ font-family: Arial, 'DejaVu Sans', sans-serif; font-size: 15px; margin: 2em; }}
+        h2 {{ margin-bottom: 1em; }}
+        a {{ color: blue; text-decoration: none; }}
+        a:hover {{ text-decoration: underline; }}
+        li {{ margin-bottom: 0.5em; }}
+      </style>
+    </head>
+    <body>
+      <h2>{title}</h2>
+      {items}
+    </body>
+    </html>
     """
-    if not os.path.exists("reports"):
-        os.makedirs("reports")
-        logger.info("Создана папка reports для отчетов")
 
-    SENTIMENT_LABELS = {
-        "POSITIVE": "Позитивная",
-        "NEGATIVE": "Негативная",
-        "NEUTRAL": "Нейтральная",
-        "LABEL_0": "Позитивная",
-        "LABEL_1": "Нейтральная",
-        "LABEL_2": "Негативная",
-    }
 
-    category_title = CATEGORY_LABELS.get(category, category)
-    items = ""
+def format_post_date(dt) -> str:
+    try:
+        if isinstance(dt, datetime):
+            return dt.strftime('%d.%m.%Y %H:%M')
+        if isinstance(dt, str):
+            return dt
+    except Exception:
+        pass
+    return "Дата неизвестна"
+
+
+def build_html_items(news: list) -> str:
+    """
+    Формирует HTML-блоки постов (без обёртки страницы).
+    """
+    items = []
     for n in news:
-        try:
-            dt = n.get('created_at')
-            if isinstance(dt, datetime):
-                dt_str = dt.strftime('%d.%m.%Y %H:%M')
-            elif isinstance(dt, str):
-                dt_str = dt
-            else:
-                dt_str = "Дата неизвестна"
-        except Exception:
-            dt_str = "Дата неизвестна"
+        dt_str = format_post_date(n.get('created_at'))
 
         url = n.get('url') or "Ссылка отсутствует"
         sentiment_raw = n.get('sentiment', 'неизвестна').upper()
@@ -101,7 +122,7 @@ def build_html_report(news: list, period: str, category: str) -> str:
         # Вместо полного текста выводим только первый абзац без ссылок
         text_clean = extract_first_paragraph(text_raw).replace('\n', '<br>')
 
-        items += (
+        items.append(
             f"<div style='margin-bottom:20px; border-bottom:1px solid #eee; padding-bottom:10px;'>"
             f"<b>{dt_str}</b><br>"
             f"{text_clean}<br>"
@@ -109,47 +130,227 @@ def build_html_report(news: list, period: str, category: str) -> str:
             f"— Тональность: {sentiment_str}"
             f"</div>"
         )
+    return "".join(items)
 
-    html = f"""
-    <html>
-    <head>
-      <meta charset="utf-8">
-      <style>
-        body {{ font-family: Arial, 'DejaVu Sans', sans-serif; font-size: 15px; margin: 2em; }}
-        h2 {{ margin-bottom: 1em; }}
-        a {{ color: blue; text-decoration: none; }}
-        a:hover {{ text-decoration: underline; }}
-      </style>
-    </head>
-    <body>
-      <h2>Отчёт по категории {category_title} за {period}</h2>
-      {items}
-    </body>
-    </html>
-    """
 
+def report_basename(period: str, category: str, report_id: str = None) -> str:
+    """
+    Базовое имя файлов отчёта (без расширения) в папке reports.
+    """
     safe_category = category.replace(" ", "_").lower()
-    filename_html = f"reports/posts_{datetime.now():%Y_%m_%d}_report_{safe_category}.html"
-    with open(filename_html, "w", encoding="utf-8") as f:
-        f.write(html)
-    logger.info(f"HTML отчет сохранён: {filename_html}")
-    return filename_html
+    suffix = f"_{period}_{report_id[:12]}" if report_id else ""
+    return f"reports/posts_{datetime.now():%Y_%m_%d}_report_{safe_category}{suffix}"
 
 
-def build_pdf_report(news: list, period: str, category: str) -> str:
+def write_html(path: str, title: str, items: str) -> str:
+    if not os.path.exists("reports"):
+        os.makedirs("reports")
+        logger.info("Создана папка reports для отчетов")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(HTML_TEMPLATE.format(title=title, items=items))
+    return path
+
+
+def build_html_report(news: list, period: str, category: str, report_id: str = None) -> str:
     """
-    Генерирует PDF-отчёт по новостям через HTML + WeasyPrint.
-    :param news: Список новостей.
+    Генерирует HTML-отчёт по новостям.
+    :param news: Список новостей (dict с 'text', 'created_at', 'url', 'sentiment').
     :param period: 'day', 'week', 'month'
     :param category: ключ категории
-    :return: Путь к PDF-файлу.
+    :param report_id: версия содержимого отчёта (добавляется к имени файла)
+    :return: Путь к HTML-файлу.
+    """
+    category_title = CATEGORY_LABELS.get(category, category)
+    with span("build_html", posts=len(news)):
+        filename_html = write_html(
+            report_basename(period, category, report_id) + ".html",
+            f"Отчёт по категории {category_title} за {period}",
+            build_html_items(news),
+        )
+    logger.info(f"HTML отчет сохранён: {filename_html}")
+    return filename_html
+
+
+def render_pdf(html_path: str, pdf_path: str) -> int:
+    """
+    Рендерит HTML в PDF. Выполняется в отдельном процессе.
+    :return: Количество страниц в PDF.
+    """
+    document = HTML(html_path).render()
+    document.write_pdf(pdf_path)
+    return len(document.pages)
+
+
+def build_toc_page(path: str, title: str, sections: list, page_offset: int) -> int:
+    """
+    Рендерит страницу оглавления: по строке на каждый фрагмент отчёта.
+    :param sections: Список (заголовок раздела, первая страница раздела без учёта оглавления)
+    :param page_offset: Сколько страниц занимает само оглавление
+    :return: Количество страниц оглавления.
+    """
+    rows = "".join(
+        f"<li>{section_title} — стр. {first_page + page_offset}</li>"
+        for section_title, first_page in sections
+    )
+    html_path = write_html(path.replace(".pdf", ".html"), title, f"<h3>Содержание</h3><ol>{rows}</ol>")
+    pages = render_pdf(html_path, path)
+    os.remove(html_path)
+    return pages
+
+
+def merge_pdf_chunks(chunks: list, pdf_path: str, title: str):
+    """
+    Склеивает отрендеренные фрагменты в один PDF с оглавлением и закладками.
+    :param chunks: Список dict {'pdf', 'pages', 'title'}
+    """
+    sections = []
+    first_page = 1
+    for chunk in chunks:
+        sections.append((chunk["title"], first_page))
+        first_page += chunk["pages"]
+
+    toc_path = pdf_path.replace(".pdf", "_toc.pdf")
+    toc_pages = build_toc_page(toc_path, title, sections, page_offset=1)
+    if toc_pages != 1:
+        # Оглавление не уместилось на одной странице — пересчитываем номера
+        build_toc_page(toc_path, title, sections, page_offset=toc_pages)
+
+    writer = PdfWriter()
+    writer.append(toc_path)
+    for chunk, (section_title, section_page) in zip(chunks, sections):
+        writer.append(chunk["pdf"])
+        writer.add_outline_item(section_title, section_page - 1 + toc_pages)
+    with open(pdf_path, "wb") as f:
+        writer.write(f)
+    os.remove(toc_path)
+
+
+def split_chunks_by_size(chunks: list, max_bytes: int) -> list:
+    """
+    Группирует фрагменты подряд так, чтобы каждая часть не превышала max_bytes.
+    """
+    parts = [[]]
+    size = 0
+    for chunk in chunks:
+        chunk_size = os.path.getsize(chunk["pdf"])
+        if parts[-1] and size + chunk_size > max_bytes:
+            parts.append([])
+            size = 0
+        parts[-1].append(chunk)
+        size += chunk_size
+    return parts
+
+
+_render_executors = {}
+_render_lock = threading.Lock()
+
+
+def render_executor(workers: int) -> ProcessPoolExecutor:
+    """
+    Пул процессов рендеринга, общий для всех отчётов с тем же числом процессов.
+    Процессы запускаются через spawn: fork процесса, где уже работают потоки torch,
+    токенизаторов и логирования, может зависнуть. Пул создаётся один раз, чтобы не
+    платить за запуск интерпретатора в каждом отчёте, и заодно ограничивает число
+    процессов рендеринга при одновременных отчётах.
+    """
+    with _render_lock:
+        executor = _render_executors.get(workers)
+        if executor is None:
+            executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                           initializer=init_child_logging, initargs=(child_log_queue(),))
+            _render_executors[workers] = executor
+        return executor
+
+
+def build_pdf_report_parts(news: list, period: str, category: str, report_id: str = None,
+                           chunk_posts: int = PDF_CHUNK_POSTS, workers: int = PDF_RENDER_WORKERS) -> list:
+    """
+    Генерирует PDF-отчёт. Небольшие отчёты рендерятся одним вызовом WeasyPrint,
+    большие — фрагментами по chunk_posts постов в параллельных процессах и
+    склеиваются с оглавлением. Если результат больше PDF_PART_MAX_MB,
+    отчёт делится на несколько PDF.
+    :param chunk_posts: Количество постов в одном фрагменте.
+    :param workers: Количество процессов для рендеринга.
+    :return: Список путей к PDF-файлам (обычно один).
     """
+    if len(news) <= chunk_posts:
+        return [build_pdf_report_single(news, period, category, report_id)]
+
+    basename = report_basename(period, category, report_id)
+    # Одинаковые одновременные запросы не должны делить временные файлы фрагментов
+    job = uuid.uuid4().hex[:8]
+    category_title = CATEGORY_LABELS.get(category, category)
+    title = f"Отчёт по категории {category_title} за {period}"
+
+    chunks = []
+    for i, start in enumerate(range(0, len(news), chunk_posts), 1):
+        part = news[start:start + chunk_posts]
+        section_title = (
+            f"Посты {start + 1}–{start + len(part)} "
+            f"({format_post_date(part[0].get('created_at'))} — {format_post_date(part[-1].get('created_at'))})"
+        )
+        with span("build_html", chunk=i, posts=len(part)):
+            html_path = write_html(f"{basename}_{job}_chunk{i}.html", f"{title}. {section_title}",
+                                   build_html_items(part))
+        chunks.append({"html": html_path, "pdf": html_path.replace(".html", ".pdf"), "title": section_title})
+
+    workers = max(1, min(workers, len(chunks)))
+    logger.info(f"Рендеринг отчёта: {len(news)} постов, {len(chunks)} фрагментов, процессов: {workers}")
     try:
-        html_path = build_html_report(news, period, category)
+        with span("render_pdf", chunks=len(chunks), workers=workers):
+            try:
+                pages = render_executor(workers).map(render_pdf, [c["html"] for c in chunks],
+                                                     [c["pdf"] for c in chunks])
+                for chunk, chunk_pages in zip(chunks, pages):
+                    chunk["pages"] = chunk_pages
+            except BrokenProcessPool:
+                # Процесс пула погиб — следующий отчёт получит новый пул
+                with _render_lock:
+                    _render_executors.pop(workers, None)
+                raise
+
+        parts = split_chunks_by_size(chunks, PDF_PART_MAX_MB * 1024 * 1024)
+        pdf_paths = []
+        for n, part in enumerate(parts, 1):
+            pdf_path = f"{basename}.pdf" if len(parts) == 1 else f"{basename}_part{n}.pdf"
+            part_title = title if len(parts) == 1 else f"{title} (часть {n} из {len(parts)})"
+            with span("merge_pdf", part=n, chunks=len(part)):
+                tmp_path = pdf_path.replace(".pdf", f"_{job}.tmp.pdf")
+                merge_pdf_chunks(part, tmp_path, part_title)
+                os.replace(tmp_path, pdf_path)
+            pdf_paths.append(pdf_path)
+    finally:
+        for chunk in chunks:
+            for path in (chunk["html"], chunk["pdf"]):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    logger.info(f"PDF отчет сформирован: {', '.join(pdf_paths)}")
+    return pdf_paths
+
+
+def build_pdf_report_single(news: list, period: str, category: str, report_id: str = None) -> str:
+    try:
+        html_path = build_html_report(news, period, category, report_id)
         pdf_path = html_path.replace(".html", ".pdf")
-        HTML(html_path).write_pdf(pdf_path)
+        tmp_path = pdf_path.replace(".pdf", f"_{uuid.uuid4().hex[:8]}.tmp.pdf")
+        with span("render_pdf", posts=len(news)):
+            HTML(html_path).write_pdf(tmp_path)
+        os.replace(tmp_path, pdf_path)
         logger.info(f"PDF отчет сформирован: {pdf_path}")
         return pdf_path
     except Exception as e:
         logger.error(f"Ошибка при формировании PDF отчёта: {e}")
-        raise
\ No newline at end of file
+        raise
+
+
+def build_pdf_report(news: list, period: str, category: str, report_id: str = None) -> str:
+    """
+    Генерирует PDF-отчёт по новостям через HTML + WeasyPrint.
+    :param news: Список новостей.
+    :param period: 'day', 'week', 'month'
+    :param category: ключ категории
+    :param report_id: версия содержимого отчёта (добавляется к имени файла)
+    :return: Путь к PDF-файлу (первой части, если отчёт разбит на несколько).
+    """
+    return build_pdf_report_parts(news, period, category, report_id)[0]
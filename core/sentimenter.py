@@ -1,39 +1,180 @@
 import warnings
+import torch
 from transformers import pipeline, logging as transformers_logging
 from config.logger import logger
+from core import preprocessing, cascade, shared_weights
+from services import inference_client, model_registry
+from config.config import INFERENCE_MODE, INFERENCE_BACKEND, SHARED_WEIGHTS
+from services.profiler import span
 
 warnings.filterwarnings("ignore")
 transformers_logging.set_verbosity_error()
 
+# Рабочая модель. Подменяется целиком при горячей перезагрузке (services.model_registry),
+# поэтому функции берут её в локальную переменную один раз на вызов.
 sentiment_classifier = None
+MODEL_PATH = model_registry.MODEL_DIRS["sentiment"]
+WARMUP_TEXT = "Отличные новости: проект запущен в срок."
+
+def build_classifier(model_path=MODEL_PATH):
+    """
+    Загружает pipeline; версия и совместимость с общими input_ids хранятся в его атрибутах.
+    """
+    version = model_registry.directory_version(model_path)
+    classifier = pipeline(
+        "sentiment-analysis",
+        model=str(model_path),
+        device=-1
+    )
+    classifier.version = version
+    if SHARED_WEIGHTS:
+        shared_weights.share_weights(classifier.model, model_path, "sentiment_classifier", version)
+    # Можно ли передавать модели общие input_ids из core.preprocessing
+    classifier.shared_input_ids = preprocessing.shares_vocabulary(classifier.tokenizer)
+    return classifier
 
 def load_models():
     global sentiment_classifier
 
-    base_dir = "./local_models"
-
     try:
-        sentiment_classifier = pipeline(
-            "sentiment-analysis",
-            model=f"{base_dir}/sentiment_classifier",
-            device=-1
-        )
-        logger.info("Классификатор тональности загружен (blanchefort rubert-base-cased-sentiment-rusentiment)")
+        sentiment_classifier = build_classifier()
+        model_registry.set_version("sentiment", sentiment_classifier.version)
+        logger.info(f"Классификатор тональности загружен (blanchefort rubert-base-cased-sentiment-rusentiment), "
+                    f"версия {sentiment_classifier.version}")
     except Exception as e:
         logger.error(f"Ошибка загрузки тонального классификатора: {e}")
 
-def analyze_sentiment(text: str) -> tuple:
-    if sentiment_classifier is None:
+def reload_models() -> bool:
+    """
+    Загружает и прогревает новую версию модели, затем подменяет рабочую.
+    При ошибке рабочая модель остаётся прежней.
+    :return: True, если модель заменена
+    """
+    global sentiment_classifier
+    try:
+        classifier = build_classifier()
+        classifier(WARMUP_TEXT)
+    except Exception as e:
+        logger.error(f"Новая версия классификатора тональности не загружена, работает прежняя: {e}")
+        return False
+    sentiment_classifier = classifier
+    model_registry.set_version("sentiment", classifier.version)
+    logger.info(f"Классификатор тональности заменён на версию {classifier.version}")
+    return True
+
+def uses_shared_inputs(classifier, post: dict) -> bool:
+    return bool(classifier is not None and classifier.shared_input_ids and post
+                and post.get("tokenizer_id") == preprocessing.tokenizer_id and post.get("input_ids"))
+
+def sentiment_from_ids(input_ids: list, classifier=None) -> tuple:
+    """
+    Тональность по готовым input_ids поста (без служебных токенов).
+    """
+    return sentiment_from_ids_batch([input_ids], classifier)[0]
+
+def sentiment_from_ids_batch(input_ids_list: list, classifier=None) -> list:
+    """
+    То же, что sentiment_from_ids, для нескольких постов одним проходом модели.
+    :param classifier: Модель, взятая вызывающим (по умолчанию рабочая)
+    """
+    if classifier is None:
+        classifier = sentiment_classifier
+    tokenizer = classifier.tokenizer
+    model = classifier.model
+    sequences = [tokenizer.build_inputs_with_special_tokens(ids[:preprocessing.MAX_TEXT_TOKENS])
+                 for ids in input_ids_list]
+    length = max(len(seq) for seq in sequences)
+    pad = tokenizer.pad_token_id or 0
+    ids_tensor = torch.tensor([seq + [pad] * (length - len(seq)) for seq in sequences])
+    mask_tensor = torch.tensor([[1] * len(seq) + [0] * (length - len(seq)) for seq in sequences])
+    with torch.no_grad():
+        logits = model(input_ids=ids_tensor, attention_mask=mask_tensor).logits
+    probs = logits.softmax(dim=-1)
+    results = []
+    for row in probs:
+        idx = int(row.argmax())
+        results.append((model.config.id2label[idx], float(row[idx])))
+    return results
+
+def base_sentiment(text: str, post: dict = None) -> tuple:
+    """
+    Тональность базовой моделью.
+    """
+    classifier = sentiment_classifier
+    # Если пост уже токенизирован общим токенизатором, повторная токенизация не нужна
+    if uses_shared_inputs(classifier, post):
+        return sentiment_from_ids(post["input_ids"], classifier)
+    truncated_text = preprocessing.model_text(text, post)  # Обрезаем текст, чтобы избежать ошибок
+    res = classifier(truncated_text)[0]
+    return res['label'], res['score']
+
+def model_sentiment(text: str, post: dict = None) -> tuple:
+    """
+    Тональность локальными моделями с учётом режима инференса (base или cascade).
+    """
+    if INFERENCE_MODE == "cascade":
+        return cascade.sentiment(text, post, base=base_sentiment)
+    return base_sentiment(text, post)
+
+def sentiment_batch(items: list, classifier=None) -> list:
+    """
+    Тональность нескольких постов. В базовом режиме посты с общими input_ids
+    обрабатываются одним проходом модели.
+    :param items: Список (text, post)
+    :param classifier: Модель, взятая вызывающим (по умолчанию рабочая)
+    """
+    if classifier is None:
+        classifier = sentiment_classifier
+    results = [None] * len(items)
+    batched = []
+    for i, (text, post) in enumerate(items):
+        if INFERENCE_MODE != "cascade" and uses_shared_inputs(classifier, post):
+            batched.append(i)
+        else:
+            results[i] = model_sentiment(text, post)
+    if batched:
+        with span("sentiment_batch", size=len(batched)):
+            batch_results = sentiment_from_ids_batch([items[i][1]["input_ids"] for i in batched], classifier)
+        for i, result in zip(batched, batch_results):
+            results[i] = result
+    return results
+
+def analyze_sentiment(text: str, post: dict = None) -> tuple:
+    if sentiment_classifier is None and INFERENCE_BACKEND == "local":
         logger.warning("Классификатор тональности не инициализирован")
         return ("neutral", 0.0)
 
     try:
-        truncated_text = text[:512]  # Обрезаем текст, чтобы избежать ошибок
-        res = sentiment_classifier(truncated_text)[0]
-        return res['label'], res['score']
+        with span("sentiment_inference", backend=INFERENCE_BACKEND):
+            if INFERENCE_BACKEND == "remote":
+                return inference_client.sentiment(text, post)
+            return model_sentiment(text, post)
     except Exception as e:
         logger.error(f"Ошибка при анализе тональности: {e}")
         return ("neutral", 0.0)
 
-# Загружаем модель при импорте модуля
-load_models()
\ No newline at end of file
+def analyze_sentiment_batch(items: list) -> list:
+    """
+    То же, что analyze_sentiment, для нескольких постов: одним запросом к серверу
+    инференса или батчем локальной модели.
+    :param items: Список (text, post)
+    :return: Для каждого поста (метка, оценка)
+    """
+    if not items:
+        return []
+    if sentiment_classifier is None and INFERENCE_BACKEND == "local":
+        logger.warning("Классификатор тональности не инициализирован")
+        return [("neutral", 0.0)] * len(items)
+
+    try:
+        with span("sentiment_inference", backend=INFERENCE_BACKEND, posts=len(items)):
+            if INFERENCE_BACKEND == "remote":
+                return inference_client.sentiment_batch(items)
+            return sentiment_batch(items)
+    except Exception as e:
+        logger.error(f"Ошибка при анализе тональности: {e}")
+        return [("neutral", 0.0)] * len(items)
+
+# Загружаем модель при импорте модуля (с сервером инференса модели держит только он)
+if INFERENCE_BACKEND == "local":
+    load_models()
\ No newline at end of file
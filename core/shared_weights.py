@@ -0,0 +1,96 @@
+"""
+Общие для процессов веса моделей.
+
+pipeline(...) загружает веса в собственную память процесса, поэтому бот, воркеры
+классификации и каждая реплика сервера инференса держат свою копию двух моделей
+rubert-base. После загрузки share_weights подменяет параметры модели тензорами,
+отображёнными из файла весов (mmap без записи): их страницы лежат в page cache
+ядра и общие для всех процессов, отображающих тот же файл, а частная копия
+освобождается. Добавление процесса больше не добавляет копию весов.
+
+Отображается снимок файла весов в SHARED_WEIGHTS_DIR (один на версию модели),
+а не файл в local_models: обучение перезаписывает веса на месте, а усечение
+отображённого файла уронило бы работающие процессы (SIGBUS). Удалять снимки
+безопасно: процессы, которые их отобразили, продолжают работать.
+
+Общую память по процессам показывает benchmarks/memory_report.py.
+"""
+
+import os
+import shutil
+from itertools import chain
+from pathlib import Path
+
+import torch
+from safetensors.torch import load_file
+
+from config.config import SHARED_WEIGHTS_DIR
+from config.logger import logger
+
+# Файлы весов в порядке предпочтения (шардированные чекпойнты не отображаются)
+WEIGHT_FILES = ("model.safetensors", "pytorch_model.bin")
+
+
+def weights_file(model_path: Path) -> Path:
+    for name in WEIGHT_FILES:
+        path = Path(model_path) / name
+        if path.is_file():
+            return path
+    return None
+
+
+def snapshot(source: Path, name: str, version: str, folder: str = SHARED_WEIGHTS_DIR) -> Path:
+    """
+    Неизменяемая копия файла весов для версии модели; снимки прежних версий удаляются.
+    """
+    folder = Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    path = folder / f"{name}-{version}{source.suffix}"
+    if not path.exists():
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.part")
+        shutil.copyfile(source, tmp_path)
+        os.replace(tmp_path, path)
+        logger.info(f"Снимок весов {name} версии {version}: {path}")
+    for old in folder.glob(f"{name}-*"):
+        if old != path and not old.name.endswith(".part"):
+            old.unlink(missing_ok=True)
+    return path
+
+
+def load_mapped_state(path: Path) -> dict:
+    """
+    Тензоры поверх отображения файла в память, без копирования в память процесса.
+    """
+    if path.suffix == ".safetensors":
+        return load_file(str(path), device="cpu")
+    return torch.load(str(path), map_location="cpu", mmap=True, weights_only=True)
+
+
+def share_weights(model, model_path: Path, name: str, version: str) -> int:
+    """
+    Подменяет параметры и буферы модели тензорами из отображённого снимка весов.
+    Тензоры, которых нет в файле или которые отличаются формой/типом, остаются частными.
+    :return: Объём весов, перенесённых в общую память, байт
+    """
+    source = weights_file(model_path)
+    if source is None or version is None:
+        logger.warning(f"Веса {name} не отображаются в общую память: нет файла {' или '.join(WEIGHT_FILES)}")
+        return 0
+    try:
+        state = load_mapped_state(snapshot(source, name, version))
+    except Exception as e:
+        logger.warning(f"Веса {name} остаются в памяти процесса: {e}")
+        return 0
+
+    shared_bytes = 0
+    private = 0
+    with torch.no_grad():
+        for key, tensor in chain(model.named_parameters(), model.named_buffers()):
+            mapped = state.get(key)
+            if mapped is None or mapped.shape != tensor.shape or mapped.dtype != tensor.dtype:
+                private += 1
+                continue
+            tensor.data = mapped
+            shared_bytes += mapped.numel() * mapped.element_size()
+    logger.info(f"Веса {name}: {shared_bytes / 2 ** 20:.0f} МБ в общей памяти, частных тензоров {private}")
+    return shared_bytes
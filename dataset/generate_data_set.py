@@ -1,9 +1,57 @@
-import random
+"""
+Генерация синтетического датасета постов.
+
+Режим по умолчанию потоково пишет JSONL (или JSONL.gz) параллельно в нескольких
+процессах с детерминированным seed: при одинаковых --seed и --count результат
+совпадает побайтно при любом числе процессов. Распределения длины постов, каналов,
+времени публикации, ссылок/эмодзи и дубликатов приближены к реальным каналам.
+
+    python dataset/generate_data_set.py --count 2000000 --out dataset/posts.jsonl.gz --workers 8
+    python dataset/generate_data_set.py --legacy   # прежний generated_dataset_10000.json
+"""
+
+import argparse
+import gzip
+import io
 import json
+import math
+import os
+import random
+import shutil
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
 from shared.constants import CATEGORY_KEYWORDS, CATEGORIES
 
-def generate_post(category: str, min_sentences=5, min_words=40) -> dict:
+FILLER_WORDS = ["это", "важно", "сегодня", "эксперт", "обсуждение", "новость", "аналитика", "данные", "информация", "проект", "ситуация"]
+
+# Доли категорий и тональностей в новостных каналах заметно неравномерны
+CATEGORY_WEIGHTS = {
+    "politics": 0.22, "economics": 0.16, "society": 0.15, "tech": 0.09,
+    "military": 0.12, "sports": 0.08, "science": 0.04, "culture": 0.05, "incident": 0.09,
+}
+SENTIMENT_WEIGHTS = {"NEUTRAL": 0.5, "NEGATIVE": 0.32, "POSITIVE": 0.18}
+
+# Публикации по часам суток (UTC+3): ночью почти тишина, пик днём
+HOUR_WEIGHTS = [1, 1, 1, 1, 1, 2, 4, 7, 9, 10, 10, 10, 9, 9, 9, 9, 9, 8, 8, 7, 6, 5, 3, 2]
+
+EMOJI = ["🔥", "⚡️", "❗️", "📌", "👉", "🇷🇺", "💰", "📈", "📉", "🚨", "✅", "❌"]
+LINK_HOSTS = ["t.me", "ria.ru", "tass.ru", "rbc.ru", "interfax.ru", "kommersant.ru"]
+
+SHARD_SIZE = 50000
+CHANNELS_COUNT = 200
+DUPLICATE_RATE = 0.04    # доля репостов уже опубликованных текстов
+LINK_RATE = 0.35
+EMOJI_RATE = 0.3
+RECENT_TEXTS = 2000      # сколько последних текстов помнить для дубликатов
+
+
+def generate_post(category: str, min_sentences=5, min_words=40, rng=random) -> dict:
     """
     Генерируем один пост для заданной категории, с использованием ключевых слов.
     Текст будет из min_sentences предложений минимум, с минимум min_words слов.
@@ -15,22 +63,21 @@ def generate_post(category: str, min_sentences=5, min_words=40) -> dict:
     sentences = []
     word_count = 0
     while len(sentences) < min_sentences or word_count < min_words:
-        sentence_length = random.randint(8, 15)
+        sentence_length = rng.randint(8, 15)
         sentence_words = []
 
-        kw_in_sentence = random.sample(keywords, min(len(keywords), random.randint(2,3)))
-        filler_words = ["это", "важно", "сегодня", "эксперт", "обсуждение", "новость", "аналитика", "данные", "информация", "проект", "ситуация"]
+        kw_in_sentence = rng.sample(keywords, min(len(keywords), rng.randint(2,3)))
         filler_count = sentence_length - len(kw_in_sentence)
 
         sentence_words.extend(kw_in_sentence)
-        sentence_words.extend(random.choices(filler_words, k=filler_count))
-        random.shuffle(sentence_words)
+        sentence_words.extend(rng.choices(FILLER_WORDS, k=filler_count))
+        rng.shuffle(sentence_words)
         sentence = " ".join(sentence_words).capitalize() + "."
         sentences.append(sentence)
         word_count += len(sentence_words)
 
     text = " ".join(sentences)
-    sentiment = random.choice(["POSITIVE", "NEGATIVE", "NEUTRAL"])
+    sentiment = rng.choice(["POSITIVE", "NEGATIVE", "NEUTRAL"])
 
     post = {
         "text": text,
@@ -48,14 +95,143 @@ def generate_dataset(total_posts=10000):
             dataset.append(post)
     return dataset
 
+def channel_weights(count: int) -> list:
+    """
+    Закон Ципфа: несколько крупных каналов дают большую часть постов.
+    """
+    return [1 / (rank + 1) ** 1.1 for rank in range(count)]
+
+def realistic_post(rng: random.Random, channels: list, weights: list, start: datetime,
+                   days: int, recent: deque, message_id: int) -> dict:
+    channel = rng.choices(channels, weights=weights)[0]
+    day = rng.randrange(days)
+    hour = rng.choices(range(24), weights=HOUR_WEIGHTS)[0]
+    created_at = start + timedelta(days=day, hours=hour - 3, seconds=rng.randrange(3600))
+
+    if recent and rng.random() < DUPLICATE_RATE:
+        # Репост: тот же текст повторно публикуется (обычно другим каналом)
+        original = rng.choice(recent)
+        text, category, sentiment = original["text"], original["category"], original["sentiment"]
+    else:
+        category = rng.choices(list(CATEGORY_WEIGHTS), weights=list(CATEGORY_WEIGHTS.values()))[0]
+        # Длина поста в предложениях — логнормальная: много коротких, длинный хвост
+        sentences = max(1, min(40, int(math.exp(rng.gauss(1.1, 0.8)))))
+        text = generate_post(category, min_sentences=sentences, min_words=0, rng=rng)["text"]
+        sentiment = rng.choices(list(SENTIMENT_WEIGHTS), weights=list(SENTIMENT_WEIGHTS.values()))[0]
+        if rng.random() < EMOJI_RATE:
+            text = f"{rng.choice(EMOJI)} {text}"
+            if rng.random() < 0.5:
+                text += " " + "".join(rng.choices(EMOJI, k=rng.randint(1, 3)))
+        if rng.random() < LINK_RATE:
+            host = rng.choice(LINK_HOSTS)
+            text += f"\n\nhttps://{host}/{rng.randrange(10 ** 6, 10 ** 7)}"
+        recent.append({"text": text, "category": category, "sentiment": sentiment})
+
+    return {
+        "text": text,
+        "category": category,
+        "sentiment": sentiment,
+        "channel": channel,
+        "created_at": created_at.isoformat(),
+        "url": f"https://t.me/{channel}/{message_id}",
+        "message_id": message_id,
+    }
+
+def open_output(path: str, compress: bool):
+    if compress:
+        # Без имени файла и времени в заголовке: сжатый вывод тоже воспроизводим побайтно
+        gz = gzip.GzipFile(filename="", mode="wb", compresslevel=6, fileobj=open(path, "wb"), mtime=0)
+        return io.TextIOWrapper(ClosingGzip(gz), encoding="utf-8")
+    return open(path, "w", encoding="utf-8")
+
+class ClosingGzip(io.BufferedIOBase):
+    """
+    GzipFile не закрывает переданный fileobj; обёртка закрывает оба.
+    """
+
+    def __init__(self, gz: gzip.GzipFile):
+        self.gz = gz
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        return self.gz.write(data)
+
+    def close(self):
+        if not self.closed:
+            fileobj = self.gz.fileobj
+            self.gz.close()
+            fileobj.close()
+        super().close()
+
+def generate_shard(shard: int, count: int, seed: int, path: str, end: str, days: int, compress: bool) -> int:
+    """
+    Генерирует один шард в отдельный файл. Seed шарда зависит только от общего seed
+    и номера шарда, поэтому результат не зависит от числа процессов.
+    """
+    rng = random.Random(seed * 1000003 + shard)
+    channels = [f"channel_{i:03d}" for i in range(CHANNELS_COUNT)]
+    weights = channel_weights(CHANNELS_COUNT)
+    start = datetime.fromisoformat(end) - timedelta(days=days)
+    recent = deque(maxlen=RECENT_TEXTS)
+    with open_output(path, compress) as f:
+        for i in range(count):
+            post = realistic_post(rng, channels, weights, start, days, recent, shard * SHARD_SIZE + i + 1)
+            f.write(json.dumps(post, ensure_ascii=False) + "\n")
+    return count
+
+def generate_stream(count: int, out: str, seed: int = 42, workers: int = os.cpu_count() or 1,
+                    days: int = 30, end: str = None):
+    """
+    Потоковая генерация count постов в out (.jsonl или .jsonl.gz).
+    Память постоянна: каждый процесс пишет свой шард построчно.
+    """
+    end = end or datetime(2025, 1, 1, tzinfo=timezone.utc).isoformat()
+    shards = [(i, min(SHARD_SIZE, count - i * SHARD_SIZE)) for i in range(math.ceil(count / SHARD_SIZE))]
+    part_paths = [f"{out}.part{i:05d}" for i, _ in shards]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(generate_shard, i, n, seed, path, end, days, out.endswith(".gz"))
+            for (i, n), path in zip(shards, part_paths)
+        ]
+        done = 0
+        for future in futures:
+            done += future.result()
+            print(f"\rСгенерировано постов: {done}/{count}", end="", flush=True)
+    print()
+
+    # Склейка шардов по порядку; конкатенация gzip-файлов — корректный gzip
+    with open(out, "wb") as target:
+        for path in part_paths:
+            with open(path, "rb") as part:
+                shutil.copyfileobj(part, target)
+            os.remove(path)
+
 if __name__ == "__main__":
-    data_dir = Path("dataset")
-    data_dir.mkdir(exist_ok=True)
+    parser = argparse.ArgumentParser(description="Генерация синтетического датасета постов")
+    parser.add_argument("--count", type=int, default=10000, help="Количество постов")
+    parser.add_argument("--out", default="dataset/generated_dataset.jsonl.gz", help="Файл .jsonl или .jsonl.gz")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--days", type=int, default=30, help="За сколько дней распределять публикации")
+    parser.add_argument("--end", default=None, help="Конец интервала публикаций (ISO), по умолчанию 2025-01-01")
+    parser.add_argument("--legacy", action="store_true", help="Прежний формат: generated_dataset_10000.json")
+    args = parser.parse_args()
+
+    if args.legacy:
+        data_dir = Path("dataset")
+        data_dir.mkdir(exist_ok=True)
 
-    data = generate_dataset(10000)
+        data = generate_dataset(10000)
 
-    file_path = data_dir / "generated_dataset_10000.json"
-    with open(file_path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+        file_path = data_dir / "generated_dataset_10000.json"
+        with open(file_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
 
-    print(f"Генерация датасета завершена, файл сохранён как {file_path}")
\ No newline at end of file
+        print(f"Генерация датасета завершена, файл сохранён как {file_path}")
+    else:
+        Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        generate_stream(args.count, args.out, seed=args.seed, workers=args.workers, days=args.days, end=args.end)
+        print(f"Генерация датасета завершена, файл сохранён как {args.out}")
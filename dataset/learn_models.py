@@ -1,12 +1,17 @@
+import argparse
 import logging
+import sys
 import warnings
 from pathlib import Path
-import json
 from transformers import AutoModelForSequenceClassification, AutoTokenizer, Trainer, TrainingArguments, TrainerCallback
-from datasets import Dataset
+from datasets import Dataset, Features, Value
 from datetime import datetime
 import torch
 
+sys.path.append(str(Path(__file__).parent.parent))
+
+from learning.data_loader import build_dataset
+
 # Подавляем warnings
 warnings.filterwarnings("ignore")
 logging.getLogger("transformers").setLevel(logging.ERROR)
@@ -35,35 +40,49 @@ CATEGORIES = [
 
 SENTIMENT_LABELS = ["POSITIVE", "NEUTRAL", "NEGATIVE"]
 
-DATASET_FILE = Path(__file__).parent.parent / "dataset" / "generated_dataset_10000.json"
+FEATURES = Features({
+    "text": Value("string"),
+    "category_label": Value("int64"),
+    "sentiment_label": Value("int64"),
+})
+
+# Датасет dataset/generate_data_set.py; прежний JSON-массив (--legacy) используется, если нового нет
+DATASET_FILE = Path(__file__).parent.parent / "dataset" / "generated_dataset.jsonl.gz"
+LEGACY_DATASET_FILE = Path(__file__).parent.parent / "dataset" / "generated_dataset_10000.json"
 CATEGORY_MODEL_DIR = Path(__file__).parent.parent / "local_models" / "category_classifier"
 SENTIMENT_MODEL_DIR = Path(__file__).parent.parent / "local_models" / "sentiment_classifier"
 
-def load_dataset():
-    records = []
+def dataset_example(record: dict):
+    category = (record.get("category") or "").lower()
+    sentiment = (record.get("sentiment") or "").upper()
+    if category not in CATEGORIES or sentiment not in SENTIMENT_LABELS:
+        return None
+    return {
+        "text": record.get("text", ""),
+        "category_label": CATEGORIES.index(category),
+        "sentiment_label": SENTIMENT_LABELS.index(sentiment)
+    }
+
+def load_dataset(sources: list = None, num_shards: int = 1, shard_index: int = 0):
+    """
+    Потоково собирает датасет из JSON/JSONL(.gz) файлов в Arrow на диске.
+    :param num_shards: При обучении в несколько процессов — число частей
+    :param shard_index: Часть текущего процесса
+    """
+    sources = sources or [DATASET_FILE if DATASET_FILE.exists() or not LEGACY_DATASET_FILE.exists()
+                          else LEGACY_DATASET_FILE]
     try:
-        with open(DATASET_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            for item in data:
-                text = item.get("text", "")
-                category = item.get("category", "").lower()
-                sentiment = item.get("sentiment", "").upper()
-
-                if category in CATEGORIES and sentiment in SENTIMENT_LABELS:
-                    records.append({
-                        "text": text,
-                        "category_label": CATEGORIES.index(category),
-                        "sentiment_label": SENTIMENT_LABELS.index(sentiment)
-                    })
+        dataset, _ = build_dataset(sources, dataset_example, FEATURES, holdout=0.0,
+                                   num_shards=num_shards, shard_index=shard_index)
     except Exception as e:
-        logger.error(f"Ошибка при чтении файла {DATASET_FILE}: {e}")
+        logger.error(f"Ошибка при чтении датасета {sources}: {e}")
         return None
 
-    if not records:
+    if dataset is None:
         logger.warning("Нет данных для обучения")
         return None
 
-    return Dataset.from_list(records)
+    return dataset
 
 def prepare_dataset_for_label(dataset: Dataset, label_field: str):
     return dataset.rename_column(label_field, "labels")
@@ -130,7 +149,7 @@ def train_model(model_dir: Path, dataset: Dataset, label_field: str, num_labels:
         args=training_args,
         train_dataset=tokenized_dataset,
         tokenizer=tokenizer,
-        callbacks=[ProgressCallback(total_posts=10000)],
+        callbacks=[ProgressCallback(total_posts=len(tokenized_dataset) * int(training_args.num_train_epochs))],
     )
     trainer.train()
     print(f"{BLUE}[{datetime.now().strftime('%H:%M:%S')}] Дообучение {log_prefix} завершено.{RESET}")
@@ -140,7 +159,13 @@ def train_model(model_dir: Path, dataset: Dataset, label_field: str, num_labels:
     tokenizer.save_pretrained(model_dir)
 
 def main():
-    dataset = load_dataset()
+    parser = argparse.ArgumentParser(description="Дообучение моделей на сгенерированном датасете")
+    parser.add_argument("--sources", nargs="*", default=None, help="Файлы .json/.jsonl/.jsonl.gz")
+    parser.add_argument("--num-shards", type=int, default=1)
+    parser.add_argument("--shard-index", type=int, default=0)
+    args = parser.parse_args()
+
+    dataset = load_dataset(args.sources, args.num_shards, args.shard_index)
     if dataset is None:
         logger.error("Данные для обучения не найдены. Завершение.")
         return
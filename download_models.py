@@ -5,6 +5,13 @@ from config.logger import logger
 models = {
     "category_classifier": "DeepPavlov/rubert-base-cased",
     "sentiment_classifier": "blanchefort/rubert-base-cased-sentiment-rusentiment",
+    # Маленькая модель для каскадного режима (INFERENCE_MODE=cascade)
+    "sentiment_classifier_tiny": "seara/rubert-tiny2-russian-sentiment",
+}
+
+# Маленькие модели без готового чекпойнта: обучаются дистилляцией из скачанных базовых
+distilled_models = {
+    "category_classifier_tiny": "python learning/distill_student.py --task category",
 }
 
 LOCAL_MODELS_DIR = Path("./local_models")
@@ -23,6 +30,9 @@ def download_and_save_models():
             logger.info(f"Модель {name} успешно сохранена в {model_dir}")
         except Exception as e:
             logger.error(f"Ошибка при скачивании или сохранении модели {name}: {e}")
+    for name, command in distilled_models.items():
+        if not (LOCAL_MODELS_DIR / name / "config.json").exists():
+            logger.info(f"Модель {name} для каскадного режима обучается дистилляцией: {command}")
 
 if __name__ == "__main__":
     download_and_save_models()
\ No newline at end of file
@@ -1,10 +1,20 @@
+import argparse
+import hashlib
 import logging
+import os
+import random
+import time
 from datetime import datetime
 from pathlib import Path
 import json
 import shutil
+import sys
 from transformers import AutoModelForSequenceClassification, AutoTokenizer, Trainer, TrainingArguments
-from datasets import Dataset
+from datasets import Dataset, Features, Value
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from learning.data_loader import build_dataset
 
 # ANSI escape codes для цветов
 BLUE = "\033[94m"
@@ -31,32 +41,263 @@ CATEGORIES = [
     "military", "sports", "science", "culture", "incident"
 ]
 
+FEATURES = Features({"text": Value("string"), "label": Value("int64")})
+
 MEMORY_DIR = Path(__file__).parent.parent / "category_memory"
 MODEL_SAVE_DIR = Path(__file__).parent.parent / "local_models" / "category_classifier"
 
+# Инкрементальное дообучение: кандидат, предыдущая версия, состояние, буфер повторения и отложенная выборка
+CANDIDATE_DIR = MODEL_SAVE_DIR.parent / "category_classifier_candidate"
+PREVIOUS_DIR = MODEL_SAVE_DIR.parent / "category_classifier_prev"
+STATE_FILE = MODEL_SAVE_DIR.parent / "category_training_state.json"
+REPLAY_FILE = MODEL_SAVE_DIR.parent / "category_replay.jsonl"
+HOLDOUT_FILE = MODEL_SAVE_DIR.parent / "category_holdout.jsonl"
+
+REPLAY_SIZE = 2000       # максимум старых примеров, повторяемых при каждом дообучении
+HOLDOUT_SIZE = 300       # размер фиксированной отложенной выборки
+MAX_REGRESSION = 0.0     # допустимое падение точности на отложенной выборке
+
+def memory_example(record: dict):
+    category = record.get("category")
+    if category not in CATEGORIES:
+        return None
+    return {"text": record.get("text", ""), "label": CATEGORIES.index(category)}
+
 def load_training_data():
-    records = []
-    for category_dir in MEMORY_DIR.iterdir():
-        if category_dir.is_dir() and category_dir.name in CATEGORIES:
-            for json_file in category_dir.glob("*.json"):
-                try:
-                    with open(json_file, "r", encoding="utf-8") as f:
-                        data = json.load(f)
-                    text = data.get("text", "")
-                    label_idx = CATEGORIES.index(category_dir.name)
-                    records.append({"text": text, "label": label_idx})
-                except Exception as e:
-                    logger.error(f"Ошибка при чтении файла {json_file}: {e}")
-
-    if not records:
+    # Потоковая загрузка памяти в Arrow-датасет на диске (без списка всех примеров в памяти)
+    dataset, _ = build_dataset([MEMORY_DIR], memory_example, FEATURES, holdout=0.0)
+    if dataset is None:
         logger.warning("Нет данных для обучения")
         return None
-
-    return Dataset.from_list(records)
+    return dataset
 
 def tokenize_function(examples, tokenizer):
     return tokenizer(examples["text"], truncation=True, padding="max_length", max_length=512)
 
+def text_key(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+def load_memory_records(since: float = 0.0) -> list:
+    """
+    Примеры из category_memory, добавленные после момента since (по времени изменения файла).
+    :return: Список {'text', 'label', 'path'}
+    """
+    records = []
+    if not MEMORY_DIR.exists():
+        return records
+    for category_dir in MEMORY_DIR.iterdir():
+        if not (category_dir.is_dir() and category_dir.name in CATEGORIES):
+            continue
+        for json_file in category_dir.glob("*.json"):
+            try:
+                if json_file.stat().st_mtime <= since:
+                    continue
+                with open(json_file, "r", encoding="utf-8") as f:
+                    text = json.load(f).get("text", "")
+                if text:
+                    records.append({"text": text, "label": CATEGORIES.index(category_dir.name),
+                                    "path": str(json_file)})
+            except Exception as e:
+                logger.error(f"Ошибка при чтении файла {json_file}: {e}")
+    return records
+
+def remove_memory_files(records: list):
+    """
+    Удаляет файлы примеров из category_memory (например, попавших в отложенную выборку).
+    """
+    for record in records:
+        try:
+            Path(record["path"]).unlink(missing_ok=True)
+        except OSError as e:
+            logger.error(f"Ошибка при удалении файла {record['path']}: {e}")
+
+def remove_holdout_from_memory(holdout: list) -> int:
+    """
+    Удаляет из category_memory все примеры с текстами отложенной выборки,
+    чтобы полное обучение не видело их.
+    :return: Количество удалённых примеров
+    """
+    holdout_keys = {text_key(r["text"]) for r in holdout}
+    if not holdout_keys:
+        return 0
+    found = [r for r in load_memory_records() if text_key(r["text"]) in holdout_keys]
+    remove_memory_files(found)
+    return len(found)
+
+def read_jsonl(path: Path) -> list:
+    if not path.exists():
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def write_jsonl(path: Path, records: list):
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    os.replace(tmp_path, path)
+
+def load_state() -> dict:
+    if STATE_FILE.exists():
+        with open(STATE_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {"last_checkpoint_at": 0.0, "replay_seen": 0, "holdout_accuracy": None, "history": []}
+
+def save_state(state: dict):
+    tmp_path = STATE_FILE.with_suffix(".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, STATE_FILE)
+
+def update_replay(replay: list, new_records: list, seen: int) -> int:
+    """
+    Reservoir sampling: буфер остаётся равномерной выборкой из всех когда-либо
+    увиденных примеров и не превышает REPLAY_SIZE.
+    :return: Обновлённое число увиденных примеров
+    """
+    for record in new_records:
+        seen += 1
+        if len(replay) < REPLAY_SIZE:
+            replay.append(record)
+        else:
+            idx = random.randrange(seen)
+            if idx < REPLAY_SIZE:
+                replay[idx] = record
+    return seen
+
+def evaluate(model_dir: Path, holdout: list, batch_size: int = 32):
+    """
+    Точность модели на отложенной выборке. None, если модель ещё не классификатор
+    по CATEGORIES (например, исходная zero-shot модель).
+    """
+    import torch
+
+    model = AutoModelForSequenceClassification.from_pretrained(str(model_dir))
+    if model.config.num_labels != len(CATEGORIES) or not holdout:
+        return None
+    tokenizer = AutoTokenizer.from_pretrained(str(model_dir))
+    model.eval()
+    correct = 0
+    with torch.no_grad():
+        for i in range(0, len(holdout), batch_size):
+            batch = holdout[i:i + batch_size]
+            enc = tokenizer([r["text"] for r in batch], truncation=True, max_length=512,
+                            padding=True, return_tensors="pt")
+            predictions = model(**enc).logits.argmax(dim=-1).tolist()
+            correct += sum(int(p == r["label"]) for p, r in zip(predictions, batch))
+    return correct / len(holdout)
+
+def train_model(base_dir: Path, output_dir: Path, dataset, epochs: int):
+    tokenizer = AutoTokenizer.from_pretrained(str(base_dir))
+    tokenized_dataset = dataset.map(lambda examples: tokenize_function(examples, tokenizer), batched=True)
+    model = AutoModelForSequenceClassification.from_pretrained(
+        str(base_dir),
+        num_labels=len(CATEGORIES),
+        ignore_mismatched_sizes=True
+    )
+    training_args = TrainingArguments(
+        output_dir=str(output_dir / "checkpoints"),
+        num_train_epochs=epochs,
+        per_device_train_batch_size=8,
+        save_strategy="no",
+        logging_dir="./logs",
+        logging_steps=50,
+        report_to=[]
+    )
+    Trainer(model=model, args=training_args, train_dataset=tokenized_dataset, tokenizer=tokenizer).train()
+    if output_dir.exists():
+        shutil.rmtree(output_dir)
+    model.save_pretrained(output_dir)
+    tokenizer.save_pretrained(output_dir)
+
+def promote_candidate():
+    """
+    Подменяет рабочую модель кандидатом; предыдущая версия остаётся в PREVIOUS_DIR для отката.
+    """
+    if PREVIOUS_DIR.exists():
+        shutil.rmtree(PREVIOUS_DIR)
+    os.replace(MODEL_SAVE_DIR, PREVIOUS_DIR)
+    os.replace(CANDIDATE_DIR, MODEL_SAVE_DIR)
+
+def incremental_train(min_new: int = 1, epochs: int = 1) -> bool:
+    """
+    Дообучение только на примерах, появившихся после прошлого запуска, плюс буфер повторения.
+    Новая версия заменяет рабочую, только если точность на отложенной выборке не упала.
+    :return: True, если модель была обновлена
+    """
+    started = time.time()
+    state = load_state()
+    new_records = load_memory_records(since=state["last_checkpoint_at"])
+
+    # Отложенная выборка фиксируется один раз (пополняется, только пока не набран HOLDOUT_SIZE).
+    # Её примеры удаляются из category_memory, чтобы ни одно обучение их не видело
+    holdout = read_jsonl(HOLDOUT_FILE)
+    holdout_keys = {text_key(r["text"]) for r in holdout}
+    remove_memory_files([r for r in new_records if text_key(r["text"]) in holdout_keys])
+    new_records = [r for r in new_records if text_key(r["text"]) not in holdout_keys]
+    random.shuffle(new_records)
+    if len(holdout) < HOLDOUT_SIZE and new_records:
+        take = min(HOLDOUT_SIZE - len(holdout), len(new_records) // 5 or 1)
+        remove_memory_files(new_records[:take])
+        holdout.extend({"text": r["text"], "label": r["label"]} for r in new_records[:take])
+        new_records = new_records[take:]
+        write_jsonl(HOLDOUT_FILE, holdout)
+        logger.info(f"Отложенная выборка пополнена до {len(holdout)} примеров")
+    new_records = [{"text": r["text"], "label": r["label"]} for r in new_records]
+
+    if len(new_records) < min_new:
+        logger.info(f"Новых примеров {len(new_records)} (< {min_new}), дообучение пропущено")
+        return False
+
+    replay = read_jsonl(REPLAY_FILE)
+    dataset = Dataset.from_list(new_records + replay)
+    logger.info(f"Инкрементальное дообучение: новых примеров {len(new_records)}, из буфера {len(replay)}")
+
+    train_model(MODEL_SAVE_DIR, CANDIDATE_DIR, dataset, epochs)
+
+    # Рабочая модель оценивается заново: отложенная выборка могла пополниться,
+    # а модель — смениться полным обучением или откатом
+    baseline = evaluate(MODEL_SAVE_DIR, holdout)
+    candidate = evaluate(CANDIDATE_DIR, holdout)
+    promoted = candidate is not None and (baseline is None or candidate >= baseline - MAX_REGRESSION)
+
+    if promoted:
+        promote_candidate()
+        state["holdout_accuracy"] = candidate
+        logger.info(f"{GREEN}Новая версия принята: точность {candidate:.3f} (была {baseline}){RESET}")
+    else:
+        shutil.rmtree(CANDIDATE_DIR, ignore_errors=True)
+        logger.warning(f"Новая версия отклонена: точность {candidate} ниже текущей {baseline}")
+
+    # Новые примеры не теряются и при отклонении: они попадают в буфер повторения
+    state["replay_seen"] = update_replay(replay, new_records, state.get("replay_seen", 0))
+    write_jsonl(REPLAY_FILE, replay)
+    state["last_checkpoint_at"] = started
+    state["history"] = (state.get("history", []) + [{
+        "at": datetime.now().isoformat(),
+        "new": len(new_records),
+        "replay": len(replay),
+        "accuracy": candidate,
+        "promoted": promoted,
+        "seconds": round(time.time() - started, 1),
+    }])[-50:]
+    save_state(state)
+    return promoted
+
+def run_schedule(interval_hours: float, min_new: int, epochs: int):
+    """
+    Периодическое инкрементальное дообучение в отдельном процессе с пониженным приоритетом,
+    чтобы не отнимать CPU у обслуживания запросов.
+    """
+    if hasattr(os, "nice"):
+        os.nice(10)
+    while True:
+        try:
+            incremental_train(min_new=min_new, epochs=epochs)
+        except Exception as e:
+            logger.error(f"Ошибка инкрементального дообучения: {e}")
+        time.sleep(interval_hours * 3600)
+
 def clear_training_data():
     try:
         if MEMORY_DIR.exists() and MEMORY_DIR.is_dir():
@@ -66,9 +307,12 @@ def clear_training_data():
     except Exception as e:
         logger.error(f"Ошибка при очистке папки с обучающими данными: {e}")
 
-def main():
+def full_train():
     print(f"{BLUE}[{datetime.now().strftime('%H:%M:%S')}] Старт дообучения классификатора категорий...{RESET}")
 
+    removed = remove_holdout_from_memory(read_jsonl(HOLDOUT_FILE))
+    if removed:
+        logger.info(f"Из обучающих данных исключено примеров отложенной выборки: {removed}")
     dataset = load_training_data()
     if dataset is None:
         logger.error("Данные для обучения не найдены. Завершение.")
@@ -110,10 +354,33 @@ def main():
     model.save_pretrained(MODEL_SAVE_DIR)
     tokenizer.save_pretrained(MODEL_SAVE_DIR)
 
+    # Примеры из памяти сохраняются: инкрементальный режим отсчитывает новые от этого момента
+    state = load_state()
+    state["last_checkpoint_at"] = time.time()
+    state["holdout_accuracy"] = None
+    save_state(state)
+
     print(f"{BLUE}[{datetime.now().strftime('%H:%M:%S')}] Дообучение завершено.{RESET}")
 
-    # Очищаем папку с обучающими данными после успешного дообучения
-    clear_training_data()
+def main():
+    parser = argparse.ArgumentParser(description="Дообучение классификатора категорий")
+    parser.add_argument("--mode", choices=["full", "incremental"], default="full",
+                        help="full — на всей памяти, incremental — только на новых примерах и буфере повторения")
+    parser.add_argument("--schedule-hours", type=float, default=0,
+                        help="Повторять инкрементальное дообучение с этим интервалом (ч)")
+    parser.add_argument("--min-new", type=int, default=50, help="Минимум новых примеров для запуска")
+    parser.add_argument("--epochs", type=int, default=1, help="Эпох инкрементального дообучения")
+    parser.add_argument("--clear", action="store_true", help="Очистить category_memory после полного обучения")
+    args = parser.parse_args()
+
+    if args.mode == "full":
+        full_train()
+        if args.clear:
+            clear_training_data()
+    elif args.schedule_hours > 0:
+        run_schedule(args.schedule_hours, args.min_new, args.epochs)
+    else:
+        incremental_train(min_new=args.min_new, epochs=args.epochs)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,206 @@
+"""
+Общий потоковый загрузчик обучающих данных.
+
+Записи читаются генератором из JSONL/JSONL.gz, JSON-массивов, папок памяти
+(category_memory/<категория>/*.json, sentiment_memory/*.json) и хранилища постов
+(SQLite) и сразу пишутся в Arrow-датасет на диске через Dataset.from_generator.
+В памяти одновременно находится только текущая пачка, поэтому обучение на
+корпусах больше оперативной памяти работает и на небольших CPU-машинах.
+
+Разбиение на обучающую и отложенную выборки детерминировано по хэшу текста:
+пример всегда попадает в одну и ту же выборку, независимо от порядка и объёма данных.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+from pathlib import Path
+
+from datasets import Dataset, Features
+
+ROOT_DIR = Path(__file__).parent.parent
+CACHE_DIR = ROOT_DIR / "data" / "datasets_cache"
+
+# Размер блока при потоковом разборе JSON-массива
+JSON_CHUNK_SIZE = 1 << 20
+# Пропускаемые символы до начала массива и между его элементами
+SEPARATORS = {False: " \n\r\t", True: ", \n\r\t"}
+
+
+def source_signature(path) -> tuple:
+    """
+    (путь, размер, время изменения): входит в отпечаток датасета, чтобы кэш
+    Arrow пересобирался при изменении исходных файлов.
+    """
+    path = Path(path)
+    if path.is_dir():
+        files = [p for p in path.rglob("*.json")]
+        return str(path), len(files), max((p.stat().st_mtime for p in files), default=0.0)
+    if path.exists():
+        stat = path.stat()
+        return str(path), stat.st_size, stat.st_mtime
+    return str(path), 0, 0.0
+
+
+def iter_json_array(path: Path):
+    """
+    Потоковый разбор файла вида [{...}, {...}] без загрузки целиком.
+    Буфер разбирается по смещению idx; прочитанная часть отрезается только при
+    дочитывании, чтобы не копировать буфер после каждой записи.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buffer = ""
+        idx = 0
+        started = False
+        eof = False
+
+        def refill():
+            nonlocal buffer, idx, eof
+            chunk = f.read(JSON_CHUNK_SIZE)
+            eof = not chunk
+            buffer = buffer[idx:] + chunk
+            idx = 0
+
+        while True:
+            if not eof and len(buffer) - idx < JSON_CHUNK_SIZE:
+                refill()
+            while idx < len(buffer) and buffer[idx] in SEPARATORS[started]:
+                idx += 1
+            if idx == len(buffer):
+                if eof:
+                    if not started:
+                        return
+                    raise ValueError(f"{path}: JSON-массив не закрыт")
+                refill()
+                continue
+            if not started:
+                if buffer[idx] != "[":
+                    raise ValueError(f"{path}: ожидался JSON-массив")
+                idx += 1
+                started = True
+                continue
+            if buffer[idx] == "]":
+                return
+            try:
+                record, idx = decoder.raw_decode(buffer, idx)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                # Объект не поместился в буфер — дочитываем
+                refill()
+                continue
+            yield record
+
+
+def iter_jsonl(path: Path):
+    opener = gzip.open if path.name.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def iter_memory_dir(path: Path):
+    """
+    Папка памяти: JSON-файлы постов. Для category_memory имя подпапки — категория.
+    """
+    for json_file in sorted(path.rglob("*.json")):
+        try:
+            with open(json_file, "r", encoding="utf-8") as f:
+                record = json.load(f)
+        except Exception:
+            continue
+        if json_file.parent != path:
+            record.setdefault("category", json_file.parent.name)
+        yield record
+
+
+def iter_post_store(path: Path):
+    conn = sqlite3.connect(str(path))
+    conn.row_factory = sqlite3.Row
+    try:
+        for row in conn.execute("SELECT text, channel, created_at, categories, sentiment FROM posts"):
+            record = dict(row)
+            record["categories"] = json.loads(record["categories"] or "[]")
+            yield record
+    finally:
+        conn.close()
+
+
+def iter_source(path) -> iter:
+    path = Path(path)
+    if path.is_dir():
+        return iter_memory_dir(path)
+    if path.suffix == ".db":
+        return iter_post_store(path)
+    if path.name.endswith((".jsonl", ".jsonl.gz")):
+        return iter_jsonl(path)
+    return iter_json_array(path)
+
+
+def in_holdout(text: str, holdout: float) -> bool:
+    digest = hashlib.sha1(text.encode("utf-8")).digest()
+    return int.from_bytes(digest[:4], "big") / 2 ** 32 < holdout
+
+
+def generate_records(sources: list, transform, holdout: float, split: str, unique: bool = False):
+    """
+    Генератор для Dataset.from_generator. sources — список сигнатур источников
+    (см. source_signature); при num_proc > 1 datasets делит его между процессами.
+    :param unique: Пропускать повторы текста (в памяти — по 8 байт хэша на текст)
+    """
+    seen = set()
+    for signature in sources:
+        path = signature[0]
+        if not os.path.exists(path):
+            continue
+        for record in iter_source(path):
+            example = transform(record)
+            if example is None or not example.get("text"):
+                continue
+            if in_holdout(example["text"], holdout) != (split == "holdout"):
+                continue
+            if unique:
+                key = hashlib.sha1(example["text"].encode("utf-8")).digest()[:8]
+                if key in seen:
+                    continue
+                seen.add(key)
+            yield example
+
+
+def build_dataset(sources: list, transform, features: Features, holdout: float = 0.1, num_shards: int = 1,
+                  shard_index: int = 0, num_proc: int = None, unique: bool = False,
+                  cache_dir: Path = CACHE_DIR) -> tuple:
+    """
+    Собирает обучающую и отложенную выборки в Arrow-датасеты на диске.
+    :param sources: Пути к файлам, папкам памяти или базе постов
+    :param transform: Функция record -> dict с 'text' и метками (None — пропустить запись)
+    :param features: Схема записей после transform (нужна и для пустых выборок)
+    :param holdout: Доля отложенной выборки
+    :param num_shards: На сколько частей делить обучающую выборку (несколько процессов обучения)
+    :param shard_index: Какую часть вернуть
+    :param num_proc: Сколько процессов читают источники параллельно
+    :param unique: Убрать повторяющиеся тексты (повторы всегда попадают в одну выборку);
+        при num_proc > 1 — только внутри части источников одного процесса
+    :return: (train, holdout) — datasets.Dataset; None вместо пустой выборки
+    """
+    signatures = [source_signature(path) for path in sources]
+    datasets = []
+    for split in ("train", "holdout"):
+        dataset = Dataset.from_generator(
+            generate_records,
+            features=features,
+            gen_kwargs={"sources": signatures, "transform": transform, "holdout": holdout, "split": split,
+                        "unique": unique},
+            cache_dir=str(cache_dir),
+            num_proc=num_proc if num_proc and len(signatures) > 1 else None,
+        )
+        datasets.append(dataset if len(dataset) else None)
+
+    train, holdout_set = datasets
+    if train is not None and num_shards > 1:
+        train = train.shard(num_shards=num_shards, index=shard_index, contiguous=True)
+    return train, holdout_set
@@ -0,0 +1,335 @@
+"""
+Дистилляция компактных моделей-учеников (уровня rubert-tiny2) из текущих
+категорийного и тонального классификаторов.
+
+Учителя размечают корпус (посты из хранилища и сгенерированный датасет)
+мягкими метками, ученик обучается на них: тональность — с KL-дивергенцией
+(одна метка на пост), категории — с бинарной кросс-энтропией по каждой
+категории (пост может относиться к нескольким, как в zero-shot учителе с
+multi_label=True, и оценки сравниваются с тем же порогом). В конце
+выводится совпадение ученика с учителем на отложенной выборке и скорость
+обеих моделей на CPU. Ученик сохраняется в local_models/<задача>_classifier_tiny
+и подхватывается каскадным режимом (INFERENCE_MODE=cascade).
+
+Запуск:
+    python learning/distill_student.py --task category
+    python learning/distill_student.py --task sentiment --limit 20000
+"""
+
+import argparse
+import json
+import logging
+import random
+import sys
+import time
+import warnings
+from datetime import datetime
+from pathlib import Path
+
+import torch
+import torch.nn.functional as F
+from datasets import Features, Value
+from transformers import (
+    AutoModelForSequenceClassification,
+    AutoTokenizer,
+    Trainer,
+    TrainingArguments,
+    pipeline,
+)
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from config.logger import logger
+from learning.data_loader import build_dataset
+
+warnings.filterwarnings("ignore")
+logging.getLogger("transformers").setLevel(logging.ERROR)
+
+# ANSI escape codes для цветов
+BLUE = "\033[94m"
+GREEN = "\033[92m"
+RESET = "\033[0m"
+
+CATEGORIES = [
+    "politics", "economics", "society", "tech",
+    "military", "sports", "science", "culture", "incident"
+]
+
+SENTIMENT_LABELS = ["POSITIVE", "NEUTRAL", "NEGATIVE"]
+
+ROOT_DIR = Path(__file__).parent.parent
+MODELS_DIR = ROOT_DIR / "local_models"
+POST_STORE_FILE = ROOT_DIR / "data" / "posts.db"
+DATASET_FILE = ROOT_DIR / "dataset" / "generated_dataset_10000.json"
+GENERATED_JSONL_FILE = ROOT_DIR / "dataset" / "generated_dataset.jsonl.gz"
+
+STUDENT_BASE_MODEL = "cointegrated/rubert-tiny2"
+
+TASKS = {
+    "category": {
+        "teacher": MODELS_DIR / "category_classifier",
+        "student": MODELS_DIR / "category_classifier_tiny",
+        "labels": CATEGORIES,
+        "multi_label": True,
+    },
+    "sentiment": {
+        "teacher": MODELS_DIR / "sentiment_classifier",
+        "student": MODELS_DIR / "sentiment_classifier_tiny",
+        "labels": SENTIMENT_LABELS,
+        "multi_label": False,
+    },
+}
+
+
+def corpus_example(record: dict) -> dict:
+    return {"text": record.get("text") or ""}
+
+
+def load_corpus(limit: int, holdout: float, seed: int) -> tuple:
+    """
+    Тексты для дистилляции: посты из хранилища и сгенерированные датасеты,
+    потоково собранные в Arrow-датасеты на диске.
+    Повторяющиеся тексты (пост в хранилище и в датасете) берутся один раз.
+    :return: (train, holdout); holdout — None, если отложенная выборка пуста
+    """
+    sources = [POST_STORE_FILE, DATASET_FILE, GENERATED_JSONL_FILE]
+    train, holdout_set = build_dataset(sources, corpus_example, Features({"text": Value("string")}),
+                                       holdout=holdout, unique=True)
+    if train is None:
+        return None, None
+    train = train.shuffle(seed=seed)
+    if limit:
+        train = train.select(range(min(limit, len(train))))
+        if holdout_set is not None:
+            holdout_set = holdout_set.select(range(min(max(int(limit * holdout), 1), len(holdout_set))))
+    logger.info(f"Корпус: обучающая выборка {len(train)}, "
+                f"отложенная {len(holdout_set) if holdout_set is not None else 0}")
+    return train, holdout_set
+
+
+def normalize_sentiment_label(label: str) -> str:
+    label = label.upper()
+    return {"LABEL_0": "POSITIVE", "LABEL_1": "NEUTRAL", "LABEL_2": "NEGATIVE"}.get(label, label)
+
+
+def teacher_labeler(task: str):
+    """
+    Функция texts -> мягкие метки учителя: вероятности по меткам задачи
+    (для категорий — независимые вероятности каждой категории).
+    """
+    labels = TASKS[task]["labels"]
+    teacher_dir = str(TASKS[task]["teacher"])
+
+    if task == "category":
+        teacher = pipeline("zero-shot-classification", model=teacher_dir, device=-1)
+
+        def label_texts(texts: list) -> list:
+            targets = []
+            # multi_label=True: те же независимые оценки категорий, что у core.categorizer
+            for res in teacher([t[:512] for t in texts], candidate_labels=labels, multi_label=True):
+                scores = dict(zip(res["labels"], res["scores"]))
+                targets.append([scores[label] for label in labels])
+            return targets
+    else:
+        teacher = pipeline("text-classification", model=teacher_dir, top_k=None, device=-1)
+
+        def label_texts(texts: list) -> list:
+            targets = []
+            for res in teacher([t[:512] for t in texts], truncation=True):
+                scores = {normalize_sentiment_label(r["label"]): r["score"] for r in res}
+                targets.append([scores.get(label, 0.0) for label in labels])
+            return targets
+
+    return label_texts
+
+
+def teacher_soft_targets(task: str, dataset, batch_size: int):
+    """
+    Добавляет к датасету колонку soft_targets; разметка пишется на диск пачками.
+    """
+    label_texts = teacher_labeler(task)
+    return dataset.map(
+        lambda batch: {"soft_targets": label_texts(batch["text"])},
+        batched=True,
+        batch_size=batch_size,
+        desc="Разметка учителем",
+    )
+
+
+class DistillationTrainer(Trainer):
+    """
+    Trainer с функцией потерь дистилляции: KL-дивергенция между распределениями
+    ученика и учителя при температуре T плюс доля кросс-энтропии по argmax учителя.
+    Для multi_label — бинарная кросс-энтропия сигмоид ученика с вероятностями учителя
+    плюс доля по бинаризованным (>= 0.5) меткам учителя.
+    """
+
+    def __init__(self, *args, temperature: float = 2.0, alpha: float = 0.7, multi_label: bool = False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.temperature = temperature
+        self.alpha = alpha
+        self.multi_label = multi_label
+
+    def compute_loss(self, model, inputs, return_outputs=False, **kwargs):
+        soft_targets = inputs.pop("soft_targets")
+        outputs = model(**inputs)
+        logits = outputs.logits
+        t = self.temperature
+
+        if self.multi_label:
+            soft = F.binary_cross_entropy_with_logits(logits, soft_targets)
+            hard = F.binary_cross_entropy_with_logits(logits, (soft_targets >= 0.5).float())
+            loss = self.alpha * soft + (1 - self.alpha) * hard
+            return (loss, outputs) if return_outputs else loss
+
+        teacher_log_probs = torch.log(soft_targets.clamp_min(1e-8))
+        teacher_tempered = F.softmax(teacher_log_probs / t, dim=-1)
+        kl = F.kl_div(F.log_softmax(logits / t, dim=-1), teacher_tempered, reduction="batchmean") * t * t
+        hard = F.cross_entropy(logits, soft_targets.argmax(dim=-1))
+        loss = self.alpha * kl + (1 - self.alpha) * hard
+        return (loss, outputs) if return_outputs else loss
+
+
+def predict_labels(model, tokenizer, texts: list, batch_size: int) -> list:
+    model.eval()
+    predictions = []
+    with torch.no_grad():
+        for i in range(0, len(texts), batch_size):
+            enc = tokenizer(texts[i:i + batch_size], truncation=True, max_length=512,
+                            padding=True, return_tensors="pt")
+            predictions.extend(model(**enc).logits.argmax(dim=-1).tolist())
+    return predictions
+
+
+def measure_throughput(model, tokenizer, texts: list, batch_size: int, threads: int) -> float:
+    """
+    Постов в секунду на CPU при заданном числе потоков torch.
+    """
+    torch.set_num_threads(threads)
+    start = time.perf_counter()
+    predict_labels(model, tokenizer, texts, batch_size)
+    return len(texts) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Дистилляция компактного классификатора")
+    parser.add_argument("--task", choices=list(TASKS), required=True)
+    parser.add_argument("--limit", type=int, default=0, help="Максимум текстов из корпуса (0 — все)")
+    parser.add_argument("--holdout", type=float, default=0.1, help="Доля отложенной выборки")
+    parser.add_argument("--epochs", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--temperature", type=float, default=2.0)
+    parser.add_argument("--alpha", type=float, default=0.7, help="Вес KL-дивергенции в функции потерь")
+    parser.add_argument("--threads", type=int, default=torch.get_num_threads(),
+                        help="Потоков torch при замере скорости")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    torch.manual_seed(args.seed)
+    task = TASKS[args.task]
+    labels = task["labels"]
+
+    print(f"{BLUE}[{datetime.now().strftime('%H:%M:%S')}] Старт дистилляции: {args.task}{RESET}")
+
+    train_set, holdout_set = load_corpus(args.limit, args.holdout, args.seed)
+    if train_set is None:
+        logger.error("Корпус для дистилляции пуст. Завершение.")
+        return
+
+    train_set = teacher_soft_targets(args.task, train_set, args.batch_size)
+    if holdout_set is not None:
+        holdout_set = teacher_soft_targets(args.task, holdout_set, args.batch_size)
+    else:
+        logger.warning("Отложенная выборка пуста: совпадение с учителем не измеряется")
+
+    tokenizer = AutoTokenizer.from_pretrained(STUDENT_BASE_MODEL)
+    student = AutoModelForSequenceClassification.from_pretrained(
+        STUDENT_BASE_MODEL,
+        num_labels=len(labels),
+        id2label=dict(enumerate(labels)),
+        label2id={label: i for i, label in enumerate(labels)},
+        # pipeline применяет к multi_label моделям сигмоиду вместо softmax
+        problem_type="multi_label_classification" if task["multi_label"] else "single_label_classification",
+        ignore_mismatched_sizes=True,
+    )
+
+    dataset = train_set.map(
+        lambda batch: tokenizer(batch["text"], truncation=True, max_length=512),
+        batched=True,
+        remove_columns=["text"],
+    )
+
+    output_dir = task["student"]
+    training_args = TrainingArguments(
+        output_dir=str(output_dir / "checkpoints"),
+        num_train_epochs=args.epochs,
+        per_device_train_batch_size=args.batch_size,
+        learning_rate=5e-5,
+        save_strategy="no",
+        logging_steps=50,
+        report_to=[],
+        remove_unused_columns=False,
+        seed=args.seed,
+    )
+
+    trainer = DistillationTrainer(
+        model=student,
+        args=training_args,
+        train_dataset=dataset,
+        processing_class=tokenizer,
+        temperature=args.temperature,
+        alpha=args.alpha,
+        multi_label=task["multi_label"],
+    )
+    trainer.train()
+
+    # Совпадение с учителем на отложенной выборке (пачками, без загрузки выборки целиком)
+    agreement = None
+    if holdout_set is not None:
+        agreed = 0
+        for batch in holdout_set.iter(batch_size=args.batch_size):
+            teacher_labels = [max(range(len(labels)), key=lambda i: t[i]) for t in batch["soft_targets"]]
+            student_labels = predict_labels(student, tokenizer, batch["text"], args.batch_size)
+            agreed += sum(int(a == b) for a, b in zip(teacher_labels, student_labels))
+        agreement = agreed / len(holdout_set)
+
+    # Скорость на CPU: ученик против учителя как классификатора последовательностей
+    speed_set = holdout_set if holdout_set is not None else train_set
+    sample = speed_set.select(range(min(256, len(speed_set))))["text"]
+    student_speed = measure_throughput(student, tokenizer, sample, args.batch_size, args.threads)
+    teacher_model = AutoModelForSequenceClassification.from_pretrained(str(task["teacher"]))
+    teacher_tokenizer = AutoTokenizer.from_pretrained(str(task["teacher"]))
+    teacher_speed = measure_throughput(teacher_model, teacher_tokenizer, sample, args.batch_size, args.threads)
+    if args.task == "category":
+        # Zero-shot учитель делает по проходу на каждую категорию
+        teacher_speed /= len(labels)
+
+    logger.info(
+        f"{GREEN}Совпадение с учителем: {f'{agreement:.1%}' if agreement is not None else 'не измерено'}\n"
+        f"Скорость на CPU ({args.threads} потоков): ученик {student_speed:.1f} пост/с, "
+        f"учитель {teacher_speed:.1f} пост/с, ускорение x{student_speed / teacher_speed:.1f}{RESET}"
+    )
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    student.save_pretrained(output_dir)
+    tokenizer.save_pretrained(output_dir)
+    with open(output_dir / "distillation_report.json", "w", encoding="utf-8") as f:
+        json.dump({
+            "task": args.task,
+            "teacher": str(task["teacher"]),
+            "base_model": STUDENT_BASE_MODEL,
+            "train_size": len(train_set),
+            "holdout_size": len(holdout_set) if holdout_set is not None else 0,
+            "agreement": agreement,
+            "student_posts_per_sec": student_speed,
+            "teacher_posts_per_sec": teacher_speed,
+            "threads": args.threads,
+            "created_at": datetime.now().isoformat(),
+        }, f, ensure_ascii=False, indent=2)
+
+    print(f"{BLUE}[{datetime.now().strftime('%H:%M:%S')}] Ученик сохранён в {output_dir}{RESET}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,12 @@
 import logging
 from pathlib import Path
-import json
+import sys
 from transformers import AutoModelForSequenceClassification, AutoTokenizer, Trainer, TrainingArguments
-from datasets import Dataset
+from datasets import Features, Value
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from learning.data_loader import build_dataset
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("sentiment_training")
@@ -10,31 +14,29 @@ logger = logging.getLogger("sentiment_training")
 # Категории тональности — 3 класса (позитив, нейтрально, негатив)
 SENTIMENT_LABELS = ["POSITIVE", "NEUTRAL", "NEGATIVE"]
 
+FEATURES = Features({"text": Value("string"), "label": Value("int64")})
+
 # Путь к папке с JSON файлами для обучения
 TRAIN_DATA_DIR = Path(__file__).parent.parent / "sentiment_memory"
 
 # Путь для сохранения локальной модели после обучения
 MODEL_SAVE_DIR = Path(__file__).parent.parent / "local_models" / "sentiment_classifier"
 
-def load_training_data():
-    records = []
-    for json_file in TRAIN_DATA_DIR.glob("*.json"):
-        try:
-            with open(json_file, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            text = data.get("text", "")
-            label_str = data.get("label", "").upper()
-            if label_str in SENTIMENT_LABELS:
-                label_idx = SENTIMENT_LABELS.index(label_str)
-                records.append({"text": text, "label": label_idx})
-        except Exception as e:
-            logger.error(f"Ошибка чтения файла {json_file}: {e}")
-
-    if not records:
-        logger.warning("Нет данных для обучения")
+def memory_example(record: dict):
+    label_str = (record.get("label") or "").upper()
+    if label_str not in SENTIMENT_LABELS:
         return None
+    return {"text": record.get("text", ""), "label": SENTIMENT_LABELS.index(label_str)}
 
-    return Dataset.from_list(records)
+def load_training_data():
+    """
+    :return: (обучающая, отложенная) выборки; отложенная используется для выбора лучшего чекпойнта
+    """
+    train, holdout = build_dataset([TRAIN_DATA_DIR], memory_example, FEATURES, holdout=0.1)
+    if train is None:
+        logger.warning("Нет данных для обучения")
+        return None, None
+    return train, holdout
 
 def tokenize_function(examples, tokenizer):
     return tokenizer(examples["text"], truncation=True, padding="max_length", max_length=512)
@@ -42,7 +44,7 @@ def tokenize_function(examples, tokenizer):
 def main():
     logger.info("Старт дообучения классификатора тональности...")
 
-    dataset = load_training_data()
+    dataset, eval_dataset = load_training_data()
     if dataset is None:
         logger.error("Данные для обучения не найдены. Завершение.")
         return
@@ -50,6 +52,9 @@ def main():
     tokenizer = AutoTokenizer.from_pretrained(str(MODEL_SAVE_DIR))
 
     tokenized_dataset = dataset.map(lambda examples: tokenize_function(examples, tokenizer), batched=True)
+    tokenized_eval = None
+    if eval_dataset is not None:
+        tokenized_eval = eval_dataset.map(lambda examples: tokenize_function(examples, tokenizer), batched=True)
 
     model = AutoModelForSequenceClassification.from_pretrained(
         str(MODEL_SAVE_DIR),
@@ -65,8 +70,9 @@ def main():
         save_total_limit=2,
         logging_dir="./logs",
         logging_steps=50,
-        load_best_model_at_end=True,
-        evaluation_strategy="steps",
+        # Лучший чекпойнт выбирается по отложенной выборке, если она есть
+        load_best_model_at_end=tokenized_eval is not None,
+        eval_strategy="steps" if tokenized_eval is not None else "no",
         eval_steps=100,
         report_to=[]
     )
@@ -75,6 +81,7 @@ def main():
         model=model,
         args=training_args,
         train_dataset=tokenized_dataset,
+        eval_dataset=tokenized_eval,
         tokenizer=tokenizer
     )
 
@@ -4,7 +4,7 @@ from datetime import datetime
 from aiogram import Bot, Dispatcher
 
 from bot.bot_commands import set_bot_commands
-from config.config import BOT_TOKEN
+from config.config import BOT_TOKEN, INGEST_MODE, WEB_API_ENABLED, DIGESTS_ENABLED, INFERENCE_BACKEND
 from bot.handlers import router
 from config.logger import logger
 
@@ -15,17 +15,57 @@ RESET = "\033[0m"
 print(f"{BLUE}[{datetime.now().strftime('%H:%M:%S')}] Старт бота{RESET}")
 print(f"{BLUE}[{datetime.now().strftime('%H:%M:%S')}] Инициализация бота...{RESET}")
 
+# Фоновые задачи бота: ссылки на них держим сами, иначе event loop может удалить задачу сборщиком мусора
+background_tasks = set()
+
+def on_background_done(task: asyncio.Task):
+    background_tasks.discard(task)
+    if not task.cancelled() and task.exception():
+        logger.error(f"Фоновая задача {task.get_name()} завершилась с ошибкой", exc_info=task.exception())
+
+def start_background(coro, name: str) -> asyncio.Task:
+    task = asyncio.create_task(coro, name=name)
+    background_tasks.add(task)
+    task.add_done_callback(on_background_done)
+    return task
+
+async def stop_background():
+    for task in list(background_tasks):
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+
 async def main():
+    bot = None
     try:
         bot = Bot(token=BOT_TOKEN, parse_mode="HTML")
         dp = Dispatcher()
         dp.include_router(router)
         await set_bot_commands(bot)
+        if INFERENCE_BACKEND == "local":
+            # Новые версии моделей подхватываются без перезапуска бота
+            from services.model_registry import start_watcher
+            start_watcher()
+        if INGEST_MODE == "stream":
+            from services.stream_ingest import run_stream_ingest
+            start_background(run_stream_ingest(), "stream_ingest")
+            logger.info("Потоковая загрузка постов запущена")
+        elif INGEST_MODE == "poll":
+            from services.ingest_scheduler import run_ingest_scheduler
+            start_background(run_ingest_scheduler(), "ingest_scheduler")
+            logger.info("Планировщик опроса каналов запущен")
+        if DIGESTS_ENABLED:
+            from services.digest import run_digest_scheduler
+            start_background(run_digest_scheduler(bot), "digest_scheduler")
+        if WEB_API_ENABLED:
+            from services.web_api import run_web_api
+            start_background(run_web_api(), "web_api")
         await dp.start_polling(bot)
     except Exception as e:
         logger.exception(f"Ошибка в main: {e}")
     finally:
-        await bot.session.close()
+        await stop_background()
+        if bot is not None:
+            await bot.session.close()
         print(f"{BLUE}[{datetime.now().strftime('%H:%M:%S')}] Бот завершил работу{RESET}")
 
 if __name__ == "__main__":
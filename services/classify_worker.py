@@ -0,0 +1,78 @@
+"""
+Воркер классификации: берёт пачки постов из очереди задач, анализирует
+их и записывает результаты обратно в очередь.
+
+Воркеров можно запускать сколько угодно, в том числе на других машинах
+с общей файловой системой (путь WORK_QUEUE_PATH). Хранилище постов воркер
+не открывает: результаты переносит в него загрузчик на своём хосте.
+    python -m services.classify_worker
+    python -m services.classify_worker --batch 64 --once
+"""
+
+import argparse
+import time
+
+from config.config import INFERENCE_BACKEND, WORK_QUEUE_BATCH, WORK_QUEUE_IDLE_SECONDS, WORK_QUEUE_LEASE_SECONDS
+from config.logger import logger
+from core.analysis import analyze_batch
+from services import model_registry
+from services.work_queue import work_queue, worker_id
+
+
+class ClassifyWorker:
+    def __init__(self, queue=work_queue, analyze=analyze_batch,
+                 batch_size: int = WORK_QUEUE_BATCH, lease_seconds: float = WORK_QUEUE_LEASE_SECONDS):
+        self.queue = queue
+        self.analyze = analyze
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.owner = worker_id()
+        self.processed = 0
+
+    def run_once(self) -> int:
+        """
+        Обрабатывает одну пачку.
+        :return: Количество обработанных постов (0, если очередь пуста)
+        """
+        jobs = self.queue.lease(self.owner, self.batch_size, self.lease_seconds)
+        if not jobs:
+            return 0
+        job_ids = [job_id for job_id, _ in jobs]
+        posts = [post for _, post in jobs]
+        try:
+            analyzed = self.analyze(posts)
+            # Результаты и отметка о выполнении пишутся одной транзакцией очереди
+            completed = self.queue.complete(self.owner, job_ids, analyzed)
+        except Exception as e:
+            logger.error(f"Воркер {self.owner}: ошибка при обработке пачки из {len(jobs)} постов: {e}")
+            self.queue.fail(self.owner, job_ids, str(e))
+            return 0
+        if completed < len(job_ids):
+            logger.warning(
+                f"Воркер {self.owner}: аренда {len(job_ids) - completed} задач истекла до завершения"
+            )
+        self.processed += len(jobs)
+        logger.info(f"Воркер {self.owner}: обработано {len(jobs)} постов (всего {self.processed})")
+        return len(jobs)
+
+    def run(self, once: bool = False):
+        logger.info(f"Воркер классификации {self.owner} запущен")
+        if INFERENCE_BACKEND == "local" and not once:
+            model_registry.start_watcher()
+        while True:
+            done = self.run_once()
+            if not done:
+                if once:
+                    return
+                time.sleep(WORK_QUEUE_IDLE_SECONDS)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Воркер классификации постов из очереди задач")
+    parser.add_argument("--batch", type=int, default=WORK_QUEUE_BATCH, help="Размер пачки")
+    parser.add_argument("--once", action="store_true", help="Завершиться, когда очередь опустеет")
+    args = parser.parse_args()
+    try:
+        ClassifyWorker(batch_size=args.batch).run(once=args.once)
+    except KeyboardInterrupt:
+        pass
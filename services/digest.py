@@ -0,0 +1,260 @@
+"""
+Регулярные дайджесты для подписчиков.
+
+Каждый различный дайджест (категория + период) считается один раз в день — заранее,
+в непиковое время DIGEST_PRECOMPUTE_AT, — и рассылается всем его подписчикам.
+Посты одного периода загружаются и классифицируются один раз для всех категорий.
+Готовые PDF берутся из общего кэша отчётов (services.storage.report_cache): файл
+загружается в Telegram один раз, дальше отправляется по file_id.
+
+Рассылка идёт через общий ограничитель скорости (DIGEST_SEND_RATE сообщений в секунду
+на бота, не чаще раза в секунду в один чат) и обрабатывает RetryAfter от Bot API.
+Если время доставки наступило раньше предрасчёта, дайджест считается по требованию —
+тоже один раз на всех подписчиков. При сетевых ошибках доставка повторяется на следующих
+проверках, но не больше DIGEST_MAX_ATTEMPTS раз за день.
+"""
+
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+
+from aiogram import Bot, types
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+
+from config.config import (DIGEST_CHECK_SECONDS, DIGEST_MAX_ATTEMPTS, DIGEST_PRECOMPUTE_AT, DIGEST_SEND_CONCURRENCY,
+                           DIGEST_SEND_RATE, INGEST_MODE, MODEL_RESCORE_STALE)
+from config.logger import logger
+from core.categorizer import classify_and_analyze
+from core.filters import filter_news_by_period
+from core.report_builder import build_pdf_report_parts
+from core.sentimenter import analyze_sentiment_batch
+from services.post_store import post_store
+from services.stream_ingest import rescore_stale_posts
+from services.storage import content_hash, report_cache, report_cache_key
+from services.subscriptions import parse_send_at, subscription_store
+from services.telegram_api import fetch_news_from_channels
+from shared.constants import CATEGORY_LABELS, PERIOD_DAYS, PERIOD_LABELS
+
+# Минимальный интервал между сообщениями в один чат, с
+PER_CHAT_INTERVAL = 1.0
+
+
+class RateLimiter:
+    """
+    Ограничитель «не больше rate событий в секунду» для корутин одного event loop.
+    """
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate
+        self.next_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            now = time.monotonic()
+            wait = self.next_at - now
+            self.next_at = max(now, self.next_at) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+async def load_classified_news(period: str) -> list:
+    """
+    Классифицированные посты за период: из хранилища или, в режиме history, загрузкой из каналов.
+    """
+    since = datetime.now(timezone.utc) - timedelta(days=PERIOD_DAYS[period])
+    if INGEST_MODE != "history":
+        analyzed_news = await asyncio.to_thread(post_store.query, since)
+        if MODEL_RESCORE_STALE:
+            analyzed_news = await asyncio.to_thread(rescore_stale_posts, analyzed_news)
+        return analyzed_news
+
+    all_news = await fetch_news_from_channels(period_days=PERIOD_DAYS[period])
+    news_in_period = filter_news_by_period(all_news, period)
+    analyzed_news = await asyncio.to_thread(classify_and_analyze, news_in_period)
+    sentiments = await asyncio.to_thread(
+        analyze_sentiment_batch, [(post.get("text", ""), post) for post in analyzed_news]
+    )
+    for post, (label, score) in zip(analyzed_news, sentiments):
+        post["sentiment"], post["sentiment_score"] = label, score
+    await asyncio.to_thread(post_store.upsert_posts, analyzed_news)
+    return analyzed_news
+
+
+class DigestScheduler:
+    def __init__(self, bot: Bot, store=subscription_store, rate: float = DIGEST_SEND_RATE,
+                 concurrency: int = DIGEST_SEND_CONCURRENCY, precompute_at: str = DIGEST_PRECOMPUTE_AT):
+        self.bot = bot
+        self.store = store
+        self.limiter = RateLimiter(rate)
+        self.concurrency = concurrency
+        self.precompute_at = parse_send_at(precompute_at)
+        # (категория, период, дата) -> {'cache_key', 'posts'}; cache_key None — постов нет
+        self.digests = {}
+        self.precomputed_date = None
+
+    async def build_digests(self, keys: list, digest_date: str):
+        """
+        Считает дайджесты для ключей (категория, период): посты каждого периода загружаются один раз.
+        """
+        periods = {}
+        for category, period in keys:
+            if (category, period, digest_date) not in self.digests:
+                periods.setdefault(period, []).append(category)
+
+        for period, categories in periods.items():
+            started = time.monotonic()
+            analyzed_news = await load_classified_news(period)
+            for category in categories:
+                filtered = [post for post in analyzed_news if category in post.get("categories", [])]
+                digest = {"cache_key": None, "posts": len(filtered)}
+                if filtered:
+                    version = content_hash(filtered)
+                    digest["cache_key"] = report_cache_key(category, period, version)
+                    if report_cache.get(digest["cache_key"]) is None:
+                        pdf_paths = await asyncio.to_thread(
+                            build_pdf_report_parts, filtered, period, category, version
+                        )
+                        report_cache.put(digest["cache_key"], pdf_paths)
+                self.digests[(category, period, digest_date)] = digest
+            logger.info(f"Дайджесты за период '{period}' ({', '.join(categories)}) "
+                        f"посчитаны за {time.monotonic() - started:.1f} с")
+
+    async def ensure_digest(self, category: str, period: str, digest_date: str) -> dict:
+        key = (category, period, digest_date)
+        if key not in self.digests:
+            await self.build_digests([(category, period)], digest_date)
+        return self.digests[key]
+
+    async def send_document(self, chat_id: int, document, caption: str):
+        while True:
+            await self.limiter.acquire()
+            try:
+                return await self.bot.send_document(chat_id, document, caption=caption)
+            except TelegramRetryAfter as e:
+                logger.warning(f"Bot API просит подождать {e.retry_after} с перед отправкой дайджеста")
+                await asyncio.sleep(e.retry_after)
+
+    async def send_text(self, chat_id: int, text: str):
+        while True:
+            await self.limiter.acquire()
+            try:
+                return await self.bot.send_message(chat_id, text)
+            except TelegramRetryAfter as e:
+                await asyncio.sleep(e.retry_after)
+
+    async def deliver(self, subscription: dict, digest: dict, digest_date: str, upload_lock: asyncio.Lock):
+        user_id = subscription["user_id"]
+        category, period = subscription["category"], subscription["period"]
+        category_name = CATEGORY_LABELS.get(category, category)
+        period_label = PERIOD_LABELS.get(period, period).lower()
+        try:
+            if digest["cache_key"] is None:
+                await self.send_text(user_id,
+                                     f"Дайджест: нет постов в категории \"{category_name}\" за {period_label}.")
+            else:
+                caption = f"Дайджест: \"{category_name}\" за {period_label}."
+                entry = report_cache.get(digest["cache_key"])
+                uploaded = False
+                if entry is not None and not all(part.get("file_id") for part in entry["files"]):
+                    # Файл загружает первый получатель, остальные ждут и отправляют его по file_id
+                    async with upload_lock:
+                        entry = report_cache.get(digest["cache_key"])
+                        if entry is not None and not all(part.get("file_id") for part in entry["files"]):
+                            await self.send_parts(user_id, entry, caption, digest["cache_key"])
+                            uploaded = True
+                if entry is None:
+                    raise RuntimeError("дайджест вытеснен из кэша отчётов")
+                if not uploaded:
+                    await self.send_parts(user_id, entry, caption, digest["cache_key"])
+            self.store.mark_delivered(user_id, category, period, digest_date)
+        except TelegramForbiddenError:
+            # Пользователь заблокировал бота — подписки больше не нужны
+            logger.info(f"Пользователь {user_id} заблокировал бота, подписки удалены")
+            self.store.unsubscribe(user_id)
+        except TelegramBadRequest as e:
+            logger.error(f"Дайджест {category}/{period} не доставлен пользователю {user_id}: {e}")
+            self.store.mark_delivered(user_id, category, period, digest_date, status="failed")
+
+    async def send_parts(self, user_id: int, entry: dict, caption: str, cache_key: str):
+        files = entry["files"]
+        file_ids = []
+        for n, part in enumerate(files, 1):
+            if n > 1:
+                await asyncio.sleep(PER_CHAT_INTERVAL)
+            part_caption = caption if len(files) == 1 else f"{caption} Часть {n} из {len(files)}."
+            document = part.get("file_id") or types.FSInputFile(part["path"])
+            sent = await self.send_document(user_id, document, part_caption)
+            file_ids.append(sent.document.file_id)
+        if not all(part.get("file_id") for part in files):
+            report_cache.put(cache_key, [part["path"] for part in files], file_ids)
+
+    async def deliver_due(self, now: datetime):
+        due = await asyncio.to_thread(self.store.due, now)
+        if not due:
+            return
+        digest_date = now.date().isoformat()
+        groups = {}
+        for subscription in due:
+            groups.setdefault((subscription["category"], subscription["period"]), []).append(subscription)
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        for (category, period), subscriptions in groups.items():
+            try:
+                digest = await self.ensure_digest(category, period, digest_date)
+                if digest["cache_key"] and report_cache.get(digest["cache_key"]) is None:
+                    # PDF вытеснен из кэша отчётов после предрасчёта — считаем заново
+                    self.digests.pop((category, period, digest_date), None)
+                    digest = await self.ensure_digest(category, period, digest_date)
+            except Exception as e:
+                logger.error(f"Ошибка при расчёте дайджеста {category}/{period}: {e}")
+                continue
+            upload_lock = asyncio.Lock()
+
+            async def deliver_one(subscription):
+                async with semaphore:
+                    try:
+                        await self.deliver(subscription, digest, digest_date, upload_lock)
+                    except Exception as e:
+                        # Сетевые ошибки: повторим на следующей проверке, пока не исчерпаны попытки
+                        attempts = await asyncio.to_thread(
+                            self.store.record_failure, subscription["user_id"], category, period, digest_date, str(e)
+                        )
+                        logger.error(f"Ошибка при отправке дайджеста пользователю {subscription['user_id']} "
+                                     f"(попытка {attempts} из {DIGEST_MAX_ATTEMPTS}): {e}")
+
+            started = time.monotonic()
+            await asyncio.gather(*(deliver_one(subscription) for subscription in subscriptions))
+            logger.info(f"Дайджест {category}/{period} разослан {len(subscriptions)} подписчикам "
+                        f"за {time.monotonic() - started:.1f} с")
+
+    async def tick(self):
+        now = datetime.now()
+        digest_date = now.date().isoformat()
+        # Дайджесты прошлых дней больше не нужны
+        self.digests = {key: value for key, value in self.digests.items() if key[2] == digest_date}
+        if self.precomputed_date != digest_date and now.strftime("%H:%M") >= self.precompute_at:
+            self.precomputed_date = digest_date
+            keys = await asyncio.to_thread(self.store.keys)
+            if keys:
+                logger.info(f"Предрасчёт дайджестов: {len(keys)}")
+                try:
+                    await self.build_digests(keys, digest_date)
+                except Exception as e:
+                    logger.error(f"Ошибка при предрасчёте дайджестов: {e}")
+            await asyncio.to_thread(self.store.purge_deliveries, (now.date() - timedelta(days=7)).isoformat())
+        await self.deliver_due(now)
+
+    async def run(self, check_seconds: float = DIGEST_CHECK_SECONDS):
+        logger.info(f"Планировщик дайджестов запущен: предрасчёт в {self.precompute_at}, "
+                    f"рассылка до {1 / self.limiter.interval:.0f} сообщений/с")
+        while True:
+            try:
+                await self.tick()
+            except Exception as e:
+                logger.error(f"Ошибка в планировщике дайджестов: {e}")
+            await asyncio.sleep(check_seconds)
+
+
+async def run_digest_scheduler(bot: Bot):
+    await DigestScheduler(bot).run()
@@ -0,0 +1,154 @@
+"""
+Постоянный кэш разрешённых каналов Telegram.
+
+Разрешение юзернейма (ResolveUsernameRequest) — отдельный запрос к Telegram
+с жёсткими лимитами. Кэш хранит id, access_hash и название канала, чтобы
+загрузка и проверка источников обращались к каналу сразу по InputPeer.
+"""
+
+import json
+import os
+import time
+
+from telethon import utils
+from telethon.errors import ChannelInvalidError, ChannelPrivateError, UsernameNotOccupiedError
+from telethon.tl.types import InputPeerChannel, InputPeerChat, InputPeerUser
+
+from config.config import ENTITY_CACHE_PATH, ENTITY_CACHE_TTL_HOURS, PINNED_CACHE_TTL_HOURS
+from config.logger import logger
+
+# Ошибки, после которых запись кэша больше не годится: канал закрыт, удалён или пересоздан.
+# FloodWait и сетевые ошибки запись не сбрасывают — иначе повтор ударит по лимиту разрешения юзернеймов
+STALE_ENTITY_ERRORS = (ChannelPrivateError, ChannelInvalidError, UsernameNotOccupiedError)
+
+
+class EntityCache:
+    """
+    Записи: {канал: {'type', 'id', 'access_hash', 'title', 'resolved_at'}} в JSON-файле.
+    Рядом хранится текст закреплённого поста канала ('pinned', 'pinned_at') для предфильтра.
+    """
+
+    def __init__(self, path: str = ENTITY_CACHE_PATH, ttl: float = ENTITY_CACHE_TTL_HOURS * 3600,
+                 pinned_ttl: float = PINNED_CACHE_TTL_HOURS * 3600):
+        self.path = path
+        self.ttl = ttl
+        self.pinned_ttl = pinned_ttl
+        self._entries = self._load()
+
+    def _load(self) -> dict:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            logger.error(f"Ошибка чтения кэша каналов: {e}")
+            return {}
+
+    def save(self):
+        folder = os.path.dirname(self.path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def key(channel) -> str:
+        return str(channel).strip().lstrip("@").lower()
+
+    def get(self, channel):
+        """
+        :return: InputPeer канала или None, если записи нет или она устарела
+        """
+        entry = self._entries.get(self.key(channel))
+        if entry is None or time.time() - entry.get("resolved_at", 0) > self.ttl:
+            return None
+        if entry["type"] == "channel":
+            return InputPeerChannel(entry["id"], entry["access_hash"])
+        if entry["type"] == "user":
+            return InputPeerUser(entry["id"], entry["access_hash"])
+        return InputPeerChat(entry["id"])
+
+    def title(self, channel) -> str:
+        entry = self._entries.get(self.key(channel))
+        return entry.get("title") if entry else None
+
+    def put(self, channel, entity):
+        peer = utils.get_input_peer(entity)
+        if isinstance(peer, InputPeerChannel):
+            entry = {"type": "channel", "id": peer.channel_id, "access_hash": peer.access_hash}
+        elif isinstance(peer, InputPeerUser):
+            entry = {"type": "user", "id": peer.user_id, "access_hash": peer.access_hash}
+        else:
+            entry = {"type": "chat", "id": getattr(peer, "chat_id", None), "access_hash": None}
+        entry["title"] = getattr(entity, "title", None) or getattr(entity, "username", None)
+        entry["resolved_at"] = time.time()
+        self._entries[self.key(channel)] = entry
+
+    def pinned(self, channel) -> str:
+        """
+        :return: Текст закреплённого поста ('' — закреплённого нет) или None, если его пора перечитать
+        """
+        entry = self._entries.get(self.key(channel))
+        if entry is None or "pinned" not in entry or time.time() - entry.get("pinned_at", 0) > self.pinned_ttl:
+            return None
+        return entry["pinned"]
+
+    def put_pinned(self, channel, text: str):
+        entry = self._entries.get(self.key(channel))
+        if entry is not None:
+            entry["pinned"] = text or ""
+            entry["pinned_at"] = time.time()
+            self.save()
+
+    def invalidate(self, channel):
+        if self._entries.pop(self.key(channel), None) is not None:
+            self.save()
+
+    def invalidate_on_error(self, channel, error: Exception) -> bool:
+        """
+        Удаляет запись канала, если ошибка означает, что запись устарела.
+        :return: True, если запись удалена
+        """
+        if isinstance(error, STALE_ENTITY_ERRORS):
+            self.invalidate(channel)
+            return True
+        return False
+
+    async def resolve(self, client, channel, save: bool = True):
+        """
+        InputPeer канала из кэша или, при промахе, через get_entity с сохранением в кэш.
+        :param save: Сразу записать кэш на диск (при пакетном разрешении — один раз в конце)
+        """
+        peer = self.get(channel)
+        if peer is not None:
+            return peer
+        entity = await client.get_entity(channel)
+        self.put(channel, entity)
+        if save:
+            self.save()
+        return utils.get_input_peer(entity)
+
+    async def verify(self, client, channel, save: bool = True):
+        """
+        Проверяет доступность канала. Запись из кэша проверяется дешёвым запросом
+        по InputPeer (без разрешения юзернейма); если Telegram её отверг, канал
+        разрешается заново. При промахе — как resolve.
+        :return: InputPeer канала
+        """
+        peer = self.get(channel)
+        if peer is not None:
+            try:
+                entity = await client.get_entity(peer)
+                self.put(channel, entity)
+                if save:
+                    self.save()
+                return utils.get_input_peer(entity)
+            except STALE_ENTITY_ERRORS:
+                self.invalidate(channel)
+        return await self.resolve(client, channel, save=save)
+
+
+entity_cache = EntityCache()
@@ -0,0 +1,139 @@
+"""
+Выгрузка постов из хранилища в машиночитаемые форматы: CSV, JSONL и Parquet.
+
+Посты читаются пачками (PostStore.iter_batches) и сразу пишутся в файл, поэтому
+память постоянна при любом объёме выгрузки. CSV и JSONL можно сжать gzip,
+Parquet сжимается кодеком внутри файла (zstd) и пишется группой строк на пачку.
+
+    python -m services.exporter --format parquet --period month --category economics
+"""
+
+import argparse
+import csv
+import gzip
+import json
+import os
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from config.config import EXPORT_BATCH_SIZE, EXPORT_DIR
+from config.logger import logger
+from services.post_store import post_store
+from shared.constants import CATEGORY_LABELS, STATS_PERIOD_DAYS
+
+EXPORT_FORMATS = ("csv", "jsonl", "parquet")
+CSV_FIELDS = ["url", "channel", "message_id", "created_at", "edited_at", "categories", "sentiment",
+              "sentiment_score", "text"]
+
+
+def open_text(path: str, compress: bool):
+    if compress:
+        return gzip.open(path, "wt", encoding="utf-8", newline="", compresslevel=6)
+    return open(path, "w", encoding="utf-8", newline="")
+
+
+def write_csv(batches, path: str, compress: bool) -> int:
+    rows = 0
+    with open_text(path, compress) as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        for batch in batches:
+            for post in batch:
+                writer.writerow(dict(post, categories=";".join(post["categories"])))
+            rows += len(batch)
+    return rows
+
+
+def write_jsonl(batches, path: str, compress: bool) -> int:
+    rows = 0
+    with open_text(path, compress) as f:
+        for batch in batches:
+            f.write("".join(json.dumps(post, ensure_ascii=False) + "\n" for post in batch))
+            rows += len(batch)
+    return rows
+
+
+def write_parquet(batches, path: str, compress: bool) -> int:
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Для выгрузки в Parquet нужен пакет pyarrow")
+
+    schema = pa.schema([
+        ("url", pa.string()),
+        ("channel", pa.string()),
+        ("message_id", pa.int64()),
+        ("created_at", pa.timestamp("us", tz="UTC")),
+        ("edited_at", pa.timestamp("us", tz="UTC")),
+        ("categories", pa.list_(pa.string())),
+        ("sentiment", pa.string()),
+        ("sentiment_score", pa.float64()),
+        ("text", pa.string()),
+    ])
+    rows = 0
+    with pq.ParquetWriter(path, schema, compression="zstd" if compress else "none") as writer:
+        for batch in batches:
+            columns = {name: [post.get(name) for post in batch] for name in schema.names}
+            for name in ("created_at", "edited_at"):
+                columns[name] = [datetime.fromisoformat(value) if value else None for value in columns[name]]
+            writer.write_table(pa.table(columns, schema=schema))
+            rows += len(batch)
+    return rows
+
+
+WRITERS = {"csv": write_csv, "jsonl": write_jsonl, "parquet": write_parquet}
+
+
+def export_path(fmt: str, period: str, category: str = None, compress: bool = True, folder: str = EXPORT_DIR) -> str:
+    """
+    Уникальное имя файла: одинаковые выгрузки, запущенные в одну секунду, не пишут в один файл.
+    """
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    name = f"posts_{category or 'all'}_{period}_{stamp}_{uuid.uuid4().hex[:8]}.{fmt}"
+    if compress and fmt != "parquet":
+        name += ".gz"
+    return os.path.join(folder, name)
+
+
+def export_posts(fmt: str, path: str, since: datetime, until: datetime = None, category: str = None,
+                 channels: list = None, compress: bool = True, batch_size: int = EXPORT_BATCH_SIZE,
+                 store=post_store) -> int:
+    """
+    Выгружает посты за интервал в файл.
+    :param fmt: csv, jsonl или parquet
+    :param compress: gzip для CSV/JSONL, zstd внутри Parquet
+    :return: Количество выгруженных постов
+    """
+    if fmt not in WRITERS:
+        raise ValueError(f"Неизвестный формат выгрузки: {fmt}")
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    started = time.monotonic()
+    batches = store.iter_batches(since, until, category=category, channels=channels, batch_size=batch_size)
+    tmp_path = f"{path}.part"
+    try:
+        rows = WRITERS[fmt](batches, tmp_path, compress)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    logger.info(f"Выгрузка {path}: {rows} постов, {os.path.getsize(path) / 2 ** 20:.1f} МБ "
+                f"за {time.monotonic() - started:.1f} с")
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Выгрузка постов из хранилища")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+    parser.add_argument("--period", choices=list(STATS_PERIOD_DAYS), default="month")
+    parser.add_argument("--category", choices=list(CATEGORY_LABELS), default=None)
+    parser.add_argument("--out", default=None, help="Путь к файлу (по умолчанию в EXPORT_DIR)")
+    parser.add_argument("--no-compress", action="store_true")
+    args = parser.parse_args()
+
+    days = STATS_PERIOD_DAYS[args.period]
+    out = args.out or export_path(args.format, args.period, args.category, not args.no_compress)
+    export_posts(args.format, out, datetime.now(timezone.utc) - timedelta(days=days),
+                 category=args.category, compress=not args.no_compress)
+    print(f"Выгрузка сохранена: {out}")
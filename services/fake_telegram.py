@@ -0,0 +1,31 @@
+"""
+Локальная замена TelegramClient для нагрузочных прогонов и бенчмарков без сети.
+
+Сообщения берутся из переданных постов, например синтетических
+(dataset.generate_data_set). Эмуляция API Telethon — в services.offline_telegram;
+архив записи воспроизводит services.fetch_replay.
+"""
+
+import asyncio
+
+from services.offline_telegram import OfflineTelegramClient
+
+
+class FakeTelegramClient(OfflineTelegramClient):
+    def __init__(self, posts: list, page_size: int = 100, page_latency: float = 0.0):
+        """
+        :param posts: Посты (dict с 'channel', 'message_id', 'created_at', 'text')
+        :param page_size: Сообщений на одну «страницу» ответа
+        :param page_latency: Задержка на страницу, с (имитация сети)
+        """
+        super().__init__()
+        self.page_size = page_size
+        self.page_latency = page_latency
+        for post in posts:
+            self.add_message(post["channel"], post["message_id"], post["created_at"], post.get("text"),
+                             post.get("edited_at"))
+        self.sort_messages()
+
+    async def pause(self, channel: str, msg, n: int):
+        if self.page_latency and n % self.page_size == 0:
+            await asyncio.sleep(self.page_latency)
@@ -0,0 +1,75 @@
+"""
+Запись и воспроизведение истории каналов, полученной fetch_news_from_channels.
+
+Архив — JSONL в gzip: строка-заголовок и по строке на каждое прочитанное сообщение
+(включая сообщения без текста и то, на котором чтение остановилось по дате), с
+короткими ключами и датами в секундах. Вместе с сообщением пишется пауза от
+предыдущего, поэтому при воспроизведении можно повторить темп сети или ускорить его.
+
+Воспроизведение (services.fetch_replay.ReplayTelegramClient) возвращает тот же поток
+сообщений без сети: замеры пайплайна можно сравнивать между прогонами на одинаковых
+реальных данных.
+
+    FETCH_RECORD_DIR=data/fetch_archive python main.py           # запись
+    FETCH_REPLAY_PATH=data/fetch_archive/fetch_...jsonl.gz ...   # воспроизведение
+"""
+
+import gzip
+import json
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+
+from config.logger import logger
+
+ARCHIVE_VERSION = 1
+
+
+def archive_path(folder: str, period_days: int) -> str:
+    """
+    Имя архива уникально: две загрузки в одну секунду (или из разных процессов) не перезапишут друг друга.
+    """
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
+    return os.path.join(folder, f"fetch_{stamp}_{period_days}d_{os.getpid()}_{uuid.uuid4().hex[:6]}.jsonl.gz")
+
+
+class FetchRecorder:
+    """
+    Пишет сообщения по мере загрузки. Файл сначала создаётся с суффиксом .part
+    и переименовывается в close(), поэтому незавершённая запись не выглядит архивом.
+    """
+
+    def __init__(self, path: str, period_days: int, channels: list):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.count = 0
+        self.last = time.monotonic()
+        self.file = gzip.open(f"{path}.part", "wt", encoding="utf-8", compresslevel=9)
+        self._write({
+            "archive": "fetch",
+            "version": ARCHIVE_VERSION,
+            "recorded_at": time.time(),
+            "period_days": period_days,
+            "channels": list(channels),
+        })
+
+    def _write(self, record: dict):
+        self.file.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+    def record(self, channel: str, msg):
+        now = time.monotonic()
+        record = {"c": channel, "id": msg.id, "d": int(msg.date.timestamp()), "dt": round(now - self.last, 4)}
+        if msg.text:
+            record["t"] = msg.text
+        if getattr(msg, "edit_date", None):
+            record["e"] = int(msg.edit_date.timestamp())
+        self._write(record)
+        self.last = now
+        self.count += 1
+
+    def close(self):
+        self.file.close()
+        os.replace(f"{self.path}.part", self.path)
+        logger.info(f"Записано сообщений в архив {self.path}: {self.count} "
+                    f"({os.path.getsize(self.path) / 1024:.0f} КБ)")
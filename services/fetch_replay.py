@@ -0,0 +1,63 @@
+"""
+Воспроизведение архива загрузки каналов (services.fetch_archive) вместо Telegram.
+
+Эмуляция API Telethon общая с заглушкой бенчмарков (services.offline_telegram);
+ReplayTelegramClient только загружает архив и повторяет записанные паузы.
+Модуль импортируется только при заданном FETCH_REPLAY_PATH.
+"""
+
+import asyncio
+import gzip
+import json
+import time
+from datetime import datetime, timezone
+from functools import lru_cache
+
+from config.logger import logger
+from services.offline_telegram import OfflineTelegramClient
+
+
+@lru_cache(maxsize=4)
+def load_archive(path: str) -> tuple:
+    """
+    :return: (заголовок, список записей сообщений в порядке загрузки)
+    """
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        header = json.loads(f.readline())
+        if header.get("archive") != "fetch":
+            raise ValueError(f"{path}: не архив загрузки каналов")
+        records = [json.loads(line) for line in f if line.strip()]
+    return header, records
+
+
+class ReplayTelegramClient(OfflineTelegramClient):
+    """
+    Источник сообщений из архива вместо Telegram.
+    """
+
+    def __init__(self, path: str, speed: float = 0.0, shift_dates: bool = True):
+        """
+        :param path: Файл архива
+        :param speed: Ускорение относительно записанного темпа (2 — вдвое быстрее); 0 — без пауз
+        :param shift_dates: Сдвинуть даты так, будто загрузка записана сейчас: выборки по периоду совпадут
+        """
+        super().__init__()
+        header, records = load_archive(path)
+        shift = time.time() - header["recorded_at"] if shift_dates else 0.0
+
+        def to_datetime(ts):
+            return datetime.fromtimestamp(ts + shift, timezone.utc) if ts is not None else None
+
+        self.speed = speed
+        self.delays = {}
+        for r in records:
+            self.add_message(r["c"], r["id"], to_datetime(r["d"]), r.get("t"), to_datetime(r.get("e")))
+            self.delays[(r["c"], r["id"])] = r.get("dt", 0.0)
+        self.sort_messages()
+        logger.info(f"Воспроизведение архива {path}: {len(records)} сообщений, "
+                    f"{len(self.messages)} каналов, записан {datetime.fromtimestamp(header['recorded_at'])}")
+
+    async def pause(self, channel: str, msg, n: int):
+        # Записанная пауза перед сообщением, ускоренная в speed раз
+        if self.speed:
+            await asyncio.sleep(self.delays.get((channel, msg.id), 0.0) / self.speed)
@@ -0,0 +1,168 @@
+"""
+Клиент сервера инференса (services.inference_server).
+
+Используется core.categorizer и core.sentimenter при INFERENCE_BACKEND=remote:
+модели загружены один раз в сервере, а процессы бота только отправляют запросы.
+Протокол — JSON-строки через Unix-сокет, у каждого потока своё соединение.
+"""
+
+import itertools
+import json
+import socket
+import threading
+
+from config.config import INFERENCE_SOCKET, INFERENCE_TIMEOUT, INFERENCE_MAX_BATCH
+from config.logger import logger
+from services import model_registry
+
+# Поля поста, которые нужны моделям на сервере
+POST_FIELDS = ("clean_text", "input_ids", "tokenizer_id")
+
+_local = threading.local()
+_ids = itertools.count(1)
+
+
+class InferenceError(Exception):
+    pass
+
+
+def _connection(path: str) -> tuple:
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(INFERENCE_TIMEOUT)
+        sock.connect(path)
+        conn = (sock, sock.makefile("rb"))
+        _local.conn = conn
+    return conn
+
+
+def _reset_connection():
+    conn = getattr(_local, "conn", None)
+    _local.conn = None
+    if conn is not None:
+        try:
+            conn[1].close()
+            conn[0].close()
+        except OSError:
+            pass
+
+
+def _call(payload: dict, path: str) -> dict:
+    """
+    Отправляет одно сообщение серверу и возвращает его ответ.
+    """
+    data = (json.dumps(payload, ensure_ascii=False) + "\n").encode("utf-8")
+
+    # Одна повторная попытка: сервер мог перезапуститься и закрыть старое соединение
+    for attempt in range(2):
+        try:
+            sock, reader = _connection(path)
+            sock.sendall(data)
+            line = reader.readline()
+            if not line:
+                raise ConnectionError("сервер закрыл соединение")
+            break
+        except (OSError, ConnectionError) as e:
+            _reset_connection()
+            if attempt:
+                logger.error(f"Сервер инференса недоступен ({path}): {e}")
+                raise InferenceError(str(e))
+
+    response = json.loads(line)
+    if response.get("error"):
+        raise InferenceError(response["error"])
+    # Версии рабочих моделей сервера: по ним процесс бота узнаёт о замене модели
+    model_registry.report_versions(response.get("models"))
+    return response
+
+
+def request(task: str, items: list, path: str = INFERENCE_SOCKET) -> list:
+    """
+    Отправляет пакет постов на сервер и ждёт ответа.
+    :param task: "category" или "sentiment"
+    :param items: Список (text, post)
+    :return: Результаты в том же порядке
+    """
+    return request_versioned(task, items, path)[0]
+
+
+def request_versioned(task: str, items: list, path: str = INFERENCE_SOCKET) -> tuple:
+    """
+    То же, что request, вместе с версиями моделей, посчитавших результаты.
+    :return: (результаты, версия модели для каждого результата)
+    """
+    payload = {
+        "id": next(_ids),
+        "task": task,
+        "items": [
+            {"text": text, **{k: (post or {}).get(k) for k in POST_FIELDS}}
+            for text, post in items
+        ],
+    }
+    response = _call(payload, path)
+    results = response["results"]
+    return results, response.get("versions") or [None] * len(results)
+
+
+def request_batched(task: str, items: list, batch_size: int = INFERENCE_MAX_BATCH) -> list:
+    """
+    Отправляет посты запросами по batch_size: сервер всё равно режет батчи по
+    INFERENCE_MAX_BATCH, а слишком длинная строка запроса упрётся в его лимит.
+    """
+    return request_batched_versioned(task, items, batch_size)[0]
+
+
+def request_batched_versioned(task: str, items: list, batch_size: int = INFERENCE_MAX_BATCH) -> tuple:
+    results, versions = [], []
+    for start in range(0, len(items), batch_size):
+        chunk_results, chunk_versions = request_versioned(task, items[start:start + batch_size])
+        results.extend(chunk_results)
+        versions.extend(chunk_versions)
+    return results, versions
+
+
+def server_versions(path: str = INFERENCE_SOCKET) -> dict:
+    """
+    :return: {задача: версия рабочей модели сервера}
+    """
+    return _call({"id": next(_ids), "task": "versions"}, path).get("models") or {}
+
+
+def category_scores(text: str, post: dict = None) -> list:
+    """
+    :return: Список (категория, оценка)
+    """
+    return category_scores_batch([(text, post)])[0]
+
+
+def category_scores_batch(items: list) -> list:
+    """
+    :param items: Список (text, post)
+    :return: Для каждого поста список (категория, оценка)
+    """
+    return category_scores_versioned(items)[0]
+
+
+def category_scores_versioned(items: list) -> tuple:
+    """
+    :param items: Список (text, post)
+    :return: (для каждого поста список (категория, оценка), версия модели для каждого поста)
+    """
+    results, versions = request_batched_versioned("category", items)
+    return [[tuple(pair) for pair in scores] for scores in results], versions
+
+
+def sentiment(text: str, post: dict = None) -> tuple:
+    """
+    :return: (метка, оценка)
+    """
+    return sentiment_batch([(text, post)])[0]
+
+
+def sentiment_batch(items: list) -> list:
+    """
+    :param items: Список (text, post)
+    :return: Для каждого поста (метка, оценка)
+    """
+    return [tuple(result) for result in request_batched("sentiment", items)]
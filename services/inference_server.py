@@ -0,0 +1,292 @@
+"""
+Сервер инференса: одна копия моделей на хост вместо копии в каждом процессе бота.
+
+Сервер держит INFERENCE_REPLICAS реплик моделей, каждая в своём процессе,
+закреплённом за отдельным набором ядер, с INFERENCE_TORCH_THREADS потоками torch.
+Запросы всех клиентов по каждой задаче собираются в общие батчи (до
+INFERENCE_MAX_BATCH постов или INFERENCE_BATCH_WAIT_MS ожидания) и отдаются
+свободной реплике. Веса моделей реплики отображают из общего снимка
+(core.shared_weights), поэтому каждая новая реплика добавляет только свои активации
+и рабочую память, а не копию моделей.
+
+Запуск:
+    python -m services.inference_server
+После запуска процессы бота переключаются на сервер настройкой INFERENCE_BACKEND=remote.
+"""
+
+import asyncio
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from config.config import (
+    INFERENCE_SOCKET,
+    INFERENCE_REPLICAS,
+    INFERENCE_TORCH_THREADS,
+    INFERENCE_MAX_BATCH,
+    INFERENCE_BATCH_WAIT_MS,
+)
+from config.logger import child_log_queue, init_child_logging, logger
+
+TASKS = ("category", "sentiment")
+
+# Ограничение длины одной строки запроса (пакет постов с input_ids)
+MAX_LINE_BYTES = 16 * 1024 * 1024
+
+
+def init_replica(cores: list, threads: int, log_queue=None):
+    """
+    Инициализация процесса реплики: логи в очередь сервера, привязка к ядрам, потоки torch, загрузка моделей.
+    """
+    if log_queue is not None:
+        init_child_logging(log_queue)
+    import torch
+    from config.config import INFERENCE_MODE
+    from core import categorizer, sentimenter, cascade
+    from services import model_registry
+
+    if cores and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    torch.set_num_threads(threads)
+    torch.set_grad_enabled(False)
+
+    # При INFERENCE_BACKEND=remote модули не загружают модели при импорте — загружаем здесь
+    if categorizer.category_classifier is None:
+        categorizer.load_models()
+    if sentimenter.sentiment_classifier is None:
+        sentimenter.load_models()
+    if INFERENCE_MODE == "cascade" and cascade.category_tiny is None and cascade.sentiment_tiny is None:
+        cascade.load_models()
+    # Каждая реплика сама подхватывает новые версии моделей из local_models
+    model_registry.start_watcher()
+
+
+def run_batch(task: str, items: list) -> tuple:
+    """
+    Выполняется в процессе реплики.
+    :param items: Список dict с 'text' и полями поста
+    :return: (версия модели, посчитавшей батч, результаты)
+    """
+    from core import categorizer, sentimenter
+
+    pairs = [(item.get("text", ""), item) for item in items]
+    # Модель берётся один раз на батч: замена версии не смешает две модели в одном ответе
+    if task == "category":
+        classifier = categorizer.category_classifier
+        return classifier.version, categorizer.category_scores_batch(pairs, classifier)
+    classifier = sentimenter.sentiment_classifier
+    return classifier.version, sentimenter.sentiment_batch(pairs, classifier)
+
+
+def ping() -> tuple:
+    """
+    :return: (pid, версии загруженных моделей)
+    """
+    from services import model_registry
+
+    return os.getpid(), model_registry.current_versions()
+
+
+def replica_cores(index: int, threads: int) -> list:
+    """
+    Ядра для реплики index: непересекающиеся отрезки доступных ядер
+    (если ядер не хватает, отрезки идут по кругу).
+    """
+    if not hasattr(os, "sched_getaffinity"):
+        return []
+    available = sorted(os.sched_getaffinity(0))
+    start = (index * threads) % len(available)
+    return [available[(start + i) % len(available)] for i in range(min(threads, len(available)))]
+
+
+class Replica:
+    def __init__(self, index: int, threads: int):
+        self.index = index
+        self.cores = replica_cores(index, threads)
+        # spawn: torch и загруженные модели не должны наследоваться через fork
+        self.executor = ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_replica,
+            initargs=(self.cores, threads, child_log_queue()),
+        )
+        self.batches = 0
+        self.posts = 0
+
+
+class InferenceServer:
+    def __init__(self, path: str = INFERENCE_SOCKET, replicas: int = INFERENCE_REPLICAS,
+                 threads: int = INFERENCE_TORCH_THREADS, max_batch: int = INFERENCE_MAX_BATCH,
+                 batch_wait_ms: float = INFERENCE_BATCH_WAIT_MS):
+        self.path = path
+        self.replica_count = max(replicas, 1)
+        self.threads = max(threads, 1)
+        self.max_batch = max(max_batch, 1)
+        self.batch_wait = batch_wait_ms / 1000
+        self.replicas = []
+        self.free = None
+        self.queues = {}
+        self.server = None
+        self.batchers = []
+        # Батчи, выполняемые на репликах: event loop держит на задачи только слабые ссылки
+        self.inflight = set()
+        # Версии рабочих моделей по последним батчам: сообщаются клиентам в каждом ответе
+        self.versions = {}
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        self.replicas = [Replica(i, self.threads) for i in range(self.replica_count)]
+        # Прогрев: модели загружаются при старте, а не на первом запросе
+        infos = await asyncio.gather(*(loop.run_in_executor(r.executor, ping) for r in self.replicas))
+        self.versions = dict(infos[0][1])
+        for replica, (pid, _) in zip(self.replicas, infos):
+            logger.info(
+                f"Реплика {replica.index} готова (pid {pid}, ядра {replica.cores or 'все'}, "
+                f"потоков torch {self.threads})"
+            )
+
+        self.free = asyncio.Queue()
+        for replica in self.replicas:
+            self.free.put_nowait(replica)
+        self.queues = {task: asyncio.Queue() for task in TASKS}
+        self.batchers = [asyncio.create_task(self.batcher(task)) for task in TASKS]
+
+        folder = os.path.dirname(self.path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.server = await asyncio.start_unix_server(self.handle_client, path=self.path, limit=MAX_LINE_BYTES)
+        logger.info(f"Сервер инференса слушает {self.path}")
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        for batcher in self.batchers:
+            batcher.cancel()
+        # Дожидаемся батчей, уже отданных репликам: их клиенты получат ответ или ошибку
+        if self.inflight:
+            await asyncio.gather(*self.inflight, return_exceptions=True)
+        for replica in self.replicas:
+            replica.executor.shutdown(wait=False, cancel_futures=True)
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    async def infer(self, task: str, items: list) -> list:
+        """
+        Ставит посты в общую очередь задачи и ждёт результатов.
+        """
+        loop = asyncio.get_running_loop()
+        futures = []
+        for item in items:
+            future = loop.create_future()
+            self.queues[task].put_nowait((item, future))
+            futures.append(future)
+        return list(await asyncio.gather(*futures))
+
+    async def batcher(self, task: str):
+        """
+        Собирает батч, пока ждёт свободную реплику: под нагрузкой батчи растут сами.
+        """
+        queue = self.queues[task]
+        while True:
+            first = await queue.get()
+            replica = await self.free.get()
+            batch = [first]
+            deadline = time.monotonic() + self.batch_wait
+            while len(batch) < self.max_batch:
+                if not queue.empty():
+                    batch.append(queue.get_nowait())
+                    continue
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            inflight = asyncio.create_task(self.run_on_replica(replica, task, batch))
+            self.inflight.add(inflight)
+            inflight.add_done_callback(self.inflight.discard)
+
+    async def run_on_replica(self, replica: Replica, task: str, batch: list):
+        loop = asyncio.get_running_loop()
+        try:
+            version, results = await loop.run_in_executor(
+                replica.executor, run_batch, task, [item for item, _ in batch]
+            )
+            if version != self.versions.get(task):
+                logger.info(f"Реплика {replica.index}: модель {task} версии {version}")
+            self.versions[task] = version
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result((result, version))
+            replica.batches += 1
+            replica.posts += len(batch)
+        except Exception as e:
+            logger.error(f"Ошибка инференса на реплике {replica.index}: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            self.free.put_nowait(replica)
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                message = {}
+                try:
+                    message = json.loads(line)
+                    if message.get("task") == "versions":
+                        response = {"id": message.get("id"), "models": self.versions}
+                    elif message.get("task") not in TASKS:
+                        raise ValueError(f"неизвестная задача {message.get('task')}")
+                    else:
+                        pairs = await self.infer(message["task"], message.get("items", []))
+                        response = {
+                            "id": message.get("id"),
+                            "results": [result for result, _ in pairs],
+                            # Версия модели для каждого результата: батчи могли пройти на разных версиях
+                            "versions": [version for _, version in pairs],
+                            "models": self.versions,
+                        }
+                except Exception as e:
+                    response = {"id": message.get("id"), "error": str(e)}
+                writer.write((json.dumps(response, ensure_ascii=False) + "\n").encode("utf-8"))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def log_status(self):
+        lines = [
+            f"реплика {r.index}: батчей {r.batches}, постов {r.posts}, "
+            f"средний батч {r.posts / r.batches if r.batches else 0:.1f}"
+            for r in self.replicas
+        ]
+        logger.info("Статус сервера инференса:\n" + "\n".join(lines))
+
+
+async def run_inference_server():
+    server = InferenceServer()
+    await server.start()
+    try:
+        while True:
+            await asyncio.sleep(600)
+            server.log_status()
+    finally:
+        await server.stop()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(run_inference_server())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,215 @@
+"""
+Адаптивный планировщик опроса каналов.
+
+Для каждого канала оценивается частота публикаций (экспоненциальное скользящее
+среднее), и интервал опроса подбирается так, чтобы за один опрос приходило
+примерно POLL_TARGET_POSTS новых постов: активные каналы опрашиваются часто,
+тихие — редко. Опросы равномерно распределяются по времени, список каналов
+перечитывается из sources.yaml без перезапуска.
+
+Запуск отдельным процессом:
+    python -m services.ingest_scheduler
+"""
+
+import asyncio
+import time
+import zlib
+
+from telethon import TelegramClient
+
+from config.auth import API_ID, API_HASH, INGEST_SESSION_NAME
+from config.config import (
+    POLL_MIN_INTERVAL,
+    POLL_MAX_INTERVAL,
+    POLL_TARGET_POSTS,
+    POLL_MAX_PER_SECOND,
+    POLL_STATUS_INTERVAL,
+)
+from config.logger import logger
+from services.entity_cache import entity_cache
+from services.post_store import post_store
+from services.prefilter import prefilter
+from services.stream_ingest import StreamIngestor
+from services.telegram_api import CHANNELS, reload_channels, message_to_post
+
+# Вес нового наблюдения в оценке частоты публикаций
+RATE_ALPHA = 0.3
+
+
+class ChannelState:
+    def __init__(self, channel: str, now: float, interval: float, last_message_id: int = 0):
+        self.channel = channel
+        self.rate = POLL_TARGET_POSTS / interval  # постов в секунду
+        self.interval = interval
+        self.last_message_id = last_message_id
+        self.last_poll_at = None
+        # Детерминированный сдвиг фазы, чтобы каналы не опрашивались одновременно
+        phase = (zlib.crc32(channel.encode("utf-8")) % 1000) / 1000
+        self.next_poll_at = now + phase * interval
+        self.lag = 0.0       # средняя задержка между публикацией поста и его загрузкой, с
+        self.polls = 0
+        self.errors = 0
+
+    def update(self, new_posts: list, now: float, min_interval: float, max_interval: float):
+        """
+        Пересчитывает частоту публикаций и интервал опроса после очередного опроса.
+        """
+        if self.last_poll_at is not None:
+            elapsed = max(now - self.last_poll_at, 1.0)
+            observed = len(new_posts) / elapsed
+            self.rate = RATE_ALPHA * observed + (1 - RATE_ALPHA) * self.rate
+
+        if self.rate > 0:
+            interval = POLL_TARGET_POSTS / self.rate
+        else:
+            interval = max_interval
+        self.interval = min(max(interval, min_interval), max_interval)
+
+        if new_posts:
+            delays = [now - post["created_at"].timestamp() for post in new_posts]
+            self.lag = RATE_ALPHA * (sum(delays) / len(delays)) + (1 - RATE_ALPHA) * self.lag
+            self.last_message_id = max(self.last_message_id, max(p["message_id"] for p in new_posts))
+
+        self.last_poll_at = now
+        self.next_poll_at = now + self.interval
+        self.polls += 1
+
+
+class IngestScheduler:
+    def __init__(self, fetch=None, on_post=None, clock=time.time, store=post_store,
+                 min_interval: float = POLL_MIN_INTERVAL, max_interval: float = POLL_MAX_INTERVAL,
+                 max_per_second: float = POLL_MAX_PER_SECOND):
+        """
+        :param fetch: async-функция (channel, min_id) -> список новых постов канала
+        :param on_post: async-колбэк для каждого нового поста (обычно StreamIngestor.handle)
+        :param clock: Источник времени (подменяется в тестах)
+        :param max_per_second: Ограничение на число опросов в секунду по всем каналам
+        """
+        self.fetch = fetch
+        self.on_post = on_post
+        self.clock = clock
+        self.store = store
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.max_per_second = max_per_second
+        self.states = {}
+        self.sync_channels()
+
+    def sync_channels(self):
+        """
+        Приводит набор состояний в соответствие с текущим списком каналов.
+        """
+        now = self.clock()
+        for channel in CHANNELS:
+            if channel not in self.states:
+                last_id = self.store.last_message_id(channel) if self.store else 0
+                self.states[channel] = ChannelState(channel, now, self.min_interval, last_id)
+                logger.info(f"Канал {channel} добавлен в расписание опроса")
+        for channel in list(self.states):
+            if channel not in CHANNELS:
+                del self.states[channel]
+                logger.info(f"Канал {channel} удалён из расписания опроса")
+
+    def due_channels(self) -> list:
+        now = self.clock()
+        due = [state for state in self.states.values() if state.next_poll_at <= now]
+        return sorted(due, key=lambda state: state.next_poll_at)
+
+    async def poll(self, state: ChannelState):
+        try:
+            posts = await self.fetch(state.channel, state.last_message_id)
+        except Exception as e:
+            state.errors += 1
+            logger.error(f"Ошибка при опросе канала {state.channel}: {e}")
+            state.next_poll_at = self.clock() + self.min_interval
+            return
+        for post in posts:
+            await self.on_post(post)
+        state.update(posts, self.clock(), self.min_interval, self.max_interval)
+
+    async def tick(self):
+        """
+        Один шаг планировщика: перечитывает источники и опрашивает каналы, которым пора.
+        Опросы идут не чаще max_per_second, чтобы нагрузка распределялась по интервалу.
+        """
+        if reload_channels():
+            self.sync_channels()
+        for state in self.due_channels():
+            started = self.clock()
+            await self.poll(state)
+            pause = 1 / self.max_per_second - (self.clock() - started)
+            if pause > 0:
+                await asyncio.sleep(pause)
+
+    def status(self) -> dict:
+        """
+        Метрики по каналам: оценка частоты (постов в час), интервал опроса и задержка загрузки.
+        """
+        now = self.clock()
+        return {
+            channel: {
+                "rate_per_hour": state.rate * 3600,
+                "interval": state.interval,
+                "lag": state.lag,
+                "since_last_poll": now - state.last_poll_at if state.last_poll_at else None,
+                "polls": state.polls,
+                "errors": state.errors,
+            }
+            for channel, state in self.states.items()
+        }
+
+    def log_status(self):
+        lines = []
+        for channel, m in sorted(self.status().items(), key=lambda item: -item[1]["rate_per_hour"]):
+            lines.append(
+                f"{channel}: {m['rate_per_hour']:.1f} пост/ч, интервал {m['interval']:.0f} с, "
+                f"задержка {m['lag']:.0f} с, опросов {m['polls']}, ошибок {m['errors']}"
+            )
+        logger.info("Статус опроса каналов:\n" + "\n".join(lines))
+        dropped = prefilter.summary()
+        if dropped:
+            logger.info("Предфильтр постов:\n" + dropped)
+
+    async def run(self):
+        last_status = self.clock()
+        while True:
+            await self.tick()
+            if self.clock() - last_status >= POLL_STATUS_INTERVAL:
+                self.log_status()
+                last_status = self.clock()
+            upcoming = min((s.next_poll_at for s in self.states.values()), default=self.clock() + 1)
+            await asyncio.sleep(min(max(upcoming - self.clock(), 0.1), 5.0))
+
+
+async def run_ingest_scheduler():
+    """
+    Запускает планировщик с загрузкой через Telethon и анализом через StreamIngestor.
+    """
+    ingestor = StreamIngestor()
+    consumer = asyncio.create_task(ingestor.run())
+
+    async with TelegramClient(INGEST_SESSION_NAME, API_ID, API_HASH) as client:
+        async def fetch(channel: str, min_id: int) -> list:
+            posts = []
+            # При первом опросе канала берём только последние сообщения, а не всю историю
+            limit = None if min_id else POLL_TARGET_POSTS
+            # Сообщения без текста тоже возвращаем: они сдвигают last_message_id, а анализатор их пропустит
+            try:
+                entity = await entity_cache.resolve(client, channel)
+                async for msg in client.iter_messages(entity, min_id=min_id, limit=limit):
+                    posts.append(message_to_post(msg, channel))
+            except Exception as e:
+                entity_cache.invalidate_on_error(channel, e)
+                raise
+            return posts
+
+        scheduler = IngestScheduler(fetch=fetch, on_post=ingestor.handle)
+        try:
+            await scheduler.run()
+        finally:
+            await ingestor.stop()
+            await consumer
+
+
+if __name__ == "__main__":
+    asyncio.run(run_ingest_scheduler())
@@ -0,0 +1,172 @@
+"""
+Версии моделей и их горячая перезагрузка.
+
+Версия модели — отпечаток файлов её папки в local_models (имена, размеры, время
+изменения). Она попадает в ключи кэша отчётов и в хранилище постов вместе с
+результатами классификации, поэтому результаты старой модели не выдаются за новые.
+
+ModelWatcher раз в MODEL_WATCH_SECONDS проверяет папки моделей. Когда отпечаток
+изменился и не меняется между двумя проверками (обучение дописало файлы), новая
+версия загружается и прогревается в фоне, а затем подменяет рабочую одной
+операцией присваивания. Запросы, уже получившие старую модель, дорабатывают на ней.
+
+При INFERENCE_BACKEND=remote модели держит сервер инференса: версии берутся из его
+ответов (и запроса версий раз в DISK_VERSION_TTL), а не по папкам на диске. Поэтому
+версия в процессах бота меняется, только когда сервер сообщил о замене модели, а не
+пока обучение дописывает файлы.
+
+Модуль не импортирует torch: версии нужны и процессам без моделей (INFERENCE_BACKEND=remote).
+"""
+
+import hashlib
+import threading
+import time
+from pathlib import Path
+
+from config.config import INFERENCE_BACKEND, MODEL_WATCH_SECONDS
+from config.logger import logger
+
+MODELS_DIR = Path(__file__).parent.parent / "local_models"
+MODEL_DIRS = {
+    "category": MODELS_DIR / "category_classifier",
+    "sentiment": MODELS_DIR / "sentiment_classifier",
+}
+# Файлы, изменение которых означает новую версию модели
+MODEL_FILE_SUFFIXES = (".json", ".bin", ".safetensors", ".txt", ".model")
+# Как долго доверять отпечаткам папок, если модели в процессе не загружены, с
+DISK_VERSION_TTL = 5.0
+
+_versions = {}
+_disk_versions = {"checked_at": 0.0, "versions": {}}
+_reported_versions = {"checked_at": 0.0, "versions": {}}
+_reload_lock = threading.Lock()
+
+
+def directory_version(path: Path) -> str:
+    """
+    Отпечаток папки модели или None, если папки нет (например, идёт замена версии).
+    """
+    path = Path(path)
+    if not path.is_dir():
+        return None
+    digest = hashlib.sha1()
+    files = sorted(p for p in path.iterdir() if p.is_file() and p.suffix in MODEL_FILE_SUFFIXES)
+    if not files:
+        return None
+    for file in files:
+        stat = file.stat()
+        digest.update(f"{file.name}:{stat.st_size}:{stat.st_mtime_ns}\n".encode("utf-8"))
+    return digest.hexdigest()[:12]
+
+
+def set_version(name: str, version: str):
+    _versions[name] = version
+
+
+def report_versions(versions: dict):
+    """
+    Запоминает версии моделей, о которых сообщил сервер инференса.
+    """
+    if versions:
+        _reported_versions["versions"] = {**_reported_versions["versions"], **versions}
+        _reported_versions["checked_at"] = time.monotonic()
+
+
+def server_versions() -> dict:
+    """
+    Версии моделей сервера инференса: из последнего ответа или запросом, если он старше DISK_VERSION_TTL.
+    """
+    from services import inference_client
+
+    now = time.monotonic()
+    if now - _reported_versions["checked_at"] > DISK_VERSION_TTL:
+        _reported_versions["checked_at"] = now
+        try:
+            report_versions(inference_client.server_versions())
+        except Exception as e:
+            logger.warning(f"Не удалось получить версии моделей сервера инференса: {e}")
+    return dict(_reported_versions["versions"])
+
+
+def current_versions() -> dict:
+    """
+    Версии загруженных в процесс моделей; если моделей в процессе нет, — версии
+    сервера инференса (INFERENCE_BACKEND=remote) или по папкам на диске.
+    """
+    if _versions:
+        return dict(_versions)
+    if INFERENCE_BACKEND == "remote":
+        versions = server_versions()
+        if versions:
+            return versions
+    now = time.monotonic()
+    if now - _disk_versions["checked_at"] > DISK_VERSION_TTL:
+        _disk_versions["versions"] = {name: directory_version(path) for name, path in MODEL_DIRS.items()}
+        _disk_versions["checked_at"] = now
+    return dict(_disk_versions["versions"])
+
+
+def combined_version(overrides: dict = None) -> str:
+    """
+    Общая версия всех моделей: меняется при замене любой из них.
+    :param overrides: Версии отдельных моделей вместо текущих (например, той, что посчитала результат)
+    """
+    versions = {**current_versions(), **(overrides or {})}
+    raw = ",".join(f"{name}@{versions[name]}" for name in sorted(versions))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:8]
+
+
+def reload_model(name: str, force: bool = False) -> bool:
+    """
+    Загружает новую версию модели, если она отличается от рабочей (или force).
+    :return: True, если модель заменена
+    """
+    from core import categorizer, sentimenter
+
+    module = {"category": categorizer, "sentiment": sentimenter}[name]
+    with _reload_lock:
+        version = directory_version(MODEL_DIRS[name])
+        if version is None or (not force and version == _versions.get(name)):
+            return False
+        logger.info(f"Модель {name}: загрузка версии {version} (рабочая {_versions.get(name)})")
+        return module.reload_models()
+
+
+class ModelWatcher(threading.Thread):
+    def __init__(self, interval: float = MODEL_WATCH_SECONDS):
+        super().__init__(name="model-watcher", daemon=True)
+        self.interval = interval
+        self._seen = {}
+
+    def check(self):
+        for name, path in MODEL_DIRS.items():
+            version = directory_version(path)
+            if version is None or version == _versions.get(name):
+                self._seen.pop(name, None)
+                continue
+            # Перезагружаем, только когда папка перестала меняться
+            if self._seen.get(name) == version:
+                self._seen.pop(name, None)
+                reload_model(name)
+            else:
+                self._seen[name] = version
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.check()
+            except Exception as e:
+                logger.error(f"Ошибка при проверке версий моделей: {e}")
+
+
+def start_watcher(interval: float = MODEL_WATCH_SECONDS):
+    """
+    Запускает наблюдение за папками моделей в текущем процессе (если interval > 0).
+    """
+    if interval <= 0:
+        return None
+    watcher = ModelWatcher(interval)
+    watcher.start()
+    logger.info(f"Наблюдение за версиями моделей: раз в {interval:.0f} с")
+    return watcher
@@ -0,0 +1,79 @@
+"""
+Общая основа клиентов Telegram без сети: синтетических постов для нагрузочных
+прогонов (services.fake_telegram) и записанного архива загрузки (services.fetch_replay).
+
+Поддерживает ту часть API Telethon, которой пользуется проект: асинхронный
+контекстный менеджер, get_entity, get_messages и iter_messages (от новых к старым,
+с min_id и limit). Наследники только загружают сообщения (add_message) и задают
+паузу перед выдачей сообщения (pause).
+"""
+
+import zlib
+from datetime import datetime
+
+from telethon.tl.types import InputPeerChannel
+
+
+class OfflineMessage:
+    def __init__(self, message_id: int, date: datetime, text: str, edit_date: datetime = None):
+        self.id = message_id
+        self.date = date
+        self.text = text
+        self.edit_date = edit_date
+
+
+def channel_peer(channel: str) -> InputPeerChannel:
+    return InputPeerChannel(zlib.crc32(channel.encode("utf-8")), 0)
+
+
+class OfflineTelegramClient:
+    def __init__(self):
+        # канал -> сообщения от новых к старым (после sort_messages)
+        self.messages = {}
+        self.names = {}
+
+    def add_message(self, channel: str, message_id: int, date: datetime, text: str, edit_date: datetime = None):
+        self.names[channel_peer(channel).channel_id] = channel
+        self.messages.setdefault(channel, []).append(OfflineMessage(message_id, date, text, edit_date))
+
+    def sort_messages(self):
+        # Как в Telegram: id сообщений канала растут вместе с датой, выдача — от новых к старым
+        for messages in self.messages.values():
+            messages.sort(key=lambda msg: msg.id, reverse=True)
+
+    async def pause(self, channel: str, msg: OfflineMessage, n: int):
+        """
+        Пауза перед выдачей n-го сообщения канала (имитация сети). По умолчанию без пауз.
+        """
+
+    def __call__(self, *args, **kwargs):
+        # Подменяет класс TelegramClient: TelegramClient(session, api_id, api_hash) вернёт этот объект
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def get_entity(self, channel):
+        if channel not in self.messages:
+            raise ValueError(f"No user has \"{channel}\" as username")
+        return channel_peer(channel)
+
+    async def get_messages(self, entity, ids=None):
+        # Закреплённых постов нет ни в синтетических каналах, ни в архиве
+        return None
+
+    async def iter_messages(self, entity, min_id: int = 0, limit: int = None):
+        if isinstance(entity, InputPeerChannel):
+            channel = self.names.get(entity.channel_id)
+        else:
+            channel = entity
+        if channel not in self.messages:
+            raise ValueError(f"Cannot find any entity corresponding to \"{entity}\"")
+        for n, msg in enumerate(self.messages[channel]):
+            if msg.id <= min_id or (limit is not None and n >= limit):
+                return
+            await self.pause(channel, msg, n)
+            yield msg
@@ -0,0 +1,423 @@
+"""
+Локальное хранилище постов (SQLite).
+
+Хранит уже классифицированные посты, чтобы отчёты за период собирались
+запросом к базе, а не повторной загрузкой и классификацией.
+
+Рядом ведутся почасовые агрегаты (rollups): число постов и сумма оценок тональности
+по ключу (час UTC, канал, категория, тональность). Они обновляются в той же транзакции,
+что и посты (с вычитанием прежнего вклада при перезаписи), поэтому сводки за месяц
+и квартал считаются по агрегатам без чтения самих постов.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from array import array
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from config.config import POST_STORE_PATH
+from config.logger import logger
+from services import model_registry
+from shared.utils import to_utc_iso
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS posts (
+    url TEXT PRIMARY KEY,
+    channel TEXT NOT NULL,
+    message_id INTEGER,
+    text TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    edited_at TEXT,
+    categories TEXT,
+    sentiment TEXT,
+    sentiment_score REAL,
+    input_ids BLOB,
+    tokenizer_id TEXT,
+    stored_at TEXT NOT NULL,
+    model_version TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_posts_created_at ON posts (created_at);
+CREATE INDEX IF NOT EXISTS idx_posts_channel_created_at ON posts (channel, created_at);
+CREATE INDEX IF NOT EXISTS idx_posts_stored_at ON posts (stored_at);
+CREATE TABLE IF NOT EXISTS rollups (
+    hour TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    category TEXT NOT NULL,
+    sentiment TEXT NOT NULL,
+    posts INTEGER NOT NULL,
+    score_sum REAL NOT NULL,
+    PRIMARY KEY (hour, channel, category, sentiment)
+) WITHOUT ROWID;
+"""
+
+# Как группировать часы агрегатов в интервалы для rollup(bucket=...).
+# Неделя обозначается датой своего понедельника (как неделя ISO, но без номера):
+# %W в SQLite считает недели от первого понедельника года и делит неделю на стыке лет
+ROLLUP_BUCKETS = {
+    "hour": "hour",
+    "day": "substr(hour, 1, 10)",
+    "week": "date(substr(hour, 1, 10), '-6 days', 'weekday 1')",
+    "month": "substr(hour, 1, 7)",
+}
+ROLLUP_GROUP_COLUMNS = ("channel", "category", "sentiment")
+# Колонки постов для выдачи наружу (API, выгрузки): без служебных input_ids и stored_at
+EXPORT_COLUMNS = "url, channel, message_id, text, created_at, edited_at, categories, sentiment, sentiment_score"
+# Сколько url проверять одним запросом при поиске прежних версий постов
+LOOKUP_CHUNK = 500
+
+# Колонки, добавленные после первой версии схемы: (имя, тип)
+MIGRATIONS = [
+    ("input_ids", "BLOB"),
+    ("tokenizer_id", "TEXT"),
+    ("model_version", "TEXT"),
+]
+
+
+class PostStore:
+    def __init__(self, path: str = POST_STORE_PATH):
+        self.path = path
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        # WAL позволяет читать отчёты параллельно с записью новых постов
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._lock, self._conn:
+            self._conn.executescript(SCHEMA)
+            self._migrate()
+            if self._conn.execute("SELECT 1 FROM rollups LIMIT 1").fetchone() is None:
+                self._rebuild_rollups()
+
+    def _migrate(self):
+        existing = {row["name"] for row in self._conn.execute("PRAGMA table_info(posts)")}
+        for column, column_type in MIGRATIONS:
+            if column not in existing:
+                self._conn.execute(f"ALTER TABLE posts ADD COLUMN {column} {column_type}")
+                logger.info(f"Хранилище постов: добавлена колонка {column}")
+                if column == "model_version":
+                    # Посты, сохранённые до учёта версий, считаем посчитанными текущими моделями
+                    self._conn.execute("UPDATE posts SET model_version = ?", (model_registry.combined_version(),))
+
+    def _rebuild_rollups(self):
+        """
+        Пересчитывает агрегаты по всем постам (при первом запуске после обновления схемы).
+        """
+        deltas = defaultdict(lambda: [0, 0.0])
+        cursor = self._conn.execute("SELECT channel, created_at, categories, sentiment, sentiment_score FROM posts")
+        for row in cursor:
+            add_contribution(deltas, tuple(row), 1)
+        if deltas:
+            self._apply_rollup_deltas(deltas)
+            logger.info(f"Хранилище постов: агрегаты пересчитаны, ключей: {len(deltas)}")
+
+    def _apply_rollup_deltas(self, deltas: dict):
+        self._conn.executemany(
+            """
+            INSERT INTO rollups (hour, channel, category, sentiment, posts, score_sum)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(hour, channel, category, sentiment) DO UPDATE SET
+                posts = posts + excluded.posts,
+                score_sum = score_sum + excluded.score_sum
+            """,
+            [(*key, count, score) for key, (count, score) in deltas.items() if count or score],
+        )
+        # Ключи, из которых ушли все посты (пост переклассифицирован), удаляем
+        self._conn.executemany(
+            "DELETE FROM rollups WHERE hour = ? AND channel = ? AND category = ? AND sentiment = ? AND posts <= 0",
+            [key for key, (count, _) in deltas.items() if count < 0],
+        )
+
+    def _previous_versions(self, urls: list) -> list:
+        rows = []
+        for start in range(0, len(urls), LOOKUP_CHUNK):
+            chunk = urls[start:start + LOOKUP_CHUNK]
+            rows.extend(self._conn.execute(
+                f"""
+                SELECT channel, created_at, categories, sentiment, sentiment_score FROM posts
+                WHERE url IN ({','.join('?' * len(chunk))})
+                """,
+                chunk,
+            ).fetchall())
+        return rows
+
+    def upsert_posts(self, posts: list) -> int:
+        """
+        Добавляет или обновляет посты (по url). Отредактированные посты перезаписываются.
+        :param posts: Список dict с 'url', 'channel', 'text', 'created_at' и результатами анализа
+        :return: Количество записанных постов
+        """
+        now = datetime.now(timezone.utc).isoformat()
+        rows = [
+            (
+                post["url"],
+                post.get("channel", ""),
+                post.get("message_id"),
+                post.get("text", ""),
+                to_utc_iso(post["created_at"]),
+                to_utc_iso(post["edited_at"]) if post.get("edited_at") else None,
+                json.dumps(post.get("categories", []), ensure_ascii=False),
+                post.get("sentiment"),
+                post.get("sentiment_score"),
+                encode_ids(post.get("input_ids")),
+                post.get("tokenizer_id"),
+                now,
+                post.get("model_version"),
+            )
+            for post in posts if post.get("url")
+        ]
+        # Повторы одного url в пачке: сохраняется последняя версия
+        rows = list({row[0]: row for row in rows}.values())
+        # Вклад в агрегаты: новые версии постов минус прежние (для отредактированных и переклассифицированных)
+        deltas = defaultdict(lambda: [0, 0.0])
+        for row in rows:
+            add_contribution(deltas, (row[1], row[4], row[6], row[7], row[8]), 1)
+
+        with self._lock, self._conn:
+            for row in self._previous_versions(list({row[0] for row in rows})):
+                add_contribution(deltas, tuple(row), -1)
+            self._conn.executemany(
+                """
+                INSERT INTO posts (url, channel, message_id, text, created_at, edited_at,
+                                   categories, sentiment, sentiment_score, input_ids, tokenizer_id, stored_at,
+                                   model_version)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(url) DO UPDATE SET
+                    text = excluded.text,
+                    edited_at = excluded.edited_at,
+                    categories = excluded.categories,
+                    sentiment = excluded.sentiment,
+                    sentiment_score = excluded.sentiment_score,
+                    input_ids = excluded.input_ids,
+                    tokenizer_id = excluded.tokenizer_id,
+                    stored_at = excluded.stored_at,
+                    model_version = excluded.model_version
+                """,
+                rows,
+            )
+            self._apply_rollup_deltas(deltas)
+        return len(rows)
+
+    def query(self, since: datetime, until: datetime = None, category: str = None,
+              channels: list = None) -> list:
+        """
+        Возвращает посты за интервал [since, until), от новых к старым.
+        :param category: Оставить только посты этой категории
+        :param channels: Оставить только посты этих каналов
+        """
+        sql = "SELECT * FROM posts WHERE created_at >= ?"
+        params = [to_utc_iso(since)]
+        if until is not None:
+            sql += " AND created_at < ?"
+            params.append(to_utc_iso(until))
+        if channels:
+            sql += f" AND channel IN ({','.join('?' * len(channels))})"
+            params.extend(channels)
+        sql += " ORDER BY created_at DESC"
+
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+
+        posts = [row_to_post(row) for row in rows]
+        if category:
+            posts = [post for post in posts if category in post["categories"]]
+        return posts
+
+    def page(self, since: datetime, until: datetime = None, category: str = None, channel: str = None,
+             after: tuple = None, limit: int = 20) -> list:
+        """
+        Страница постов от новых к старым для постраничного просмотра (keyset-пагинация).
+        :param after: (created_at, url) последнего поста предыдущей страницы
+        :return: Посты без input_ids; created_at — строка UTC ISO, как в базе
+        """
+        sql, params = posts_filter(since, until, category, [channel] if channel else None)
+        if after:
+            sql += " AND (created_at < ? OR (created_at = ? AND url < ?))"
+            params.extend([after[0], after[0], after[1]])
+
+        with self._lock:
+            rows = self._conn.execute(
+                f"""
+                SELECT {EXPORT_COLUMNS} FROM posts {sql} ORDER BY created_at DESC, url DESC LIMIT ?
+                """,
+                params + [limit],
+            ).fetchall()
+        posts = []
+        for row in rows:
+            post = dict(row)
+            post["categories"] = json.loads(post["categories"] or "[]")
+            posts.append(post)
+        return posts
+
+    def iter_batches(self, since: datetime, until: datetime = None, category: str = None,
+                     channels: list = None, batch_size: int = 5000):
+        """
+        Посты за интервал пачками по batch_size (от новых к старым), без input_ids.
+        Читает через отдельное соединение только для чтения: при WAL выгрузка
+        не блокирует запись новых постов, а память не зависит от объёма выборки.
+        :return: Генератор списков dict; categories — список, даты — строки UTC ISO
+        """
+        sql, params = posts_filter(since, until, category, channels)
+        conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+        conn.row_factory = sqlite3.Row
+        try:
+            cursor = conn.execute(f"SELECT {EXPORT_COLUMNS} FROM posts {sql} ORDER BY created_at DESC", params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    return
+                batch = []
+                for row in rows:
+                    post = dict(row)
+                    post["categories"] = json.loads(post["categories"] or "[]")
+                    batch.append(post)
+                yield batch
+        finally:
+            conn.close()
+
+    def last_modified(self) -> str:
+        """
+        Время последней записи (UTC ISO) или None для пустого хранилища. Меняется при любом
+        изменении постов и агрегатов, поэтому подходит как версия данных для HTTP-кэширования.
+        """
+        with self._lock:
+            return self._conn.execute("SELECT MAX(stored_at) FROM posts").fetchone()[0]
+
+    def rollup(self, since: datetime, until: datetime = None, group_by: tuple = ("category",),
+               bucket: str = None, channels: list = None, categories: list = None, sentiments: list = None) -> list:
+        """
+        Сводка по агрегатам за интервал [since, until) с точностью до часа (UTC).
+        Пост с несколькими категориями учитывается в каждой из них.
+        :param group_by: Поля группировки из ROLLUP_GROUP_COLUMNS
+        :param bucket: Разбивка по времени: hour, day, week (дата понедельника), month (UTC); None — итог за интервал
+        :return: Список dict с полями группировки, 'bucket' (если задан), 'posts', 'score_sum', 'score_avg'
+        """
+        group_by = list(group_by)
+        unknown = set(group_by) - set(ROLLUP_GROUP_COLUMNS)
+        if unknown or (bucket is not None and bucket not in ROLLUP_BUCKETS):
+            raise ValueError(f"Неизвестная группировка: {sorted(unknown) or bucket}")
+        columns = ([f"{ROLLUP_BUCKETS[bucket]} AS bucket"] if bucket else []) + group_by
+        group = (["bucket"] if bucket else []) + group_by
+
+        sql = "WHERE hour >= ?"
+        params = [to_utc_iso(since)[:13]]
+        if until is not None:
+            sql += " AND hour < ?"
+            params.append(to_utc_iso(until)[:13])
+        for column, values in (("channel", channels), ("category", categories), ("sentiment", sentiments)):
+            if values:
+                sql += f" AND {column} IN ({','.join('?' * len(values))})"
+                params.extend(values)
+
+        select = ", ".join(columns + ["SUM(posts) AS posts", "SUM(score_sum) AS score_sum"])
+        sql = f"SELECT {select} FROM rollups {sql}"
+        if group:
+            sql += f" GROUP BY {', '.join(group)} ORDER BY {', '.join(group)}"
+
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+
+        result = []
+        for row in rows:
+            item = dict(row)
+            if not item["posts"]:
+                continue
+            item["score_avg"] = item["score_sum"] / item["posts"]
+            result.append(item)
+        return result
+
+    def last_message_id(self, channel: str) -> int:
+        """
+        Идентификатор последнего сохранённого сообщения канала (0, если постов нет).
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MAX(message_id) FROM posts WHERE channel = ?", (channel,)
+            ).fetchone()
+        return row[0] or 0
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM posts").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def posts_filter(since: datetime, until: datetime = None, category: str = None, channels: list = None) -> tuple:
+    """
+    Условие WHERE и параметры для выборки постов по интервалу, категории и каналам.
+    """
+    sql = "WHERE created_at >= ?"
+    params = [to_utc_iso(since)]
+    if until is not None:
+        sql += " AND created_at < ?"
+        params.append(to_utc_iso(until))
+    if channels:
+        sql += f" AND channel IN ({','.join('?' * len(channels))})"
+        params.extend(channels)
+    if category:
+        # categories — JSON-массив ключей, ключ в кавычках не совпадёт с частью другого ключа
+        sql += " AND categories LIKE ?"
+        params.append(f'%"{category}"%')
+    return sql, params
+
+
+def add_contribution(deltas: dict, row: tuple, sign: int):
+    """
+    Добавляет в deltas вклад одного поста в агрегаты (sign = -1 — вычесть прежнюю версию).
+    :param row: (channel, created_at в UTC ISO, categories в JSON, sentiment, sentiment_score)
+    """
+    channel, created_at, categories, sentiment, score = row
+    categories = json.loads(categories or "[]")
+    if not categories or not sentiment:
+        return
+    hour = created_at[:13]
+    for category in categories:
+        delta = deltas[(hour, channel, category, sentiment.upper())]
+        delta[0] += sign
+        delta[1] += sign * (score or 0.0)
+
+
+def encode_ids(input_ids) -> bytes:
+    """
+    Компактное хранение input_ids: массив uint32 вместо JSON.
+    """
+    if not input_ids:
+        return None
+    return array("I", input_ids).tobytes()
+
+
+def decode_ids(blob) -> list:
+    if not blob:
+        return None
+    ids = array("I")
+    ids.frombytes(blob)
+    return ids.tolist()
+
+
+def row_to_post(row) -> dict:
+    return {
+        "url": row["url"],
+        "channel": row["channel"],
+        "message_id": row["message_id"],
+        "text": row["text"],
+        # Как и при загрузке из Telegram, дата переводится в локальное время
+        "created_at": datetime.fromisoformat(row["created_at"]).astimezone(),
+        "edited_at": datetime.fromisoformat(row["edited_at"]).astimezone() if row["edited_at"] else None,
+        "categories": json.loads(row["categories"] or "[]"),
+        "sentiment": row["sentiment"],
+        "sentiment_score": row["sentiment_score"],
+        "input_ids": decode_ids(row["input_ids"]),
+        "tokenizer_id": row["tokenizer_id"],
+        "model_version": row["model_version"],
+    }
+
+
+post_store = PostStore()
@@ -0,0 +1,239 @@
+"""
+Дешёвый предфильтр постов перед инференсом.
+
+Отсекает посты, на которые не стоит тратить модели: короткие и пустые по
+содержанию, состоящие из ссылок или эмодзи, рекламные (маркировка erid,
+«на правах рекламы»), репосты из других каналов, повторы закреплённого
+или заданного шаблона, а также посты, подходящие под правила канала.
+Проверки — регулярные выражения и подсчёт символов, микросекунды на пост.
+
+Правила берутся из PREFILTER_RULES_PATH (YAML), файл необязателен:
+
+    defaults:
+      min_chars: 25
+      drop_forwarded: true
+    channels:
+      ria56_news:
+        min_chars: 10
+        ad_markers: ["партнёрский материал"]
+        templates: ["Подписывайтесь на наш канал"]
+        drop_patterns: ["^Погода на завтра"]
+      vedomosti:
+        enabled: false
+
+Счётчики отброшенных постов по каналам и причинам копятся в PreFilter.dropped.
+"""
+
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict
+
+import yaml
+
+from config.config import PREFILTER_ENABLED, PREFILTER_RULES_PATH
+from config.logger import logger
+
+DEFAULT_RULES = {
+    "enabled": True,
+    # Минимум символов и слов текста без ссылок и эмодзи
+    "min_chars": 25,
+    "min_words": 4,
+    # Максимальная доля символов, занятых ссылками / эмодзи
+    "max_link_ratio": 0.6,
+    "max_emoji_ratio": 0.3,
+    "drop_forwarded": True,
+    # Маркировка рекламы по закону («Реклама. ООО …, erid: …»); маркеры ищутся целыми словами
+    "ad_markers": ["erid", "#реклама", "на правах рекламы", "реклама. ооо", "реклама. ип", "реклама. ао"],
+    # Тексты шаблонов канала; закреплённые посты добавляются к ним автоматически
+    "templates": [],
+    # Текст, повторившийся в стольких разных постах канала, считается шаблоном (0 — не учитывать)
+    "template_repeats": 3,
+    "drop_patterns": [],
+}
+REASON_LABELS = {
+    "short": "короткие",
+    "links": "ссылки",
+    "emoji": "эмодзи",
+    "ad": "реклама",
+    "forwarded": "репосты",
+    "template": "шаблоны",
+    "pattern": "правила канала",
+}
+# Сколько последних отпечатков текстов помнить на канал для поиска повторов
+TEMPLATE_WINDOW = 500
+# Как часто проверять, не изменился ли файл правил, с
+RULES_CHECK_SECONDS = 30
+
+# Те же шаблоны, что в core.preprocessing (без загрузки токенизатора)
+URL_PATTERN = re.compile(r"https?://\S+|www\.\S+|t\.me/\S+", flags=re.IGNORECASE)
+EMOJI_PATTERN = re.compile(
+    "["
+    "\U0001F000-\U0001FAFF"
+    "\u2600-\u26FF\u2700-\u27BF"
+    "\uFE0F\u200D"
+    "]", flags=re.UNICODE)
+WORD_PATTERN = re.compile(r"\w{2,}")
+FINGERPRINT_DROP_PATTERN = re.compile(r"[\W\d_]+")
+
+
+def fingerprint(text: str) -> str:
+    """
+    Отпечаток текста без ссылок, цифр и пунктуации: шаблон с меняющимися датами и числами совпадает.
+    """
+    text = FINGERPRINT_DROP_PATTERN.sub(" ", URL_PATTERN.sub(" ", text.lower())).strip()
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16] if text else ""
+
+
+class PreFilter:
+    def __init__(self, path: str = PREFILTER_RULES_PATH, enabled: bool = PREFILTER_ENABLED):
+        self.path = path
+        self.enabled = enabled
+        self.defaults = dict(DEFAULT_RULES)
+        self.channel_rules = {}
+        self.dropped = defaultdict(Counter)
+        self.passed = Counter()
+        self._rules_mtime = None
+        self._rules_checked_at = 0.0
+        self._compiled = {}
+        self._templates = defaultdict(set)
+        self._seen = defaultdict(OrderedDict)
+        self._lock = threading.Lock()
+        self.reload_rules()
+
+    def reload_rules(self) -> bool:
+        """
+        Перечитывает файл правил, если он изменился.
+        :return: True, если правила перечитаны
+        """
+        self._rules_checked_at = time.monotonic()
+        try:
+            mtime = os.path.getmtime(self.path) if self.path else None
+        except OSError:
+            mtime = None
+        if mtime == self._rules_mtime:
+            return False
+        data = {}
+        if mtime is not None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    data = yaml.safe_load(f) or {}
+            except Exception as e:
+                logger.error(f"Ошибка чтения правил предфильтра {self.path}: {e}")
+                return False
+        self.defaults = {**DEFAULT_RULES, **(data.get("defaults") or {})}
+        self.channel_rules = {str(channel): rules or {} for channel, rules in (data.get("channels") or {}).items()}
+        self._compiled = {}
+        self._rules_mtime = mtime
+        if mtime is not None:
+            logger.info(f"Правила предфильтра загружены из {self.path}: каналов с правилами {len(self.channel_rules)}")
+        return True
+
+    def rules_for(self, channel: str) -> dict:
+        rules = self._compiled.get(channel)
+        if rules is None:
+            rules = {**self.defaults, **self.channel_rules.get(channel, {})}
+            rules["ad_markers"] = [
+                re.compile(r"(?<!\w)" + re.escape(marker) + r"(?!\w)", flags=re.IGNORECASE)
+                for marker in rules["ad_markers"]
+            ]
+            rules["drop_patterns"] = [re.compile(p, flags=re.IGNORECASE | re.MULTILINE) for p in rules["drop_patterns"]]
+            rules["templates"] = {fingerprint(text) for text in rules["templates"]} - {""}
+            self._compiled[channel] = rules
+        return rules
+
+    def remember_template(self, channel: str, text: str):
+        """
+        Запоминает текст (например, закреплённого поста) как шаблон канала.
+        """
+        mark = fingerprint(text or "")
+        if mark:
+            with self._lock:
+                self._templates[channel].add(mark)
+
+    def _repeated(self, channel: str, mark: str, url: str, repeats: int) -> bool:
+        seen = self._seen[channel]
+        urls = seen.pop(mark, set())
+        if len(urls) < repeats:
+            urls.add(url)
+        seen[mark] = urls
+        while len(seen) > TEMPLATE_WINDOW:
+            seen.popitem(last=False)
+        return len(urls) >= repeats
+
+    def drop_reason(self, post: dict) -> str:
+        """
+        Причина отбросить пост или None, если пост идёт в инференс.
+        """
+        channel = post.get("channel", "")
+        rules = self.rules_for(channel)
+        if not rules["enabled"]:
+            return None
+        text = post.get("text") or ""
+
+        if post.get("pinned"):
+            # Закреплённый пост сам по себе может быть новостью, но его повторы — шаблон
+            self.remember_template(channel, text)
+        elif rules["drop_forwarded"] and post.get("forwarded"):
+            return "forwarded"
+
+        if any(marker.search(text) for marker in rules["ad_markers"]):
+            return "ad"
+        if any(pattern.search(text) for pattern in rules["drop_patterns"]):
+            return "pattern"
+
+        without_links = URL_PATTERN.sub("", text)
+        content = EMOJI_PATTERN.sub("", without_links)
+        if text and (len(text) - len(without_links)) / len(text) > rules["max_link_ratio"]:
+            return "links"
+        if without_links and (len(without_links) - len(content)) / len(without_links) > rules["max_emoji_ratio"]:
+            return "emoji"
+        if len(content.strip()) < rules["min_chars"] or len(WORD_PATTERN.findall(content)) < rules["min_words"]:
+            return "short"
+
+        mark = fingerprint(text)
+        with self._lock:
+            if mark in rules["templates"] or mark in self._templates[channel]:
+                return "template" if not post.get("pinned") else None
+            if rules["template_repeats"] and self._repeated(channel, mark, post.get("url"), rules["template_repeats"]):
+                return "template"
+        return None
+
+    def check(self, post: dict) -> str:
+        """
+        Проверяет пост и учитывает результат в счётчиках.
+        :return: Причина отбросить пост или None
+        """
+        if not self.enabled:
+            return None
+        if time.monotonic() - self._rules_checked_at > RULES_CHECK_SECONDS:
+            self.reload_rules()
+        reason = self.drop_reason(post)
+        channel = post.get("channel", "")
+        if reason:
+            self.dropped[channel][reason] += 1
+        else:
+            self.passed[channel] += 1
+        return reason
+
+    def apply(self, posts: list) -> list:
+        return [post for post in posts if self.check(post) is None]
+
+    def summary(self) -> str:
+        """
+        Отброшенные посты по каналам с момента запуска (для периодических логов).
+        """
+        lines = []
+        for channel, reasons in sorted(self.dropped.items()):
+            total = sum(reasons.values())
+            lines.append(f"{channel}: отброшено {total} из {total + self.passed[channel]} ({format_reasons(reasons)})")
+        return "\n".join(lines)
+
+
+def format_reasons(reasons: Counter) -> str:
+    return ", ".join(f"{REASON_LABELS.get(reason, reason)} {count}" for reason, count in reasons.most_common())
+
+
+prefilter = PreFilter()
@@ -0,0 +1,183 @@
+"""
+Профилирование отдельных запросов отчётов.
+
+Включается для запроса флагом администратора (/profile) или случайно с долей
+PROFILE_SAMPLE_RATE. Для профилируемого запроса:
+  - фоновый поток раз в PROFILE_INTERVAL_MS снимает стеки всех потоков процесса
+    и пишет их в формате collapsed stacks (<id>.collapsed: flamegraph.pl, speedscope);
+  - участки пайплайна, обёрнутые в span(...), пишутся во временную шкалу
+    в формате Chrome trace (<id>.trace.json: chrome://tracing, Perfetto).
+
+Вне профилируемого запроса span() стоит одну проверку contextvar, поэтому
+разметку можно держать в горячих участках постоянно. Контекст переходит в
+asyncio.to_thread, но не в дочерние процессы: рендеринг фрагментов PDF виден
+одним участком в родительском процессе. Стеки снимаются со всего процесса —
+при параллельных запросах в профиль попадает и чужая работа.
+"""
+
+import contextvars
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from config.config import ADMIN_IDS, PROFILE_DIR, PROFILE_INTERVAL_MS, PROFILE_SAMPLE_RATE
+from config.logger import logger
+
+# Верхние кадры простаивающих потоков: ожидание событий, очередей и блокировок
+IDLE_FRAMES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("thread.py", "_worker"),
+    ("queue.py", "get"),
+}
+
+_current_trace = contextvars.ContextVar("request_trace", default=None)
+
+# Администраторы, включившие профилирование своих запросов командой /profile
+profiled_users = set()
+
+
+class RequestTrace:
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        self.started = time.perf_counter()
+        self.events = []
+
+    def add(self, name: str, start: float, end: float, attrs: dict):
+        # list.append атомарен: участки пишутся из event loop и из потоков to_thread
+        self.events.append((name, start, end, threading.get_ident(), threading.current_thread().name, attrs))
+
+    def chrome_trace(self) -> dict:
+        events = []
+        threads = {}
+        for name, start, end, tid, thread_name, attrs in self.events:
+            threads[tid] = thread_name
+            events.append({
+                "name": name, "ph": "X", "pid": os.getpid(), "tid": tid,
+                "ts": (start - self.started) * 1e6, "dur": (end - start) * 1e6,
+                "args": {k: str(v) for k, v in attrs.items()},
+            })
+        for tid, thread_name in threads.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid,
+                           "args": {"name": thread_name}})
+        return {"traceEvents": events, "otherData": {"request_id": self.request_id}}
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """
+    Участок временной шкалы текущего профилируемого запроса; без профилирования ничего не делает.
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, start, time.perf_counter(), attrs)
+
+
+class SamplingProfiler:
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.samples = Counter()
+        self.total = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+
+    @staticmethod
+    def frame_name(frame) -> str:
+        code = frame.f_code
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    def _sample(self):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for tid, frame in sys._current_frames().items():
+            if tid == self._thread.ident:
+                continue
+            if (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in IDLE_FRAMES:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self.frame_name(frame).replace(";", ","))
+                frame = frame.f_back
+            stack.append(names.get(tid, str(tid)))
+            self.samples[";".join(reversed(stack))] += 1
+            self.total += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+@contextmanager
+def profile_request(request_id: str, folder: str = PROFILE_DIR, interval: float = PROFILE_INTERVAL_MS / 1000):
+    """
+    Профилирует код внутри блока и пишет <request_id>.collapsed и <request_id>.trace.json в folder.
+    """
+    trace = RequestTrace(request_id)
+    token = _current_trace.set(trace)
+    sampler = SamplingProfiler(interval)
+    sampler.start()
+    try:
+        with span("request", request_id=request_id):
+            yield trace
+    finally:
+        sampler.stop()
+        _current_trace.reset(token)
+        try:
+            os.makedirs(folder, exist_ok=True)
+            base = os.path.join(folder, request_id)
+            with open(f"{base}.collapsed", "w", encoding="utf-8") as f:
+                f.write(sampler.collapsed())
+            with open(f"{base}.trace.json", "w", encoding="utf-8") as f:
+                json.dump(trace.chrome_trace(), f, ensure_ascii=False)
+            logger.info(f"Профиль запроса {request_id}: {time.perf_counter() - trace.started:.2f} с, "
+                        f"{sampler.total} семплов, участков {len(trace.events)} → {base}.*")
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении профиля {request_id}: {e}")
+
+
+def should_profile(user_id: int) -> bool:
+    return user_id in profiled_users or (PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE)
+
+
+def toggle_user(user_id: int) -> bool:
+    """
+    Включает или выключает профилирование запросов администратора.
+    :return: True, если профилирование теперь включено.
+    """
+    if user_id not in ADMIN_IDS:
+        raise PermissionError(f"Пользователь {user_id} не администратор")
+    if user_id in profiled_users:
+        profiled_users.discard(user_id)
+        return False
+    profiled_users.add(user_id)
+    return True
+
+
+def profiled(request_id: str, run):
+    """
+    Оборачивает фабрику корутины (как в report_queue.submit) профилированием запроса.
+    """
+    async def run_profiled():
+        with profile_request(request_id):
+            await run()
+    return run_profiled
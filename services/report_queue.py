@@ -0,0 +1,222 @@
+"""
+Очередь задач на формирование отчётов.
+
+Ограничивает число одновременно выполняемых пайплайнов (загрузка, классификация,
+рендеринг), количество задач одного пользователя и отдаёт приоритет дешёвым
+задачам (отчёт уже есть в кэше) перед холодными.
+
+Отмена задачи не прерывает работу, уже переданную в поток (классификация,
+рендеринг), поэтому задача держит слот обработчика, пока её потоки не завершатся,
+а функции, принимающие cancel, прекращают работу между постами.
+"""
+
+import asyncio
+import contextvars
+import itertools
+import threading
+import time
+
+from config.config import REPORT_WORKERS, REPORT_PER_USER_LIMIT, REPORT_QUEUE_AGING_SECONDS
+from config.logger import logger
+
+# Приоритеты задач: чем меньше, тем раньше задача будет взята в работу
+PRIORITY_CACHED = 0   # готовый отчёт в кэше, нужна только отправка
+PRIORITY_WARM = 1     # посты уже классифицированы, нужен только рендеринг
+PRIORITY_COLD = 2     # полный пайплайн: загрузка, классификация, рендеринг
+
+# Задача очереди, в которой выполняется текущая корутина
+current_job = contextvars.ContextVar("current_job", default=None)
+
+
+class ReportJob:
+    def __init__(self, user_id: int, run, priority: int, seq: int, on_position=None):
+        """
+        :param user_id: Пользователь, запустивший задачу
+        :param run: Функция без аргументов, возвращающая корутину задачи
+        :param priority: Один из PRIORITY_*
+        :param on_position: async-колбэк, получающий позицию задачи в очереди
+        """
+        self.user_id = user_id
+        self.run = run
+        self.priority = priority
+        self.seq = seq
+        self.on_position = on_position
+        self.enqueued_at = time.monotonic()
+        self.last_position = None
+        self.task = None
+        self.cancelled = False
+        # Флаг отмены для кода в потоках и ещё не завершённые потоки задачи
+        self.cancel_event = threading.Event()
+        self.threads = set()
+
+
+class ReportQueue:
+    def __init__(self, workers: int = REPORT_WORKERS, per_user_limit: int = REPORT_PER_USER_LIMIT,
+                 aging_seconds: float = REPORT_QUEUE_AGING_SECONDS):
+        """
+        :param workers: Максимальное число одновременно выполняемых задач
+        :param per_user_limit: Максимальное число одновременных задач одного пользователя
+        :param aging_seconds: Через сколько секунд ожидания задача получает наивысший приоритет
+        """
+        self.workers = workers
+        self.per_user_limit = per_user_limit
+        self.aging_seconds = aging_seconds
+        self._pending = []
+        self._running = {}
+        self._seq = itertools.count()
+        self._cond = None
+        self._worker_tasks = []
+
+    def _start(self):
+        if self._worker_tasks:
+            return
+        self._cond = asyncio.Condition()
+        self._worker_tasks = [
+            asyncio.create_task(self._worker(i)) for i in range(self.workers)
+        ]
+        logger.info(f"Очередь отчётов запущена: обработчиков {self.workers}, "
+                    f"лимит на пользователя {self.per_user_limit}")
+
+    def _sort_key(self, job: ReportJob, now: float):
+        # Задачи, ждущие слишком долго, поднимаются наверх, чтобы холодные не голодали
+        waited = now - job.enqueued_at
+        priority = PRIORITY_CACHED if waited >= self.aging_seconds else job.priority
+        return priority, job.seq
+
+    def _ordered(self) -> list:
+        now = time.monotonic()
+        return sorted(self._pending, key=lambda job: self._sort_key(job, now))
+
+    def _next_eligible(self):
+        for job in self._ordered():
+            if len(self._running.get(job.user_id, [])) < self.per_user_limit:
+                self._pending.remove(job)
+                return job
+        return None
+
+    async def submit(self, user_id: int, run, priority: int = PRIORITY_COLD, on_position=None) -> ReportJob:
+        """
+        Ставит задачу в очередь и сразу возвращает её, не дожидаясь выполнения.
+        """
+        self._start()
+        job = ReportJob(user_id, run, priority, next(self._seq), on_position)
+        async with self._cond:
+            self._pending.append(job)
+            self._cond.notify_all()
+        logger.info(f"Задача пользователя {user_id} поставлена в очередь (приоритет {priority}, "
+                    f"в очереди {len(self._pending)})")
+        await self._notify_positions()
+        return job
+
+    async def cancel_user(self, user_id: int) -> int:
+        """
+        Отменяет все ожидающие и выполняемые задачи пользователя.
+        :return: Количество отменённых задач
+        """
+        if self._cond is None:
+            return 0
+        async with self._cond:
+            pending = [job for job in self._pending if job.user_id == user_id]
+            for job in pending:
+                job.cancelled = True
+                self._pending.remove(job)
+            running = list(self._running.get(user_id, []))
+            for job in running:
+                job.cancelled = True
+                job.cancel_event.set()
+                if job.task:
+                    job.task.cancel()
+            self._cond.notify_all()
+        cancelled = len(pending) + len(running)
+        if cancelled:
+            logger.info(f"Отменено задач пользователя {user_id}: {cancelled}")
+            await self._notify_positions()
+        return cancelled
+
+    def position(self, job: ReportJob) -> int:
+        """
+        Позиция задачи в очереди (1 — следующая), 0 — задача уже выполняется или завершена.
+        """
+        ordered = self._ordered()
+        return ordered.index(job) + 1 if job in ordered else 0
+
+    async def _notify_positions(self):
+        # Задачи, которые сразу попадут к свободным обработчикам, не беспокоим сообщением об очереди
+        busy = sum(len(jobs) for jobs in self._running.values())
+        free = max(self.workers - busy, 0)
+        for pos, job in enumerate(self._ordered(), 1):
+            if job.on_position is None or job.last_position == pos or pos <= free:
+                continue
+            job.last_position = pos
+            try:
+                await job.on_position(pos)
+            except Exception as e:
+                logger.warning(f"Не удалось сообщить позицию в очереди: {e}")
+
+    async def _worker(self, worker_id: int):
+        while True:
+            async with self._cond:
+                job = self._next_eligible()
+                while job is None:
+                    await self._cond.wait()
+                    job = self._next_eligible()
+                self._running.setdefault(job.user_id, []).append(job)
+                # Задача наследует контекст, в котором создана: run_in_thread найдёт в нём свою задачу
+                token = current_job.set(job)
+                job.task = asyncio.create_task(job.run())
+                current_job.reset(token)
+
+            await self._notify_positions()
+            waited = time.monotonic() - job.enqueued_at
+            started = time.monotonic()
+            try:
+                # asyncio.wait не пробрасывает отмену задачи в обработчик очереди
+                await asyncio.wait([job.task])
+                if job.task.cancelled():
+                    logger.info(f"Задача пользователя {job.user_id} отменена")
+                elif job.task.exception():
+                    logger.error(f"Ошибка в задаче пользователя {job.user_id}: {job.task.exception()}")
+                if job.threads:
+                    # Отменённая задача освобождает слот только после завершения своих потоков
+                    logger.info(f"Задача пользователя {job.user_id}: ожидание завершения потоков ({len(job.threads)})")
+                    done, _ = await asyncio.wait(list(job.threads))
+                    for thread_task in done:
+                        if not thread_task.cancelled():
+                            thread_task.exception()
+            except Exception as e:
+                logger.error(f"Ошибка обработчика очереди #{worker_id}: {e}")
+            finally:
+                logger.info(f"Задача пользователя {job.user_id}: ожидание {waited:.1f} с, "
+                            f"выполнение {time.monotonic() - started:.1f} с")
+                async with self._cond:
+                    running = self._running.get(job.user_id, [])
+                    if job in running:
+                        running.remove(job)
+                    if not running:
+                        self._running.pop(job.user_id, None)
+                    self._cond.notify_all()
+
+
+async def run_in_thread(func, *args, **kwargs):
+    """
+    asyncio.to_thread для кода задач очереди. Если задачу отменят, поток
+    продолжит работу, а обработчик очереди дождётся его перед следующей задачей.
+    """
+    job = current_job.get()
+    thread_task = asyncio.ensure_future(asyncio.to_thread(func, *args, **kwargs))
+    if job is None:
+        return await thread_task
+    job.threads.add(thread_task)
+    thread_task.add_done_callback(job.threads.discard)
+    return await asyncio.shield(thread_task)
+
+
+def cancel_event() -> threading.Event:
+    """
+    Флаг отмены текущей задачи очереди (None вне очереди).
+    """
+    job = current_job.get()
+    return job.cancel_event if job is not None else None
+
+
+report_queue = ReportQueue()
@@ -3,8 +3,23 @@
 """
 
 import os
+import json
+import time
+import hashlib
 import shutil
 
+from config.config import (
+    DEFAULT_REPORTS_FOLDER,
+    REPORT_CACHE_MAX_FILES,
+    REPORT_CACHE_MAX_MB,
+    REPORT_CACHE_TTL_HOURS,
+)
+from config.logger import logger
+from services import model_registry
+
+REPORT_CACHE_INDEX = "cache_index.json"
+
+
 def save_file(content: bytes, filename: str, folder: str = "reports") -> str:
     """
     Сохраняет бинарные данные в файл.
@@ -20,14 +35,202 @@ def save_file(content: bytes, filename: str, folder: str = "reports") -> str:
         f.write(content)
     return path
 
-def clear_old_reports(folder: str = "reports", keep_last: int = 20):
+
+def content_hash(posts: list) -> str:
+    """
+    Считает хэш версии содержимого отчёта по постам, которые в него попадают.
+    Учитываются только поля, влияющие на итоговый PDF.
+    :param posts: Список постов (dict с 'text', 'url', 'created_at', 'sentiment')
+    :return: hex-строка sha1
     """
-    Удаляет старые отчёты, оставляя только последние N.
+    digest = hashlib.sha1()
+    for post in posts:
+        created_at = post.get("created_at")
+        if hasattr(created_at, "isoformat"):
+            created_at = created_at.isoformat()
+        row = "\x1f".join([
+            str(post.get("url") or ""),
+            str(created_at or ""),
+            str(post.get("sentiment") or ""),
+            post.get("text") or "",
+        ])
+        digest.update(row.encode("utf-8"))
+        digest.update(b"\x1e")
+    return digest.hexdigest()
+
+
+def report_cache_key(category: str, period: str, version: str) -> str:
+    """
+    Ключ отчёта в кэше: (категория, период, версия содержимого, версия моделей).
+    После замены моделей отчёты, посчитанные прежней версией, больше не выдаются.
+    """
+    return f"{category}:{period}:{version}:{model_registry.combined_version()}"
+
+
+class ReportCache:
     """
+    Кэш готовых отчётов с ограничением по количеству, размеру и возрасту.
+
+    Для каждого ключа хранит пути к PDF (отчёт может состоять из нескольких частей)
+    и file_id, которые Telegram вернул после первой отправки.
+    Индекс лежит рядом с отчётами в cache_index.json.
+    """
+
+    def __init__(self, folder: str = DEFAULT_REPORTS_FOLDER,
+                 max_files: int = REPORT_CACHE_MAX_FILES,
+                 max_bytes: int = REPORT_CACHE_MAX_MB * 1024 * 1024,
+                 max_age: float = REPORT_CACHE_TTL_HOURS * 3600):
+        self.folder = folder
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.index_path = os.path.join(folder, REPORT_CACHE_INDEX)
+        self._entries = self._load_index()
+
+    def _load_index(self) -> dict:
+        if not os.path.exists(self.index_path):
+            return {}
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except Exception as e:
+            logger.error(f"Ошибка чтения индекса кэша отчётов: {e}")
+            return {}
+        return {key: entry for key, entry in entries.items() if _migrate_entry(entry)}
+
+    def _save_index(self):
+        if not os.path.exists(self.folder):
+            os.makedirs(self.folder)
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.index_path)
+
+    def _is_alive(self, entry: dict) -> bool:
+        if time.time() - entry.get("created_at", 0) > self.max_age:
+            return False
+        files = entry.get("files")
+        if not files:
+            return False
+        # Без file_id отчёт можно переотправить только с диска
+        return all(f.get("file_id") or os.path.exists(f.get("path") or "") for f in files)
+
+    def get(self, key: str):
+        """
+        Возвращает запись кэша {'files': [{'path', 'file_id'}], 'created_at', 'size'} или None.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if not self._is_alive(entry):
+            self.invalidate(key)
+            return None
+        entry["last_used"] = time.time()
+        return entry
+
+    def put(self, key: str, paths: list, file_ids: list = None):
+        """
+        Сохраняет отчёт в кэш и сразу применяет ограничения.
+        :param paths: Пути к PDF-частям отчёта
+        :param file_ids: file_id частей в том же порядке (если уже отправлены)
+        """
+        file_ids = file_ids or [None] * len(paths)
+        size = sum(os.path.getsize(p) for p in paths if os.path.exists(p))
+        now = time.time()
+        self._entries[key] = {
+            "files": [{"path": p, "file_id": f} for p, f in zip(paths, file_ids)],
+            "created_at": now,
+            "last_used": now,
+            "size": size,
+        }
+        self.evict()
+
+    def invalidate(self, key: str):
+        """
+        Удаляет запись и её файлы из кэша.
+        """
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        _remove_entry_files(entry)
+        self._save_index()
+
+    def evict(self):
+        """
+        Удаляет просроченные записи, затем самые давно использованные,
+        пока кэш не уложится в лимиты по количеству и размеру.
+        """
+        for key in [k for k, e in self._entries.items() if not self._is_alive(e)]:
+            _remove_entry_files(self._entries.pop(key))
+
+        by_usage = sorted(self._entries.items(), key=lambda item: item[1].get("last_used", 0))
+        total_size = sum(e.get("size", 0) for _, e in by_usage)
+        while by_usage and (len(by_usage) > self.max_files or total_size > self.max_bytes):
+            key, entry = by_usage.pop(0)
+            self._entries.pop(key, None)
+            total_size -= entry.get("size", 0)
+            _remove_entry_files(entry)
+            logger.info(f"Отчёт {key} вытеснен из кэша")
+
+        self._save_index()
+
+
+def _migrate_entry(entry: dict) -> bool:
+    """
+    Приводит запись индекса старого формата ('path', 'file_id' одного PDF) к списку 'files'.
+    :return: False, если запись не содержит ни одного файла и её нужно отбросить
+    """
+    if "files" not in entry:
+        path = entry.pop("path", None)
+        file_id = entry.pop("file_id", None)
+        entry["files"] = [{"path": path, "file_id": file_id}] if path or file_id else []
+    return bool(entry["files"])
+
+
+def _remove_entry_files(entry: dict):
+    for f in entry.get("files", []):
+        _remove_report_files(f.get("path") or "")
+
+
+def _remove_report_files(pdf_path: str):
+    """
+    Удаляет PDF и соответствующий ему HTML.
+    """
+    for path in (pdf_path, pdf_path.replace(".pdf", ".html")):
+        if path and os.path.exists(path):
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.error(f"Ошибка при удалении файла {path}: {e}")
+
+
+def clear_old_reports(folder: str = "reports", keep_last: int = REPORT_CACHE_MAX_FILES,
+                      max_bytes: int = REPORT_CACHE_MAX_MB * 1024 * 1024,
+                      max_age: float = REPORT_CACHE_TTL_HOURS * 3600):
+    """
+    Ограничивает кэш отчётов по количеству, суммарному размеру и возрасту.
+    Файлы, которых нет в индексе кэша, удаляются по тем же правилам.
+    """
+    cache = ReportCache(folder, max_files=keep_last, max_bytes=max_bytes, max_age=max_age)
+    cache.evict()
+
+    if not os.path.exists(folder):
+        return
+    cached_paths = {
+        os.path.normpath(f.get("path") or "")
+        for e in cache._entries.values()
+        for f in e.get("files", [])
+    }
+    now = time.time()
     files = sorted(
         [os.path.join(folder, f) for f in os.listdir(folder) if f.endswith(".pdf")],
         key=os.path.getmtime
     )
-    if len(files) > keep_last:
-        for f in files[:-keep_last]:
-            os.remove(f)
\ No newline at end of file
+    orphans = [f for f in files if os.path.normpath(f) not in cached_paths]
+    for f in orphans:
+        if now - os.path.getmtime(f) > max_age or len(files) > keep_last:
+            _remove_report_files(f)
+            files.remove(f)
+
+
+report_cache = ReportCache()
@@ -0,0 +1,222 @@
+"""
+Потоковая загрузка постов: подписка на новые и отредактированные сообщения
+каналов через события Telethon, классификация небольшими пачками и запись
+в локальное хранилище постов.
+
+Запуск отдельным процессом:
+    python -m services.stream_ingest
+"""
+
+import asyncio
+
+from telethon import TelegramClient, events
+
+from config.auth import API_ID, API_HASH, INGEST_SESSION_NAME
+from config.config import (STREAM_BATCH_SIZE, STREAM_FLUSH_SECONDS, CLASSIFY_MODE, MODEL_RESCORE_MAX_POSTS,
+                           WORK_QUEUE_BATCH, WORK_QUEUE_IDLE_SECONDS)
+from config.logger import logger
+from core.analysis import analyze_batch
+from services import model_registry
+from services.post_store import post_store
+from services.prefilter import prefilter
+from services.telegram_api import CHANNELS, message_to_post
+
+
+def rescore_stale_posts(posts: list, store=post_store, limit: int = MODEL_RESCORE_MAX_POSTS) -> list:
+    """
+    Пересчитывает посты, классифицированные прежней версией моделей (после горячей
+    перезагрузки), и сохраняет новые результаты. За вызов пересчитывается не больше
+    limit постов, остальные — при следующих запросах.
+    :return: Список posts, где пересчитанные посты заменены новыми результатами
+    """
+    current = model_registry.combined_version()
+    stale = [post for post in posts if post.get("model_version") != current]
+    if not stale:
+        return posts
+    analyzed = analyze_batch(stale[:limit])
+    store.upsert_posts(analyzed)
+    logger.info(f"Пересчитано постов прежней версии моделей: {len(analyzed)} из {len(stale)}")
+    rescored = {post["url"]: post for post in analyzed}
+    return [rescored.get(post.get("url"), post) for post in posts]
+
+
+class StreamIngestor:
+    """
+    Собирает входящие посты в пачки (по размеру или по таймауту),
+    анализирует их вне event loop и сохраняет в хранилище.
+    С очередью задач пачки не анализируются, а ставятся в очередь для воркеров,
+    а их результаты переносятся из очереди в хранилище (apply_results).
+    """
+
+    def __init__(self, store=post_store, batch_size: int = STREAM_BATCH_SIZE,
+                 flush_seconds: float = STREAM_FLUSH_SECONDS, analyze=analyze_batch, work_queue=None):
+        self.store = store
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.analyze = analyze
+        if work_queue is None and CLASSIFY_MODE == "queue":
+            from services.work_queue import work_queue
+        self.work_queue = work_queue
+        self.queue = asyncio.Queue()
+        self.stored = 0
+
+    async def handle(self, post: dict):
+        """
+        Колбэк для источника событий: ставит пост в очередь на анализ.
+        """
+        if post.get("text") and prefilter.check(post) is None:
+            await self.queue.put(post)
+
+    async def stop(self):
+        """
+        Просит run() завершиться после обработки уже полученных постов.
+        """
+        await self.queue.put(None)
+
+    async def next_batch(self) -> list:
+        batch = [await self.queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.flush_seconds
+        while len(batch) < self.batch_size and batch[-1] is not None:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def process_batch(self, batch: list):
+        if self.work_queue is not None:
+            try:
+                queued = await asyncio.to_thread(self.work_queue.enqueue, batch)
+                logger.info(f"Потоковая загрузка: {queued} постов поставлено в очередь на классификацию")
+            except Exception as e:
+                logger.error(f"Ошибка при постановке пачки постов в очередь: {e}")
+            return
+        try:
+            analyzed = await asyncio.to_thread(self.analyze, batch)
+            self.stored += await asyncio.to_thread(self.store.upsert_posts, analyzed)
+            logger.info(f"Потоковая загрузка: сохранено {len(analyzed)} постов (всего {self.stored})")
+        except Exception as e:
+            logger.error(f"Ошибка при обработке пачки постов: {e}")
+
+    async def apply_results(self, limit: int = WORK_QUEUE_BATCH) -> int:
+        """
+        Переносит результаты воркеров из очереди задач в хранилище постов.
+        Хранилище (WAL) пишет только этот процесс на своём хосте, воркеры — только очередь.
+        :return: Количество перенесённых задач
+        """
+        applied = 0
+        while True:
+            jobs = await asyncio.to_thread(self.work_queue.take_results, limit)
+            if not jobs:
+                return applied
+            posts = [post for _, post in jobs if post is not None]
+            # Сначала запись в хранилище, затем отметка в очереди: при сбое между ними
+            # результаты перенесутся повторно, а повторный upsert по url ничего не испортит
+            if posts:
+                self.stored += await asyncio.to_thread(self.store.upsert_posts, posts)
+            await asyncio.to_thread(self.work_queue.mark_applied, [job_id for job_id, _ in jobs])
+            applied += len(jobs)
+
+    async def apply_results_loop(self, interval: float = WORK_QUEUE_IDLE_SECONDS):
+        while True:
+            try:
+                applied = await self.apply_results()
+                if applied:
+                    logger.info(f"Потоковая загрузка: перенесено результатов воркеров {applied} (всего {self.stored})")
+            except Exception as e:
+                logger.error(f"Ошибка при переносе результатов воркеров в хранилище: {e}")
+            await asyncio.sleep(interval)
+
+    async def run(self):
+        applier = asyncio.create_task(self.apply_results_loop()) if self.work_queue is not None else None
+        try:
+            while True:
+                batch = await self.next_batch()
+                posts = [post for post in batch if post is not None]
+                if posts:
+                    await self.process_batch(posts)
+                if len(posts) < len(batch):
+                    return
+        finally:
+            if applier is not None:
+                applier.cancel()
+                await asyncio.gather(applier, return_exceptions=True)
+
+
+class TelethonEventSource:
+    """
+    Источник новых и отредактированных сообщений каналов через события Telethon.
+    """
+
+    def __init__(self, channels: list = None):
+        self.channels = channels or CHANNELS
+
+    async def run(self, on_post):
+        async with TelegramClient(INGEST_SESSION_NAME, API_ID, API_HASH) as client:
+            async def on_message(event):
+                chat = await event.get_chat()
+                channel = getattr(chat, "username", None) or str(event.chat_id)
+                await on_post(message_to_post(event.message, channel))
+
+            client.add_event_handler(on_message, events.NewMessage(chats=self.channels))
+            client.add_event_handler(on_message, events.MessageEdited(chats=self.channels))
+            logger.info(f"Подписка на события {len(self.channels)} каналов запущена")
+            await client.run_until_disconnected()
+
+
+class FakeEventSource:
+    """
+    Локальный источник событий для тестов и нагрузочных прогонов без Telegram.
+    Посты передаются списком в конструктор или кладутся через emit();
+    close() завершает источник после уже переданных постов.
+    """
+
+    def __init__(self, posts: list = None, close_after_posts: bool = False):
+        self.pending = list(posts or [])
+        if close_after_posts:
+            self.pending.append(None)
+        self._queue = None
+
+    @property
+    def queue(self) -> asyncio.Queue:
+        # Очередь создаётся внутри работающего event loop
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+            for post in self.pending:
+                self._queue.put_nowait(post)
+        return self._queue
+
+    async def emit(self, post: dict):
+        await self.queue.put(post)
+
+    async def close(self):
+        await self.queue.put(None)
+
+    async def run(self, on_post):
+        while True:
+            post = await self.queue.get()
+            if post is None:
+                return
+            await on_post(post)
+
+
+async def run_stream_ingest(source=None, ingestor: StreamIngestor = None):
+    """
+    Запускает источник событий и обработку пачек. Завершается вместе с источником.
+    """
+    source = source or TelethonEventSource()
+    ingestor = ingestor or StreamIngestor()
+    consumer = asyncio.create_task(ingestor.run())
+    try:
+        await source.run(ingestor.handle)
+    finally:
+        await ingestor.stop()
+        await consumer
+
+
+if __name__ == "__main__":
+    asyncio.run(run_stream_ingest())
@@ -0,0 +1,173 @@
+"""
+Подписки пользователей на регулярные дайджесты (SQLite).
+
+Подписка — категория, период отчёта и время доставки (ЧЧ:ММ, время сервера).
+Отметки о доставке хранятся по дням, поэтому после перезапуска бота дайджест
+не отправляется повторно и не теряется, если время доставки пришлось на простой.
+Неудачные попытки доставки тоже считаются по дням: после DIGEST_MAX_ATTEMPTS
+дайджест отмечается как failed и больше не повторяется.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from config.config import DIGEST_MAX_ATTEMPTS, SUBSCRIPTIONS_PATH
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS subscriptions (
+    user_id INTEGER NOT NULL,
+    category TEXT NOT NULL,
+    period TEXT NOT NULL,
+    send_at TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (user_id, category, period)
+);
+CREATE TABLE IF NOT EXISTS deliveries (
+    user_id INTEGER NOT NULL,
+    category TEXT NOT NULL,
+    period TEXT NOT NULL,
+    digest_date TEXT NOT NULL,
+    delivered_at REAL NOT NULL,
+    status TEXT NOT NULL,
+    PRIMARY KEY (user_id, category, period, digest_date)
+);
+CREATE TABLE IF NOT EXISTS delivery_attempts (
+    user_id INTEGER NOT NULL,
+    category TEXT NOT NULL,
+    period TEXT NOT NULL,
+    digest_date TEXT NOT NULL,
+    attempts INTEGER NOT NULL,
+    error TEXT,
+    PRIMARY KEY (user_id, category, period, digest_date)
+);
+"""
+
+
+def parse_send_at(value: str) -> str:
+    """
+    Нормализует время доставки к виду ЧЧ:ММ.
+    :raises ValueError: Если строка не время
+    """
+    return datetime.strptime(value.strip(), "%H:%M").strftime("%H:%M")
+
+
+class SubscriptionStore:
+    def __init__(self, path: str = SUBSCRIPTIONS_PATH):
+        self.path = path
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.executescript(SCHEMA)
+
+    def subscribe(self, user_id: int, category: str, period: str, send_at: str):
+        """
+        Добавляет подписку или меняет время доставки существующей.
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                INSERT INTO subscriptions (user_id, category, period, send_at, created_at) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(user_id, category, period) DO UPDATE SET send_at = excluded.send_at
+                """,
+                (user_id, category, period, parse_send_at(send_at), time.time()),
+            )
+
+    def unsubscribe(self, user_id: int, category: str = None, period: str = None) -> int:
+        """
+        Удаляет подписки пользователя (все или по категории и/или периоду).
+        :return: Количество удалённых подписок
+        """
+        sql = "DELETE FROM subscriptions WHERE user_id = ?"
+        params = [user_id]
+        if category:
+            sql += " AND category = ?"
+            params.append(category)
+        if period:
+            sql += " AND period = ?"
+            params.append(period)
+        with self._lock, self._conn:
+            return self._conn.execute(sql, params).rowcount
+
+    def user_subscriptions(self, user_id: int) -> list:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT category, period, send_at FROM subscriptions WHERE user_id = ? ORDER BY send_at",
+                (user_id,),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def keys(self) -> list:
+        """
+        Различные (категория, период) среди всех подписок: каждый дайджест считается один раз.
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT DISTINCT category, period FROM subscriptions").fetchall()
+        return [(row["category"], row["period"]) for row in rows]
+
+    def due(self, now: datetime) -> list:
+        """
+        Подписки, время доставки которых сегодня уже наступило, а дайджест ещё не доставлен.
+        :return: Список dict с 'user_id', 'category', 'period', 'send_at'
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT s.user_id, s.category, s.period, s.send_at FROM subscriptions s
+                LEFT JOIN deliveries d ON d.user_id = s.user_id AND d.category = s.category
+                    AND d.period = s.period AND d.digest_date = ?
+                WHERE s.send_at <= ? AND d.user_id IS NULL
+                ORDER BY s.send_at
+                """,
+                (now.date().isoformat(), now.strftime("%H:%M")),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def mark_delivered(self, user_id: int, category: str, period: str, digest_date: str, status: str = "sent"):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO deliveries VALUES (?, ?, ?, ?, ?, ?)",
+                (user_id, category, period, digest_date, time.time(), status),
+            )
+
+    def record_failure(self, user_id: int, category: str, period: str, digest_date: str, error: str,
+                       max_attempts: int = DIGEST_MAX_ATTEMPTS) -> int:
+        """
+        Учитывает неудачную попытку доставки; после max_attempts попыток дайджест отмечается как failed.
+        :return: Число попыток за этот день
+        """
+        key = (user_id, category, period, digest_date)
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                INSERT INTO delivery_attempts VALUES (?, ?, ?, ?, 1, ?)
+                ON CONFLICT(user_id, category, period, digest_date)
+                DO UPDATE SET attempts = attempts + 1, error = excluded.error
+                """,
+                (*key, error[:1000]),
+            )
+            attempts = self._conn.execute(
+                "SELECT attempts FROM delivery_attempts WHERE user_id = ? AND category = ? AND period = ? "
+                "AND digest_date = ?",
+                key,
+            ).fetchone()["attempts"]
+            if attempts >= max_attempts:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO deliveries VALUES (?, ?, ?, ?, ?, ?)",
+                    (*key, time.time(), "failed"),
+                )
+        return attempts
+
+    def purge_deliveries(self, before_date: str) -> int:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM delivery_attempts WHERE digest_date < ?", (before_date,))
+            return self._conn.execute("DELETE FROM deliveries WHERE digest_date < ?", (before_date,)).rowcount
+
+
+subscription_store = SubscriptionStore()
@@ -1,90 +1,194 @@
+import os
 import yaml
+from collections import Counter
 from telethon import TelegramClient
+from telethon.tl.types import InputMessagePinned
 from datetime import datetime, timezone, timedelta
 from config.auth import API_ID, API_HASH, SESSION_NAME
+from config.config import FETCH_RECORD_DIR, FETCH_REPLAY_PATH, FETCH_REPLAY_SPEED
 from config.logger import logger
+from services.entity_cache import entity_cache
+from services.fetch_archive import FetchRecorder, archive_path
+from services.prefilter import format_reasons, prefilter
+from services.profiler import span
 
-def load_channels(path="data/sources.yaml") -> list:
+SOURCES_PATH = "data/sources.yaml"
+
+def load_channels(path=SOURCES_PATH) -> list:
     with open(path, "r", encoding="utf-8") as f:
         data = yaml.safe_load(f)
     logger.info(f"Загружено {len(data.get('channels', []))} каналов из {path}")
     return data["channels"]
 
 CHANNELS = load_channels()
+_sources_mtime = os.path.getmtime(SOURCES_PATH)
+
+def reload_channels(path=SOURCES_PATH) -> bool:
+    """
+    Перечитывает список каналов, если файл источников изменился.
+    CHANNELS обновляется на месте, поэтому все импортировавшие его модули видят новый список.
+    :return: True, если список был перечитан.
+    """
+    global _sources_mtime
+    try:
+        mtime = os.path.getmtime(path)
+        if mtime == _sources_mtime:
+            return False
+        CHANNELS[:] = load_channels(path)
+        _sources_mtime = mtime
+        return True
+    except Exception as e:
+        logger.error(f"Ошибка при перечитывании {path}: {e}")
+        return False
 
 def log_sources_status(sources_info: dict):
     lines = []
     for source, counts in sources_info.items():
         loaded = counts.get("loaded", 0)
         expected = counts.get("expected", 0)
+        filtered = counts.get("filtered") or {}
+        # Отброшенные предфильтром посты прочитаны успешно, это не потери загрузки
+        received = loaded + sum(filtered.values())
 
         if expected == 0:
             emoji = "❌"  # нет данных
-        elif loaded == 0:
+        elif received == 0:
             emoji = "❌"
-        elif loaded < expected:
+        elif received < expected:
             emoji = "⚠️"
         else:
             emoji = "✅"
 
         line = f"{source}: {loaded}/{expected} {emoji}"
+        if filtered:
+            line += f", отфильтровано {sum(filtered.values())} ({format_reasons(filtered)})"
         lines.append(line)
 
     log_message = "Статус загрузки каналов:\n" + "\n".join(lines)
     logger.info(log_message)
 
-async def fetch_news_from_channels(period_days) -> list:
+def normalize_date(msg_date: datetime) -> datetime:
+    if msg_date.tzinfo is None:
+        return msg_date.replace(tzinfo=timezone.utc)
+    return msg_date.astimezone(timezone.utc)
+
+def message_to_post(msg, channel: str) -> dict:
+    """
+    Преобразует сообщение Telethon в словарь поста, с которым работает пайплайн.
+    """
+    post = {
+        "text": msg.text,
+        "created_at": normalize_date(msg.date).astimezone(),  # локальное время
+        "url": f"https://t.me/{channel}/{msg.id}",
+        "channel": channel,
+        "message_id": msg.id,
+        # Для предфильтра: репост из другого канала и закреплённый пост
+        "forwarded": bool(getattr(msg, "fwd_from", None)),
+        "pinned": bool(getattr(msg, "pinned", False)),
+    }
+    if getattr(msg, "edit_date", None):
+        post["edited_at"] = normalize_date(msg.edit_date)
+    return post
+
+def open_client():
+    """
+    Клиент Telegram или, если задан FETCH_REPLAY_PATH, воспроизведение записанного архива.
+    """
+    if FETCH_REPLAY_PATH:
+        from services.fetch_replay import ReplayTelegramClient
+        return ReplayTelegramClient(FETCH_REPLAY_PATH, speed=FETCH_REPLAY_SPEED)
+    return TelegramClient(SESSION_NAME, API_ID, API_HASH)
+
+async def remember_pinned(client, entity, channel: str):
+    """
+    Запоминает закреплённый пост канала как шаблон для предфильтра: его повторы не идут в инференс.
+    Текст берётся из кэша каналов; запрос к Telegram — не чаще раза в PINNED_CACHE_TTL_HOURS.
+    """
+    text = entity_cache.pinned(channel)
+    if text is None:
+        try:
+            pinned = await client.get_messages(entity, ids=InputMessagePinned())
+        except Exception as e:
+            logger.warning(f"Не удалось получить закреплённый пост {channel}: {e}")
+            return
+        text = pinned.text if pinned and pinned.text else ""
+        entity_cache.put_pinned(channel, text)
+    if text:
+        prefilter.remember_template(channel, text)
+
+async def fetch_news_from_channels(period_days, record_path: str = None) -> list:
+    """
+    :param period_days: За сколько дней загружать посты
+    :param record_path: Записать прочитанные сообщения в архив (по умолчанию — в FETCH_RECORD_DIR, если задан)
+    """
     news_list = []
     sources_info = {}
 
     now = datetime.now(timezone.utc)
     since_date = now - timedelta(days=period_days)
 
+    if record_path is None and FETCH_RECORD_DIR and not FETCH_REPLAY_PATH:
+        record_path = archive_path(FETCH_RECORD_DIR, period_days)
+    recorder = FetchRecorder(record_path, period_days, CHANNELS) if record_path else None
+
     try:
-        async with TelegramClient(SESSION_NAME, API_ID, API_HASH) as client:
+        async with open_client() as client:
             logger.info("Подключение к Telegram выполнено успешно")
 
             for channel in CHANNELS:
                 loaded_count = 0
                 expected_count = 0
-
-                try:
-                    # Без offset_date — перебираем с самого свежего сообщения
-                    async for msg in client.iter_messages(channel):
-                        msg_date = msg.date
-                        if msg_date.tzinfo is None:
-                            msg_date = msg_date.replace(tzinfo=timezone.utc)
-                        else:
-                            msg_date = msg_date.astimezone(timezone.utc)
-
-                        if msg_date < since_date:
-                            break  # прекращаем, если сообщение старее нужного периода
-
-                        expected_count += 1
-
-                        if not msg.text:
-                            continue
-
-                        news_list.append({
-                            "text": msg.text,
-                            "created_at": msg_date.astimezone(),  # локальное время
-                            "url": f"https://t.me/{channel}/{msg.id}",
-                            "channel": channel,
-                        })
-                        loaded_count += 1
-
-                except Exception as err:
-                    logger.error(f"Ошибка при чтении канала {channel}: {err}")
-                    loaded_count = 0
-                    expected_count = 0
+                filtered = Counter()
+
+                with span("fetch_channel", channel=channel):
+                    try:
+                        # Канал берётся из кэша по id и access_hash, без повторного разрешения юзернейма.
+                        # Архив адресуется по юзернейму: кэш с настоящими id при воспроизведении не трогаем
+                        entity = channel if FETCH_REPLAY_PATH else await entity_cache.resolve(client, channel)
+                        if not FETCH_REPLAY_PATH:
+                            await remember_pinned(client, entity, channel)
+                        # Без offset_date — перебираем с самого свежего сообщения
+                        async for msg in client.iter_messages(entity):
+                            if recorder:
+                                recorder.record(channel, msg)
+                            msg_date = normalize_date(msg.date)
+
+                            if msg_date < since_date:
+                                break  # прекращаем, если сообщение старее нужного периода
+
+                            expected_count += 1
+
+                            if not msg.text:
+                                continue
+
+                            post = message_to_post(msg, channel)
+                            reason = prefilter.check(post)
+                            if reason:
+                                filtered[reason] += 1
+                                continue
+                            news_list.append(post)
+                            loaded_count += 1
+
+                    except Exception as err:
+                        logger.error(f"Ошибка при чтении канала {channel}: {err}")
+                        # Запись могла устареть (канал закрыт или пересоздан) — разрешим заново
+                        if not FETCH_REPLAY_PATH:
+                            entity_cache.invalidate_on_error(channel, err)
+                        loaded_count = 0
+                        expected_count = 0
+                        filtered = Counter()
 
                 sources_info[channel] = {
                     "loaded": loaded_count,
-                    "expected": expected_count
+                    "expected": expected_count,
+                    "filtered": filtered,
                 }
 
     except Exception as e:
         logger.error(f"Ошибка подключения к Telegram: {e}")
+    finally:
+        if recorder:
+            recorder.close()
 
     logger.info(f"Всего получено постов: {len(news_list)}")
     log_sources_status(sources_info)
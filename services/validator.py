@@ -1,27 +1,55 @@
 """
 Проверка доступности каналов и корректности ссылок.
+
+Каналы разрешаются параллельно, результаты сохраняются в кэш каналов
+(services.entity_cache), которым затем пользуется загрузка постов.
 """
 
+import asyncio
+
 from telethon import TelegramClient
 from config.auth import API_ID, API_HASH, SESSION_NAME
+from config.config import VALIDATE_CONCURRENCY
+from config.logger import logger
+from services.entity_cache import entity_cache
 
-def validate_channels(channel_list: list) -> dict:
+
+async def validate_channels_async(channel_list: list, client: TelegramClient = None,
+                                  concurrency: int = VALIDATE_CONCURRENCY) -> dict:
     """
     Проверяет, доступны ли указанные каналы.
     :param channel_list: список юзернеймов/id каналов
+    :param client: Подключённый клиент (если не передан, создаётся свой)
+    :param concurrency: Сколько каналов разрешать одновременно
     :return: dict {channel: True/False}
     """
-    client = TelegramClient(SESSION_NAME, API_ID, API_HASH)
-    result = {}
-    try:
-        client.start()
-        for channel in channel_list:
+    if client is None:
+        try:
+            async with TelegramClient(SESSION_NAME, API_ID, API_HASH) as own_client:
+                return await validate_channels_async(channel_list, own_client, concurrency)
+        except Exception as e:
+            logger.error(f"Ошибка подключения к Telegram при проверке каналов: {e}")
+            return {ch: False for ch in channel_list}
+
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+
+    async def check(channel) -> bool:
+        async with semaphore:
             try:
-                entity = client.get_entity(channel)
-                result[channel] = True
-            except Exception:
-                result[channel] = False
-        client.disconnect()
-    except Exception:
-        result = {ch: False for ch in channel_list}
-    return result
\ No newline at end of file
+                await entity_cache.verify(client, channel, save=False)
+                return True
+            except Exception as e:
+                logger.warning(f"Канал {channel} недоступен: {e}")
+                entity_cache.invalidate_on_error(channel, e)
+                return False
+
+    checks = await asyncio.gather(*(check(channel) for channel in channel_list))
+    entity_cache.save()
+    return dict(zip(channel_list, checks))
+
+
+def validate_channels(channel_list: list) -> dict:
+    """
+    Синхронная обёртка над validate_channels_async.
+    """
+    return asyncio.run(validate_channels_async(channel_list))
@@ -0,0 +1,230 @@
+"""
+HTTP API для мини-приложения postaibot-webapp.
+
+Отдаёт уже классифицированные посты и агрегаты из хранилища (services.post_store),
+без загрузки каналов, инференса и рендеринга PDF:
+
+    GET /api/categories?period=week                 категории с числом постов и тональностью
+    GET /api/posts?period=week&category=tech&limit=20&cursor=...
+    GET /api/rankings?period=month&category=tech    самые активные каналы
+    GET /api/rollups?period=quarter&bucket=day&group_by=category,sentiment&category=tech
+
+Период — day, week, month или quarter; начало периода округляется до часа, поэтому
+в пределах часа ответы на одинаковые запросы совпадают. Посты листаются курсором
+(непрозрачная строка next_cursor из предыдущего ответа). Ответы снабжаются ETag и
+Last-Modified по времени последней записи в хранилище (повторный запрос без изменений
+получает 304) и сжимаются gzip, если клиент это поддерживает.
+
+    python -m services.web_api
+"""
+
+import asyncio
+import base64
+import hashlib
+import json
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+from aiohttp import web
+
+from config.config import (WEB_API_CORS_ORIGIN, WEB_API_HOST, WEB_API_MAX_PAGE_SIZE, WEB_API_PAGE_SIZE,
+                           WEB_API_PORT)
+from config.logger import logger
+from services.post_store import ROLLUP_BUCKETS, ROLLUP_GROUP_COLUMNS, post_store
+from shared.constants import CATEGORY_LABELS, STATS_PERIOD_DAYS
+
+# Меньшие ответы не сжимаем: выигрыш меньше накладных расходов
+GZIP_MIN_BYTES = 1024
+
+
+def period_since(period: str) -> datetime:
+    if period not in STATS_PERIOD_DAYS:
+        raise web.HTTPBadRequest(reason=f"Unknown period: {period}")
+    since = datetime.now(timezone.utc) - timedelta(days=STATS_PERIOD_DAYS[period])
+    return since.replace(minute=0, second=0, microsecond=0)
+
+
+def encode_cursor(post: dict) -> str:
+    raw = json.dumps([post["created_at"], post["url"]], ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, url = json.loads(raw)
+        return str(created_at), str(url)
+    except Exception:
+        raise web.HTTPBadRequest(reason="Invalid cursor")
+
+
+def int_param(request: web.Request, name: str, default: int) -> int:
+    try:
+        value = int(request.query.get(name, default))
+    except ValueError:
+        raise web.HTTPBadRequest(reason=f"Invalid {name}")
+    if value < 1:
+        raise web.HTTPBadRequest(reason=f"Invalid {name}")
+    return min(value, WEB_API_MAX_PAGE_SIZE)
+
+
+def list_param(request: web.Request, name: str) -> list:
+    value = request.query.get(name, "")
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+async def json_response(request: web.Request, payload: dict, last_modified: str) -> web.Response:
+    """
+    JSON-ответ с валидаторами кэша. Версия данных — время последней записи в хранилище,
+    поэтому совпадение ETag означает, что ответ не изменился.
+    Окно периода сдвигается каждый час и без новых записей, поэтому Last-Modified —
+    более позднее из времени последней записи и начала периода.
+    """
+    version = f"{last_modified}|{request.path_qs}|{payload.get('since')}"
+    etag = 'W/"' + hashlib.sha1(version.encode("utf-8")).hexdigest()[:20] + '"'
+    moments = [datetime.fromisoformat(value) for value in (last_modified, payload.get("since")) if value]
+    modified = max(moments) if moments else None
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if modified is not None:
+        headers["Last-Modified"] = format_datetime(modified.astimezone(timezone.utc), usegmt=True)
+
+    if request.headers.get("If-None-Match") == etag:
+        return web.Response(status=304, headers=headers)
+    if "If-None-Match" not in request.headers and modified is not None and "If-Modified-Since" in request.headers:
+        try:
+            if modified.replace(microsecond=0) <= parsedate_to_datetime(request.headers["If-Modified-Since"]):
+                return web.Response(status=304, headers=headers)
+        except (TypeError, ValueError):
+            pass
+
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    response = web.Response(body=body, content_type="application/json", charset="utf-8", headers=headers)
+    if len(body) >= GZIP_MIN_BYTES:
+        # aiohttp сожмёт ответ, только если клиент прислал Accept-Encoding: gzip
+        response.enable_compression(web.ContentCoding.gzip)
+    return response
+
+
+async def handle_categories(request: web.Request) -> web.Response:
+    period = request.query.get("period", "week")
+    since = period_since(period)
+    rows, last_modified = await asyncio.gather(
+        asyncio.to_thread(post_store.rollup, since, group_by=("category", "sentiment")),
+        asyncio.to_thread(post_store.last_modified),
+    )
+    categories = {}
+    for row in rows:
+        item = categories.setdefault(row["category"], {
+            "key": row["category"], "label": CATEGORY_LABELS.get(row["category"], row["category"]),
+            "posts": 0, "sentiment": {},
+        })
+        item["posts"] += row["posts"]
+        item["sentiment"][row["sentiment"]] = row["posts"]
+    items = sorted(categories.values(), key=lambda item: item["posts"], reverse=True)
+    return await json_response(request, {"period": period, "since": since.isoformat(), "items": items},
+                               last_modified)
+
+
+async def handle_posts(request: web.Request) -> web.Response:
+    period = request.query.get("period", "week")
+    since = period_since(period)
+    limit = int_param(request, "limit", WEB_API_PAGE_SIZE)
+    after = decode_cursor(request.query["cursor"]) if request.query.get("cursor") else None
+
+    # Запрашиваем на один пост больше, чтобы знать, есть ли следующая страница
+    posts, last_modified = await asyncio.gather(
+        asyncio.to_thread(post_store.page, since, category=request.query.get("category"),
+                          channel=request.query.get("channel"), after=after, limit=limit + 1),
+        asyncio.to_thread(post_store.last_modified),
+    )
+    next_cursor = encode_cursor(posts[limit - 1]) if len(posts) > limit else None
+    return await json_response(request, {
+        "period": period, "since": since.isoformat(), "items": posts[:limit], "next_cursor": next_cursor,
+    }, last_modified)
+
+
+async def handle_rankings(request: web.Request) -> web.Response:
+    period = request.query.get("period", "week")
+    since = period_since(period)
+    category = request.query.get("category")
+    limit = int_param(request, "limit", 10)
+    rows, last_modified = await asyncio.gather(
+        asyncio.to_thread(post_store.rollup, since, group_by=("channel",),
+                          categories=[category] if category else None),
+        asyncio.to_thread(post_store.last_modified),
+    )
+    items = sorted(rows, key=lambda row: row["posts"], reverse=True)[:limit]
+    return await json_response(request, {"period": period, "since": since.isoformat(), "category": category,
+                                         "items": items}, last_modified)
+
+
+async def handle_rollups(request: web.Request) -> web.Response:
+    period = request.query.get("period", "month")
+    since = period_since(period)
+    bucket = request.query.get("bucket") or None
+    group_by = list_param(request, "group_by") or ["category"]
+    if bucket is not None and bucket not in ROLLUP_BUCKETS:
+        raise web.HTTPBadRequest(reason=f"Unknown bucket: {bucket}")
+    if set(group_by) - set(ROLLUP_GROUP_COLUMNS):
+        raise web.HTTPBadRequest(reason=f"group_by must be a subset of {', '.join(ROLLUP_GROUP_COLUMNS)}")
+    rows, last_modified = await asyncio.gather(
+        asyncio.to_thread(
+            post_store.rollup, since, group_by=tuple(group_by), bucket=bucket,
+            channels=list_param(request, "channel") or None,
+            categories=list_param(request, "category") or None,
+            sentiments=list_param(request, "sentiment") or None,
+        ),
+        asyncio.to_thread(post_store.last_modified),
+    )
+    return await json_response(request, {"period": period, "since": since.isoformat(), "bucket": bucket,
+                                         "group_by": group_by, "items": rows}, last_modified)
+
+
+def add_cors_headers(headers):
+    headers["Access-Control-Allow-Origin"] = WEB_API_CORS_ORIGIN
+    headers["Access-Control-Allow-Headers"] = "If-None-Match, If-Modified-Since"
+    headers["Access-Control-Expose-Headers"] = "ETag, Last-Modified"
+
+
+@web.middleware
+async def cors_middleware(request: web.Request, handler):
+    if request.method == "OPTIONS":
+        response = web.Response()
+    else:
+        try:
+            response = await handler(request)
+        except web.HTTPException as e:
+            add_cors_headers(e.headers)
+            if e.status >= 400:
+                logger.warning(f"Web API {request.path_qs}: {e.status} {e.reason}")
+            raise
+    add_cors_headers(response.headers)
+    return response
+
+
+def create_app() -> web.Application:
+    app = web.Application(middlewares=[cors_middleware])
+    app.router.add_get("/api/categories", handle_categories)
+    app.router.add_get("/api/posts", handle_posts)
+    app.router.add_get("/api/rankings", handle_rankings)
+    app.router.add_get("/api/rollups", handle_rollups)
+    return app
+
+
+async def run_web_api(host: str = WEB_API_HOST, port: int = WEB_API_PORT):
+    """
+    Запускает API в текущем event loop (например, рядом с ботом) и работает до отмены задачи.
+    """
+    runner = web.AppRunner(create_app())
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    logger.info(f"Web API запущен: http://{host}:{port}/api/")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    web.run_app(create_app(), host=WEB_API_HOST, port=WEB_API_PORT)
@@ -0,0 +1,328 @@
+"""
+Очередь постов на классификацию без внешнего брокера.
+
+Загрузчик ставит посты в очередь, а воркеры (python -m services.classify_worker)
+на одной или нескольких машинах с общей файловой системой берут пачки в аренду,
+классифицируют их и записывают результаты обратно в очередь. Хранилище постов
+(posts.db, режим WAL) воркеры не открывают: результаты переносит в него процесс
+загрузчика на своём хосте (StreamIngestor.apply_results). Перенос идемпотентен
+(upsert по url), поэтому пачку с истёкшей арендой можно безопасно выдать повторно,
+а результат — применить ещё раз после сбоя.
+
+Статусы задачи: pending → leased → done (результат ждёт переноса) → applied;
+после WORK_QUEUE_MAX_ATTEMPTS неудачных попыток — failed.
+"""
+
+import abc
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from config.config import WORK_QUEUE_PATH, WORK_QUEUE_LEASE_SECONDS, WORK_QUEUE_MAX_ATTEMPTS
+from config.logger import logger
+from shared.utils import to_utc_iso
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    url TEXT NOT NULL UNIQUE,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_expires REAL,
+    error TEXT,
+    result TEXT,
+    enqueued_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, id);
+"""
+
+# Поля поста с датами: в очереди хранятся строкой ISO
+DATE_FIELDS = ("created_at", "edited_at")
+# Колонки, добавленные после первой версии схемы: (имя, тип)
+MIGRATIONS = [
+    ("result", "TEXT"),
+]
+
+
+class WorkQueue(abc.ABC):
+    """
+    Интерфейс очереди. Задача — один пост, ключ задачи — url поста.
+    """
+
+    @abc.abstractmethod
+    def enqueue(self, posts: list) -> int:
+        """
+        :return: Количество поставленных задач
+        """
+
+    @abc.abstractmethod
+    def lease(self, owner: str, limit: int, lease_seconds: float = WORK_QUEUE_LEASE_SECONDS) -> list:
+        """
+        Берёт в аренду до limit задач: ожидающие и с истёкшей арендой.
+        :return: Список (job_id, post)
+        """
+
+    @abc.abstractmethod
+    def complete(self, owner: str, job_ids: list, results: list = None) -> int:
+        """
+        :param results: Проанализированные посты (сопоставляются задачам по url)
+        :return: Количество задач, отмеченных выполненными
+        """
+
+    @abc.abstractmethod
+    def fail(self, owner: str, job_ids: list, error: str):
+        """
+        Возвращает задачи в ожидание.
+        """
+
+    @abc.abstractmethod
+    def take_results(self, limit: int) -> list:
+        """
+        Выполненные задачи, результаты которых ещё не перенесены в хранилище постов.
+        :return: Список (job_id, post); post — None, если анализ не вернул результата
+        """
+
+    @abc.abstractmethod
+    def mark_applied(self, job_ids: list) -> int:
+        """
+        :return: Количество задач, отмеченных перенесёнными
+        """
+
+    @abc.abstractmethod
+    def stats(self) -> dict:
+        """
+        :return: {статус: количество задач}
+        """
+
+
+class SQLiteWorkQueue(WorkQueue):
+    """
+    Очередь в файле SQLite. Журнал в режиме DELETE, а не WAL: WAL требует общей
+    памяти и не работает между машинами, которые видят файл по сети. Поэтому
+    результаты воркеров тоже пишутся сюда, а не в хранилище постов.
+    """
+
+    def __init__(self, path: str = WORK_QUEUE_PATH, max_attempts: int = WORK_QUEUE_MAX_ATTEMPTS):
+        self.path = path
+        self.max_attempts = max_attempts
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        self._lock = threading.Lock()
+        # isolation_level=None: транзакции открываются явно через BEGIN IMMEDIATE
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=DELETE")
+        with self._lock:
+            self._conn.executescript(SCHEMA)
+            existing = {row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+            for column, column_type in MIGRATIONS:
+                if column not in existing:
+                    self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {column_type}")
+                    logger.info(f"Очередь задач: добавлена колонка {column}")
+
+    def _transaction(self, fn):
+        """
+        Выполняет fn(conn) в транзакции с блокировкой на запись.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self._conn)
+                self._conn.execute("COMMIT")
+                return result
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def enqueue(self, posts: list) -> int:
+        now = time.time()
+        rows = [(post["url"], encode_post(post), now, now) for post in posts if post.get("url")]
+
+        def insert(conn):
+            # Повторная постановка (например, отредактированный пост) сбрасывает задачу в ожидание
+            conn.executemany(
+                """
+                INSERT INTO jobs (url, payload, enqueued_at, updated_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT(url) DO UPDATE SET
+                    payload = excluded.payload,
+                    status = 'pending',
+                    attempts = 0,
+                    lease_owner = NULL,
+                    lease_expires = NULL,
+                    error = NULL,
+                    result = NULL,
+                    updated_at = excluded.updated_at
+                """,
+                rows,
+            )
+            return len(rows)
+
+        return self._transaction(insert)
+
+    def lease(self, owner: str, limit: int, lease_seconds: float = WORK_QUEUE_LEASE_SECONDS) -> list:
+        now = time.time()
+
+        def take(conn):
+            rows = conn.execute(
+                """
+                SELECT id, payload, attempts FROM jobs
+                WHERE status = 'pending' OR (status = 'leased' AND lease_expires < ?)
+                ORDER BY id LIMIT ?
+                """,
+                (now, limit),
+            ).fetchall()
+            leased, exhausted = [], []
+            for row in rows:
+                if row["attempts"] >= self.max_attempts:
+                    exhausted.append(row["id"])
+                else:
+                    leased.append(row)
+            if exhausted:
+                conn.execute(
+                    f"UPDATE jobs SET status = 'failed', error = 'превышено число попыток', updated_at = ? "
+                    f"WHERE id IN ({','.join('?' * len(exhausted))})",
+                    [now, *exhausted],
+                )
+                logger.warning(f"Очередь: {len(exhausted)} задач исчерпали попытки и помечены как failed")
+            if leased:
+                ids = [row["id"] for row in leased]
+                conn.execute(
+                    f"UPDATE jobs SET status = 'leased', lease_owner = ?, lease_expires = ?, "
+                    f"attempts = attempts + 1, updated_at = ? WHERE id IN ({','.join('?' * len(ids))})",
+                    [owner, now + lease_seconds, now, *ids],
+                )
+            return [(row["id"], decode_post(row["payload"])) for row in leased]
+
+        return self._transaction(take)
+
+    def complete(self, owner: str, job_ids: list, results: list = None) -> int:
+        """
+        Отмечает задачи выполненными и сохраняет их результаты для переноса в хранилище.
+        Задачи, аренду которых уже перехватил другой воркер, не трогаются: их результат запишет он.
+        """
+        if not job_ids:
+            return 0
+        by_url = {post["url"]: encode_result(post) for post in results or [] if post.get("url")}
+        now = time.time()
+
+        def mark(conn):
+            rows = conn.execute(
+                f"SELECT id, url FROM jobs WHERE lease_owner = ? AND status = 'leased' "
+                f"AND id IN ({','.join('?' * len(job_ids))})",
+                [owner, *job_ids],
+            ).fetchall()
+            conn.executemany(
+                "UPDATE jobs SET status = 'done', result = ?, lease_owner = NULL, lease_expires = NULL, "
+                "updated_at = ? WHERE id = ?",
+                [(by_url.get(row["url"]), now, row["id"]) for row in rows],
+            )
+            return len(rows)
+
+        return self._transaction(mark)
+
+    def take_results(self, limit: int) -> list:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, result FROM jobs WHERE status = 'done' ORDER BY id LIMIT ?", (limit,)
+            ).fetchall()
+        return [(row["id"], decode_post(row["result"]) if row["result"] else None) for row in rows]
+
+    def mark_applied(self, job_ids: list) -> int:
+        """
+        Отмечает результаты перенесёнными. Задачи, поставленные заново (отредактированный пост)
+        после take_results, остаются в ожидании: их новый результат ещё впереди.
+        """
+        if not job_ids:
+            return 0
+
+        def mark(conn):
+            return conn.execute(
+                f"UPDATE jobs SET status = 'applied', result = NULL, updated_at = ? "
+                f"WHERE status = 'done' AND id IN ({','.join('?' * len(job_ids))})",
+                [time.time(), *job_ids],
+            ).rowcount
+
+        return self._transaction(mark)
+
+    def fail(self, owner: str, job_ids: list, error: str):
+        """
+        Возвращает задачи в ожидание; после max_attempts попыток они помечаются failed при следующей аренде.
+        """
+        if not job_ids:
+            return
+
+        def release(conn):
+            conn.execute(
+                f"UPDATE jobs SET status = 'pending', lease_owner = NULL, lease_expires = NULL, error = ?, "
+                f"updated_at = ? WHERE lease_owner = ? AND id IN ({','.join('?' * len(job_ids))})",
+                [error[:1000], time.time(), owner, *job_ids],
+            )
+
+        self._transaction(release)
+
+    def purge_done(self, older_than_seconds: float = 24 * 3600) -> int:
+        """
+        Удаляет перенесённые в хранилище задачи старше заданного возраста.
+        """
+        def purge(conn):
+            return conn.execute(
+                "DELETE FROM jobs WHERE status = 'applied' AND updated_at < ?",
+                (time.time() - older_than_seconds,),
+            ).rowcount
+
+        return self._transaction(purge)
+
+    def stats(self) -> dict:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def encode_post(post: dict) -> str:
+    data = {k: v for k, v in post.items() if k not in ("input_ids", "clean_text", "tokenizer_id")}
+    for field in DATE_FIELDS:
+        if data.get(field):
+            data[field] = to_utc_iso(data[field])
+    return json.dumps(data, ensure_ascii=False)
+
+
+def encode_result(post: dict) -> str:
+    """
+    Результат анализа для переноса в хранилище: с input_ids, чтобы хранилище
+    сохранило токенизацию поста, но без clean_text.
+    """
+    data = {k: v for k, v in post.items() if k != "clean_text"}
+    for field in DATE_FIELDS:
+        if data.get(field):
+            data[field] = to_utc_iso(data[field])
+    return json.dumps(data, ensure_ascii=False)
+
+
+def decode_post(payload: str) -> dict:
+    post = json.loads(payload)
+    for field in DATE_FIELDS:
+        if post.get(field):
+            post[field] = datetime.fromisoformat(post[field]).astimezone()
+    return post
+
+
+def worker_id() -> str:
+    """
+    Уникальный идентификатор воркера: хост, pid и случайный суффикс.
+    """
+    return f"{os.uname().nodename if hasattr(os, 'uname') else 'host'}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+work_queue = SQLiteWorkQueue()
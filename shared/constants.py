@@ -24,6 +24,12 @@ CATEGORIES = [
 # Список периодов, которые поддерживает бот (ключи)
 PERIODS = ['day', 'week', 'month']
 
+# Длительность периодов в днях
+PERIOD_DAYS = {'day': 1, 'week': 7, 'month': 30}
+
+# Периоды сводок и выгрузок по агрегатам хранилища: доступен и квартал
+STATS_PERIOD_DAYS = {**PERIOD_DAYS, 'quarter': 90}
+
 # Соответствие ключей и русских подписей периодов
 PERIOD_LABELS = {
     'day':   'День',
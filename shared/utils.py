@@ -2,7 +2,7 @@
 Универсальные хелперы: парсинг дат, генерация ссылок, форматирование текста и др.
 """
 
-from datetime import datetime
+from datetime import datetime, timezone
 
 def parse_date(date_str: str, fmt: str = "%Y-%m-%d %H:%M:%S") -> datetime:
     """
@@ -10,6 +10,16 @@ def parse_date(date_str: str, fmt: str = "%Y-%m-%d %H:%M:%S") -> datetime:
     """
     return datetime.strptime(date_str, fmt)
 
+def to_utc_iso(dt) -> str:
+    """
+    Дата в UTC в формате ISO (строки возвращаются как есть; дата без пояса считается UTC).
+    """
+    if isinstance(dt, str):
+        return dt
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc).isoformat()
+
 def format_datetime(dt: datetime) -> str:
     """
     Форматирует datetime в строку по-русски.
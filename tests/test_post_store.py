@@ -0,0 +1,92 @@
+"""
+Агрегаты хранилища постов должны совпадать с пересчётом по самим постам
+после вставки, переклассификации и снятия классификации.
+
+    python -m pytest tests
+"""
+
+import os
+import tempfile
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+os.environ.setdefault("BOT_TOKEN", "42:TEST")
+os.environ.setdefault("POST_STORE_PATH", os.path.join(tempfile.mkdtemp(prefix="post_store_"), "posts.db"))
+
+from services.post_store import PostStore  # noqa: E402
+
+NOW = datetime(2026, 1, 1, 12, tzinfo=timezone.utc)
+
+
+def make_post(n: int, categories: list, sentiment: str = "POSITIVE", score: float = 0.5) -> dict:
+    return {
+        "url": f"https://t.me/test_channel/{n}",
+        "channel": "test_channel" if n % 2 else "other_channel",
+        "message_id": n,
+        "text": f"Пост {n}",
+        "created_at": NOW - timedelta(hours=n),
+        "categories": categories,
+        "sentiment": sentiment,
+        "sentiment_score": score,
+    }
+
+
+def recount(store: PostStore, since: datetime) -> dict:
+    """
+    Пересчёт агрегатов по постам: {(channel, category, sentiment): (posts, score_sum)}.
+    """
+    totals = defaultdict(lambda: [0, 0.0])
+    for post in store.query(since):
+        if not post["sentiment"]:
+            continue
+        for category in post["categories"]:
+            total = totals[(post["channel"], category, post["sentiment"].upper())]
+            total[0] += 1
+            total[1] += post["sentiment_score"] or 0.0
+    return {key: (posts, round(score_sum, 6)) for key, (posts, score_sum) in totals.items()}
+
+
+def rollup_totals(store: PostStore, since: datetime) -> dict:
+    rows = store.rollup(since, group_by=("channel", "category", "sentiment"))
+    return {
+        (row["channel"], row["category"], row["sentiment"]): (row["posts"], round(row["score_sum"], 6))
+        for row in rows
+    }
+
+
+def test_rollup_matches_recount(tmp_path):
+    store = PostStore(str(tmp_path / "posts.db"))
+    since = NOW - timedelta(days=7)
+    try:
+        store.upsert_posts([make_post(n, ["tech"] if n % 3 else ["tech", "economics"]) for n in range(1, 13)])
+        assert rollup_totals(store, since) == recount(store, since)
+
+        # Переклассификация: другая категория и тональность, повтор url в той же пачке
+        store.upsert_posts([
+            make_post(2, ["politics"], "NEGATIVE", 0.9),
+            make_post(4, ["sports"], "NEUTRAL", 0.3),
+            make_post(4, ["culture"], "NEUTRAL", 0.4),
+        ])
+        assert rollup_totals(store, since) == recount(store, since)
+
+        # Пост без категорий не входит в агрегаты: его прежний вклад вычитается
+        store.upsert_posts([make_post(6, []), make_post(8, ["tech"], sentiment=None)])
+        totals = rollup_totals(store, since)
+        assert totals == recount(store, since)
+        assert sum(posts for posts, _ in totals.values()) == sum(
+            len(post["categories"]) for post in store.query(since) if post["sentiment"]
+        )
+    finally:
+        store.close()
+
+
+def test_week_bucket_is_monday(tmp_path):
+    store = PostStore(str(tmp_path / "posts.db"))
+    try:
+        # 28.12.2025 — воскресенье; 30.12.2025 и 01.01.2026 — одна неделя с понедельника 29.12
+        posts = [make_post(1, ["tech"]), make_post(40, ["tech"]), make_post(90, ["tech"])]
+        store.upsert_posts(posts)
+        rows = store.rollup(NOW - timedelta(days=7), group_by=(), bucket="week")
+        assert {row["bucket"]: row["posts"] for row in rows} == {"2025-12-22": 1, "2025-12-29": 2}
+    finally:
+        store.close()